@@ -35,6 +35,100 @@ class Settings(BaseSettings):
     MODEL_IMG_SIZE: int = 224
 
     MODEL_CLASSES: list = ["0", "1", "2", "3"]
+    MODEL_SHARED_WEIGHTS: bool = False  # mmap weights, các worker dùng chung page (chỉ fp32 eager trên CPU)
+    MODEL_BACKEND: str = "eager"  # eager | torchscript | onnxruntime
+    MODEL_ARTIFACT_DIR: str = "data/model_artifacts"  # Nơi cache model đã export
+    MODEL_BACKEND_TOLERANCE: float = 1e-4  # Sai lệch probability tối đa so với eager
+    MODEL_PRECISION: str = "fp32"  # fp32 | int8_dynamic | int8_static | bf16 (CPU)
+    MODEL_CHANNELS_LAST: bool = False
+    MODEL_CALIBRATION_DIR: str = ""  # Ảnh mẫu để calibrate int8_static và đo drift
+    MODEL_DRIFT_BUDGET: float = 0.05  # Drift probability tối đa so với fp32, vượt → giữ fp32
+    MODEL_MAX_FLIP_RATE: float = 0.0  # Tỉ lệ ảnh tối đa được đổi `active` classes so với fp32
+    MODEL_MAX_RESIDENT: int = 2  # Số model version giữ trong RAM (active + candidate / rollback)
+    
+    # Admin API (model registry), rỗng = tắt
+    ADMIN_API_KEY: str = ""
+    
+    # Inference micro-batching
+    INFERENCE_MAX_BATCH_SIZE: int = 32  # Số ảnh tối đa trong 1 lần forward
+    INFERENCE_MAX_WAIT_MS: float = 5.0  # Thời gian chờ tối đa để gom batch (0 = không chờ)
+    INFERENCE_WARMUP_BATCH_SIZES: list = [1, 8, 32]  # Batch size chạy warm-up trước khi /ready
+    INFERENCE_WORKERS: int = 2  # Số thread inference chạy song song (decode + forward)
+    INFERENCE_MAX_QUEUE: int = 64  # Số tác vụ được chờ trong hàng đợi, vượt quá trả 503
+    TORCH_NUM_THREADS: int = 0  # Intra-op threads mỗi worker (0 = torch tự chọn), run.py tự plan
+    TORCH_INTEROP_THREADS: int = 0
+    INFERENCE_CPU_AFFINITY: str = ""  # CPU cho từng worker, vd "0-3;4-7" (run.py --cpu-affinity)
+    API_WORKERS: int = 1  # Số uvicorn worker process (run.py tự đặt; > 1 thì tắt API đổi model)
+    TILED_MAX_SIDE: int = 896  # Tiled mode: thu nhỏ cạnh dài về <= N px trước khi cắt tile
+    # Chỉ JPEG được decode ở kích thước nhỏ; PNG / WebP / ... decode đầy đủ trước khi thu nhỏ
+    # → số pixel tối đa của ảnh không phải JPEG ở tiled mode (16 MP ≈ 48 MB RGB)
+    TILED_MAX_DECODE_PIXELS: int = 16_000_000
+    TILE_OVERLAP: float = 0.25  # Tỉ lệ chồng lấn giữa 2 tile liền kề
+    TILED_MAX_TILES: int = 32  # Số tile tối đa mỗi ảnh (chặn bộ nhớ / thời gian forward)
+    CASCADE_ENABLED: bool = False  # Pass rẻ ở độ phân giải thấp trước, chỉ ảnh chưa chắc chắn chạy model đầy đủ
+    CASCADE_IMG_SIZE: int = 128  # Kích thước input của pass rẻ (< MODEL_IMG_SIZE)
+    CASCADE_MARGIN: float = 0.3  # Mọi class cách threshold >= margin → tin pass rẻ, ngược lại escalate
+    BATCH_MAX_IMAGES: int = 100  # Số ảnh tối đa cho /predict/batch (kể cả ảnh trong zip/tar)
+    
+    # Upload
+    UPLOAD_MAX_MB: int = 10  # Kích thước tối đa request /predict, vượt quá trả 413
+    BATCH_UPLOAD_MAX_MB: int = 200  # Kích thước tối đa request /predict/batch
+    MAX_IMAGE_PIXELS: int = 40_000_000  # width * height tối đa (chặn decompression bomb)
+    
+    # WebSocket frame streaming (/api/v1/stream)
+    STREAM_MAX_FPS: float = 30.0  # Số frame tối đa xử lý mỗi giây cho 1 stream
+    STREAM_USAGE_FLUSH_FRAMES: int = 50  # Reserve quota cho stream theo block N frame (1 UPDATE / block)
+    STREAM_USAGE_FLUSH_SECONDS: float = 5.0  # Trả lại phần chưa dùng của block giữ quá N giây
+    
+    # Prediction jobs (/api/v1/jobs): archive lớn xử lý nền, client poll kết quả / nhận callback
+    JOB_WORKER_ENABLED: bool = True  # Chạy worker trong process API (false khi dùng `run.py --job-worker` riêng)
+    JOB_STORAGE_DIR: str = "data/jobs"  # Ảnh đầu vào của job (xoá khi job kết thúc)
+    JOB_MAX_IMAGES: int = 10000  # Số ảnh tối đa mỗi job
+    JOB_UPLOAD_MAX_MB: int = 2048  # Kích thước tối đa request tạo job
+    JOB_BATCH_SIZE: int = 32  # Số ảnh mỗi chunk (lưu kết quả + tiến độ sau mỗi chunk)
+    JOB_POLL_SECONDS: float = 1.0  # Chu kỳ worker tìm job mới khi rảnh
+    JOB_LEASE_SECONDS: float = 60.0  # Worker chết quá N giây → worker khác nhận lại job
+    JOB_CALLBACK_SECRET: str = ""  # Ký HMAC-SHA256 body callback (header X-Job-Signature), rỗng = không ký
+    JOB_CALLBACK_TIMEOUT: float = 10.0
+    JOB_CALLBACK_RETRIES: int = 3
+    JOB_CALLBACK_ALLOWED_HOSTS: str = ""  # Host (phân cách bằng dấu phẩy) được nhận callback dù là địa chỉ nội bộ
+    
+    # Metrics (Server-Timing header + histogram ở /metrics), tắt = no-op
+    METRICS_ENABLED: bool = True
+    
+    # Prediction cache (key = hash ảnh + model version)
+    PREDICTION_CACHE_ENABLED: bool = True
+    PREDICTION_CACHE_MAX_ENTRIES: int = 10000
+    PREDICTION_CACHE_MAX_MB: int = 64
+    PREDICTION_CACHE_TTL_SECONDS: int = 300
+    
+    # Quota ledger: đếm quota trong RAM, ghi dồn vào DB (1 bulk UPDATE mỗi chu kỳ) thay vì 1 commit / request
+    QUOTA_LEDGER_ENABLED: bool = False  # Crash mất tối đa 1 chu kỳ chưa flush; nhiều worker có thể vượt quota trong 1 chu kỳ
+    QUOTA_LEDGER_FLUSH_MS: int = 500  # Ghi DB sau mỗi N ms...
+    QUOTA_LEDGER_FLUSH_EVENTS: int = 200  # ... hoặc khi đủ N thay đổi
+    QUOTA_LEDGER_TTL_SECONDS: float = 30.0  # Đọc lại giới hạn / used_quota từ DB sau N giây (không quá expires_at)
+    
+    # Usage log: ghi usage_logs nền theo lô (request không chờ DB)
+    USAGE_LOG_ASYNC_ENABLED: bool = True  # false = ghi đồng bộ từng row như cũ
+    USAGE_LOG_BATCH_SIZE: int = 500  # Số row mỗi lần bulk insert
+    USAGE_LOG_FLUSH_MS: int = 1000  # Ghi hàng đợi sau mỗi N ms (hoặc khi đủ 1 lô)
+    USAGE_LOG_MAX_QUEUE: int = 10000  # Số row tối đa chờ ghi, crash mất tối đa phần này
+    USAGE_LOG_OVERFLOW: str = "drop_oldest"  # Hàng đợi đầy: drop_oldest | drop_newest
+    
+    # Rate limit theo user (token bucket, /api/v1/predict* và /api/v1/jobs), vượt quá trả 429
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "sqlite"  # sqlite: dùng chung giữa các uvicorn worker | memory: riêng từng process
+    RATE_LIMIT_DB_PATH: str = "data/rate_limit.db"  # File bucket khi backend = sqlite
+    RATE_LIMIT_FREE_PER_SECOND: float = 2.0  # Tốc độ nạp token (request / giây)
+    RATE_LIMIT_FREE_BURST: int = 10  # Số request tối đa gửi dồn
+    RATE_LIMIT_PLUS_PER_SECOND: float = 10.0
+    RATE_LIMIT_PLUS_BURST: int = 30
+    RATE_LIMIT_PRO_PER_SECOND: float = 50.0
+    RATE_LIMIT_PRO_BURST: int = 100
+    
+    # Cache subscription hiện tại của user (xoá khi mua / huỷ gói, hết hạn, thanh toán)
+    SUBSCRIPTION_CACHE_TTL_SECONDS: float = 60.0  # Không quá expires_at; worker khác đổi gói → tối đa N giây
+    SUBSCRIPTION_CACHE_MAX_ENTRIES: int = 100000
     
     # Subscription Plans
     PLAN_FREE_MONTHLY_QUOTA: int = 100
@@ -2,8 +2,14 @@ from app.controllers.auth_controller import router as auth_router
 from app.controllers.payment_controller import router as payment_router
 from app.controllers.subscription_controller import router as subscription_router
 from app.controllers.prediction_controller import router as prediction_router
-
-__all__ = ["auth_router", "payment_router", "subscription_router", "prediction_router"]
+from app.controllers.stream_controller import router as stream_router
+from app.controllers.model_controller import router as model_router
+from app.controllers.job_controller import router as job_router
+
+__all__ = [
+    "auth_router", "payment_router", "subscription_router", "prediction_router", "stream_router", "model_router",
+    "job_router"
+]
 
 
 
@@ -0,0 +1,103 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from app.config import get_settings
+from app.database import get_db
+from app.services.inference_runtime import runtime
+from app.services.prediction_job_service import (
+    PredictionJobService, JobQuotaExceeded, stage_inputs, describe_job, validate_callback_url
+)
+from app.schemas.job import JobResponse
+from app.schemas.prediction import BatchPredictionItem
+from app.middleware.auth_middleware import get_current_user_id
+
+settings = get_settings()
+router = APIRouter(prefix="/api/v1/jobs", tags=["Prediction Jobs"])
+
+
+def _job_response(job, service: PredictionJobService = None, offset: int = 0, limit: int = 0) -> JobResponse:
+    response = JobResponse(**describe_job(job))
+    if service and limit:
+        response.classes = runtime.ml_service.class_names if runtime.ml_service else settings.MODEL_CLASSES
+        response.results = [BatchPredictionItem(**item) for item in service.get_results(job, offset, limit)]
+        if offset + limit < job.processed:
+            response.next_offset = offset + limit
+    return response
+
+
+@router.post("", response_model=JobResponse, status_code=202)
+def submit_job(
+    files: List[UploadFile] = File(...),
+    threshold: float = 0.5,
+    callback_url: Optional[str] = None,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Tạo prediction job chạy nền cho nhiều ảnh / archive zip/tar lớn (tối đa JOB_MAX_IMAGES ảnh)
+    - Quota được reserve cho toàn bộ ảnh lúc submit, khi job xong chỉ tính ảnh predict thành công
+    - Poll GET /api/v1/jobs/{id}, hoặc truyền `callback_url` để nhận POST khi job kết thúc
+    """
+    if threshold <= 0.0 or threshold >= 1.0:
+        raise HTTPException(status_code=400, detail="Threshold must be in (0, 1)")
+    if callback_url:
+        try:
+            validate_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    job_service = PredictionJobService(db)
+    job_id = job_service.new_job_id()
+    try:
+        items = stage_inputs(job_id, [(file.filename, file.content_type, file.file) for file in files])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = job_service.submit(job_id, user_id, items, threshold, callback_url)
+    except JobQuotaExceeded as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    return _job_response(job)
+
+
+@router.get("", response_model=List[JobResponse])
+def list_jobs(
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Các job gần nhất của user (không kèm kết quả)"""
+    return [_job_response(job) for job in PredictionJobService(db).list_jobs(user_id, limit)]
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+def get_job(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=0, le=1000),
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Trạng thái / tiến độ job và 1 trang kết quả các ảnh đã xử lý (`next_offset` để lấy trang tiếp)"""
+    job_service = PredictionJobService(db)
+    job = job_service.get_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job, job_service, offset, limit)
+
+
+@router.delete("/{job_id}", response_model=JobResponse)
+def cancel_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Huỷ job (job đang chạy dừng sau chunk hiện tại), quota của ảnh chưa xử lý được trả lại"""
+    job_service = PredictionJobService(db)
+    try:
+        job = job_service.cancel(job_id, user_id)
+    except ValueError as e:
+        status_code = 404 if str(e) == "Job not found" else 409
+        raise HTTPException(status_code=status_code, detail=str(e))
+    return _job_response(job)
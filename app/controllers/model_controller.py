@@ -0,0 +1,84 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.config import get_settings
+from app.services.inference_runtime import runtime, ModelNotReady
+from app.schemas.model import ModelLoadRequest, ModelCandidateRequest
+from app.middleware.admin_middleware import require_admin_key
+
+settings = get_settings()
+router = APIRouter(prefix="/api/v1/models", tags=["Models"], dependencies=[Depends(require_admin_key)])
+
+
+def _registry():
+    try:
+        runtime.require_ready()
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return runtime.registry
+
+
+def _require_single_worker():
+    """
+    Registry nằm trong từng worker process: request đổi model chỉ tới 1 worker, các worker khác
+    vẫn phục vụ version cũ → từ chối khi API_WORKERS > 1 (đổi MODEL_PATH rồi restart thay vào đó)
+    """
+    if settings.API_WORKERS > 1:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Model changes are per-process and {settings.API_WORKERS} workers are running; "
+                   "update MODEL_PATH and restart, or run a single worker"
+        )
+
+
+@router.get("")
+async def list_models():
+    """Các model version đang load, version active / candidate và thống kê shadow"""
+    return _registry().describe()
+
+
+@router.post("/load", status_code=202, dependencies=[Depends(_require_single_worker)])
+async def load_model(request: ModelLoadRequest):
+    """Load + warm-up file weights mới ở background (không chặn traffic), tuỳ chọn activate khi xong"""
+    registry = _registry()
+    try:
+        registry.start_load(request.path, activate=request.activate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "loading", "path": request.path, "activate": request.activate}
+
+
+@router.post("/{version}/activate", dependencies=[Depends(_require_single_worker)])
+async def activate_model(version: str):
+    """Chuyển toàn bộ traffic sang version đã load (version cũ vẫn giữ để rollback)"""
+    try:
+        _registry().activate(version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _registry().describe()
+
+
+@router.post("/{version}/candidate", dependencies=[Depends(_require_single_worker)])
+async def set_candidate(version: str, request: ModelCandidateRequest):
+    """Chạy version song song với active: shadow (chỉ so sánh) hoặc ab (trả kết quả) cho `percent`% request"""
+    try:
+        _registry().set_candidate(version, request.mode, request.percent)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _registry().describe()
+
+
+@router.delete("/candidate", dependencies=[Depends(_require_single_worker)])
+async def clear_candidate():
+    """Dừng shadow / A-B, toàn bộ traffic về version active"""
+    _registry().clear_candidate()
+    return _registry().describe()
+
+
+@router.delete("/{version}", dependencies=[Depends(_require_single_worker)])
+async def unload_model(version: str):
+    """Gỡ version không dùng khỏi RAM (chờ request đang chạy trên version đó xong)"""
+    try:
+        await _registry().unload(version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _registry().describe()
@@ -1,77 +1,384 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Response, Query
 from sqlalchemy.orm import Session
+from typing import List, Optional
 import time
 
 from app.database import get_db
 from app.services.subscription_service import SubscriptionService
-from app.services.ml_inference_service import MLInferenceService
-from app.repositories.usage_log_repository import UsageLogRepository
-from app.schemas.prediction import PredictionResponse
+from app.services.quota_ledger import quota_ledger
+from app.services.usage_log_writer import usage_log_writer
+from app.services.rate_limiter import get_rate_limiter
+from app.services.subscription_cache import subscription_cache
+from app.services.inference_executor import InferenceQueueFull
+from app.services.inference_runtime import runtime, ModelNotReady
+from app.services.request_timing import request_timer
+from app.services.response_encoding import (
+    COMPACT_KEYS, QUANTIZE_SCALE, EncodingNotAvailable, negotiate, check_available, encode_response,
+    shape_probabilities, active_indices
+)
+from app.services.upload_utils import (
+    MERGE_METHODS, SNIFF_BYTES, is_archive, extract_images, check_image_header, probe_image, check_tiled_decode,
+    spooled_buffer, detect_raw_format, parse_raw_frame
+)
+from app.config import get_settings
+from app.schemas.prediction import PredictionResponse, TileResult, BatchPredictionItem, BatchPredictionResponse
 from app.middleware.auth_middleware import get_current_user_id
+from app.middleware.admin_middleware import require_admin_key
 
 router = APIRouter(prefix="/api/v1", tags=["Prediction"])
+settings = get_settings()
 
-# Initialize ML service (singleton)
-ml_service = MLInferenceService()
+
+def _require_model_ready():
+    """Model load ở background trong lifespan - chưa xong thì trả 503 để client retry"""
+    try:
+        runtime.require_ready()
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+class ResponseOptions:
+    """
+    Response encoding options (content negotiation)
+    - `Accept: application/msgpack` → msgpack, otherwise JSON (orjson when installed)
+    - `compact=true` → short keys, no class list (published at GET /api/v1/metadata), active as class indices
+    - `precision=N` → round probabilities to N digits, `quantize=true` → ints 0..255
+    """
+    
+    def __init__(
+        self,
+        request: Request,
+        compact: bool = False,
+        precision: Optional[int] = Query(None, ge=0, le=8),
+        quantize: bool = False
+    ):
+        self.encoding = negotiate(request.headers.get("accept"))
+        try:
+            check_available(self.encoding)
+        except EncodingNotAvailable as e:
+            raise HTTPException(status_code=406, detail=str(e))
+        self.compact = compact
+        self.precision = precision
+        self.quantize = quantize
+    
+    @property
+    def default(self) -> bool:
+        """Plain pydantic JSON response (unchanged API)"""
+        return self.encoding == "json" and not (self.compact or self.quantize or self.precision is not None)
+    
+    def probabilities(self, probabilities: Optional[List[float]]):
+        if probabilities is None:
+            return None
+        return shape_probabilities(probabilities, self.precision, self.quantize)
+
+
+def _encode_prediction(prediction: PredictionResponse, options: ResponseOptions, headers: dict) -> Response:
+    if options.compact:
+        payload = {
+            "p": options.probabilities(prediction.probabilities),
+            "a": active_indices(prediction.classes, prediction.active),
+            "v": prediction.model_version,
+            "q": prediction.quota_remaining,
+        }
+        if prediction.tiles is not None:
+            payload["t"] = [tile.box + [options.probabilities(tile.probabilities)] for tile in prediction.tiles]
+    else:
+        payload = prediction.model_dump()
+        payload["probabilities"] = options.probabilities(prediction.probabilities)
+        for tile in payload["tiles"] or []:
+            tile["probabilities"] = options.probabilities(tile["probabilities"])
+    return encode_response(payload, options.encoding, headers)
+
+
+def _encode_batch(prediction: BatchPredictionResponse, options: ResponseOptions) -> Response:
+    if options.compact:
+        payload = {
+            "f": [item.filename for item in prediction.results],
+            "p": [options.probabilities(item.probabilities) for item in prediction.results],
+            "a": [
+                active_indices(prediction.classes, item.active) if item.active is not None else None
+                for item in prediction.results
+            ],
+            "e": [item.error for item in prediction.results],
+            "v": prediction.model_version,
+            "q": prediction.quota_remaining,
+        }
+    else:
+        payload = prediction.model_dump()
+        for item in payload["results"]:
+            item["probabilities"] = options.probabilities(item["probabilities"])
+    return encode_response(payload, options.encoding)
+
+
+@router.get("/metadata")
+def metadata():
+    """Static prediction metadata for compact clients: class list, model version, input / response formats"""
+    ml_service = runtime.ml_service
+    return {
+        "classes": ml_service.class_names if ml_service else settings.MODEL_CLASSES,
+        "model_version": ml_service.model_version if ml_service else None,
+        "img_size": settings.MODEL_IMG_SIZE,
+        "default_threshold": 0.5,
+        "raw_input": {"dtype": "uint8", "shape": [settings.MODEL_IMG_SIZE, settings.MODEL_IMG_SIZE, 3]},
+        "response": {
+            "encodings": ["application/json", "application/msgpack"],
+            "compact_keys": COMPACT_KEYS,
+            "quantize_scale": QUANTIZE_SCALE,
+        },
+    }
 
 
 @router.post("/predict", response_model=PredictionResponse)
 async def predict(
+    request: Request,
+    response: Response,
     file: UploadFile = File(...),
     threshold: float = 0.5,
+    tiled: bool = False,
+    merge: str = "max",
+    options: ResponseOptions = Depends(),
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id)
 ):
-    """Predict dangerous objects in image (requires authentication and quota)"""
+    """
+    Predict dangerous objects in image (requires authentication and quota)
+    - `tiled=true`: large images are also scanned as overlapping tiles (small objects), tile and global
+      probabilities are merged with `merge` (max | noisy_or) and the tiles that fired are returned
+    - Image files (JPEG/PNG/WebP/BMP/GIF), or a pre-decoded frame of MODEL_IMG_SIZE x MODEL_IMG_SIZE x 3 uint8:
+      raw RGB bytes (`application/x-raw-rgb` / `.rgb`) or `.npy` (`application/x-npy`)
+    - Per-stage timings are returned in the Server-Timing header (METRICS_ENABLED)
+    - Response encoding / compact mode: see ResponseOptions
+    """
+    _require_model_ready()
+    timer = request_timer()
+    timer.add("upload", getattr(request.state, "upload_seconds", 0.0))
     
-    # Check quota
-    subscription_service = SubscriptionService(db)
-    quota_check = subscription_service.check_quota(user_id)
+    # Validate threshold
+    if threshold <= 0.0 or threshold >= 1.0:
+        raise HTTPException(status_code=400, detail="Threshold must be in (0, 1)")
+    if merge not in MERGE_METHODS:
+        raise HTTPException(status_code=400, detail=f"Merge must be one of {', '.join(MERGE_METHODS)}")
     
-    if not quota_check["allowed"]:
-        raise HTTPException(status_code=403, detail=quota_check["reason"])
+    # Sniff header: reject non-image uploads before quota / DB work
+    # (body size is already capped by UploadLimitMiddleware)
+    with timer.stage("validate"):
+        try:
+            header = await file.read(SNIFF_BYTES)
+            await file.seek(0)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Failed to read image")
+        raw_format = detect_raw_format(file.content_type, file.filename, header)
+        try:
+            if not raw_format:
+                check_image_header(file.content_type, header)
+        except ValueError as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        if tiled and raw_format:
+            raise HTTPException(status_code=400, detail="Tiled mode requires an image file")
+    
+    # Hand the spooled upload to the decoder without copying (memoryview / mmap)
+    with spooled_buffer(file.file) as image_buffer:
+        # Decompression-bomb cap from image header (no pixel decode yet),
+        # or shape / dtype / size of a pre-decoded frame
+        with timer.stage("validate"):
+            try:
+                if raw_format:
+                    parse_raw_frame(image_buffer, raw_format, settings.MODEL_IMG_SIZE)
+                else:
+                    image_format, width, height = probe_image(image_buffer, settings.MAX_IMAGE_PIXELS)
+                    if tiled:
+                        check_tiled_decode(image_format, width, height, settings.TILED_MAX_DECODE_PIXELS)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
+        # Reserve quota (check + increment in one conditional UPDATE)
+        with timer.stage("quota"):
+            quota = SubscriptionService(db).reserve_quota(user_id)
+        
+        if not quota.allowed:
+            raise HTTPException(status_code=403, detail=quota.reason)
+        
+        # Perform inference
+        start_time = time.time()
+        tiles = None
+        try:
+            if tiled:
+                probabilities, tile_probabilities, model_version = await runtime.infer_tiled(
+                    image_buffer, merge, timer
+                )
+            else:
+                probabilities, model_version = await runtime.infer(image_buffer, timer, raw_format, threshold)
+            with timer.stage("postprocess"):
+                result = runtime.ml_service.postprocess(probabilities, threshold)
+                if tiled:
+                    tiles = []
+                    for box, box_probabilities in tile_probabilities:
+                        tile_result = runtime.ml_service.postprocess(box_probabilities, threshold)
+                        if tile_result["active"]:
+                            tiles.append(TileResult(
+                                box=list(box), probabilities=box_probabilities, active=tile_result["active"]
+                            ))
+            quota.commit()
+        except InferenceQueueFull as e:
+            raise HTTPException(
+                status_code=503, detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+        finally:
+            # Inference failed or was cancelled → refund the reservation
+            quota.release()
+    
+    response_time = (time.time() - start_time) * 1000  # ms
+    
+    with timer.stage("db"):
+        # Log usage (queued, written in batches by UsageLogWriter)
+        usage_log_writer.record(
+            user_id=user_id,
+            endpoint="/api/v1/predict",
+            method="POST",
+            status_code=200,
+            response_time_ms=response_time
+        )
+    
+    # Return result with remaining quota
+    prediction = PredictionResponse(
+        classes=result["classes"],
+        probabilities=result["probabilities"],
+        active=result["active"],
+        model_version=model_version,
+        quota_remaining=quota.remaining,
+        tiles=tiles
+    )
+    
+    server_timing = timer.finish()
+    headers = {"Server-Timing": server_timing} if server_timing else {}
+    if not options.default:
+        return _encode_prediction(prediction, options, headers)
+    response.headers.update(headers)
+    return prediction
+
+
+@router.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_batch(
+    files: List[UploadFile] = File(...),
+    threshold: float = 0.5,
+    options: ResponseOptions = Depends(),
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Predict nhiều ảnh trong 1 request (nhiều file multipart hoặc file zip/tar)
+    - Quota được kiểm tra cho cả batch và chỉ trừ cho các ảnh predict thành công
+    - Ảnh lỗi trả về `error` riêng, không làm fail cả batch
+    - Hỗ trợ compact / msgpack giống /predict (xem ResponseOptions)
+    """
+    _require_model_ready()
     
-    # Validate threshold
     if threshold <= 0.0 or threshold >= 1.0:
         raise HTTPException(status_code=400, detail="Threshold must be in (0, 1)")
     
-    # Read image
-    try:
-        image_bytes = await file.read()
-    except Exception:
-        raise HTTPException(status_code=400, detail="Failed to read image")
+    # Collect images (expand archives)
+    images = []
+    for file in files:
+        try:
+            data = await file.read()
+        except Exception:
+            raise HTTPException(status_code=400, detail=f"Failed to read {file.filename}")
+        
+        if is_archive(file.filename, file.content_type):
+            try:
+                images.extend(extract_images(file.filename, data, settings.BATCH_MAX_IMAGES))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            images.append((file.filename, data))
+        
+        if len(images) > settings.BATCH_MAX_IMAGES:
+            raise HTTPException(
+                status_code=400, detail=f"Too many images in batch (max {settings.BATCH_MAX_IMAGES})"
+            )
+    
+    if not images:
+        raise HTTPException(status_code=400, detail="No images in batch")
     
-    # Perform inference
+    # Reserve quota for the whole batch
+    quota = SubscriptionService(db).reserve_quota(user_id, count=len(images))
+    
+    if not quota.allowed:
+        raise HTTPException(status_code=403, detail=quota.reason)
+    
+    # Perform inference: cache lookup first, then decode misses in one executor task
+    # and forward them through the batcher
     start_time = time.time()
+    probabilities = None
     try:
-        result = ml_service.predict(image_bytes, threshold)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        probabilities, errors, model_version = await runtime.infer_many([data for _, data in images], threshold)
+    except InferenceQueueFull as e:
+        raise HTTPException(
+            status_code=503, detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+    finally:
+        # Inference failed or was cancelled → refund the whole reservation
+        if probabilities is None:
+            quota.release()
     
     response_time = (time.time() - start_time) * 1000  # ms
     
-    # Increment usage
-    subscription_service.increment_usage(quota_check["subscription_id"])
+    results = []
+    for (filename, _), image_probabilities, error in zip(images, probabilities, errors):
+        if image_probabilities is None:
+            results.append(BatchPredictionItem(filename=filename, error=error))
+            continue
+        result = runtime.ml_service.postprocess(image_probabilities, threshold)
+        results.append(BatchPredictionItem(
+            filename=filename,
+            probabilities=result["probabilities"],
+            active=result["active"]
+        ))
+    
+    # Charge quota only for successfully predicted images: refund the rest (one UPDATE for the batch)
+    succeeded = sum(1 for image_probabilities in probabilities if image_probabilities is not None)
+    quota.release(len(images) - succeeded)
+    quota.commit()
     
-    # Log usage
-    usage_log_repo = UsageLogRepository(db)
-    usage_log_repo.create(
+    # Log usage (queued, written in batches by UsageLogWriter)
+    usage_log_writer.record(
         user_id=user_id,
-        endpoint="/api/v1/predict",
+        endpoint="/api/v1/predict/batch",
         method="POST",
         status_code=200,
         response_time_ms=response_time
     )
     
-    # Return result with remaining quota
-    return PredictionResponse(
-        classes=result["classes"],
-        probabilities=result["probabilities"],
-        active=result["active"],
-        quota_remaining=quota_check["remaining"] - 1
+    prediction = BatchPredictionResponse(
+        classes=runtime.ml_service.class_names,
+        results=results,
+        succeeded=succeeded,
+        failed=len(images) - succeeded,
+        model_version=model_version,
+        quota_remaining=quota.remaining
     )
+    if not options.default:
+        return _encode_batch(prediction, options)
+    return prediction
 
 
-
+@router.get("/inference/stats", dependencies=[Depends(require_admin_key)])
+def inference_stats():
+    """
+    Queue depth, thời gian chờ và batch size của inference (để sizing workers),
+    bộ đếm quota ledger, usage log writer, rate limit và subscription cache
+    """
+    stats = runtime.stats()
+    stats["quota_ledger"] = quota_ledger.stats()
+    stats["usage_log"] = usage_log_writer.stats()
+    stats["rate_limit"] = get_rate_limiter().stats() if settings.RATE_LIMIT_ENABLED else None
+    stats["subscription_cache"] = subscription_cache.stats()
+    return stats
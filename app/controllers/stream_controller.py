@@ -0,0 +1,156 @@
+import asyncio
+import time
+from typing import Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.services.auth_service import AuthService
+from app.services.subscription_service import SubscriptionService
+from app.services.frame_stream import LatestFrameSlot, StreamUsageMeter, StreamClosed
+from app.services.inference_executor import InferenceQueueFull
+from app.services.inference_runtime import runtime
+from app.services.upload_utils import SNIFF_BYTES, check_image_header
+from app.services.usage_log_writer import usage_log_writer
+
+router = APIRouter(prefix="/api/v1", tags=["Prediction"])
+settings = get_settings()
+
+# WebSocket close codes
+POLICY_VIOLATION = 1008
+TRY_AGAIN_LATER = 1013
+
+
+def _bearer_token(websocket: WebSocket, token: Optional[str]) -> Optional[str]:
+    """Token từ query `?token=` (browser không set được header cho WebSocket) hoặc header Authorization"""
+    if token:
+        return token
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    return credentials if scheme.lower() == "bearer" and credentials else None
+
+
+def _authorize(token: Optional[str]) -> dict:
+    """Xác thực token + kiểm tra quota khi mở stream (từ chối sớm; quota thật được reserve theo block)"""
+    db = SessionLocal()
+    try:
+        user_id = AuthService(db).decode_token(token) if token else None
+        if user_id is None:
+            return {"allowed": False, "reason": "Invalid or expired token"}
+        quota_check = SubscriptionService(db).check_quota(user_id)
+        quota_check["user_id"] = user_id
+        return quota_check
+    finally:
+        db.close()
+
+
+@router.websocket("/stream")
+async def stream(websocket: WebSocket, token: Optional[str] = None, fps: float = 0, threshold: float = 0.5):
+    """
+    Stream frame JPEG qua WebSocket, nhận kết quả detect cho từng frame đã xử lý
+    - Client gửi mỗi frame là 1 binary message; server trả JSON
+      {frame, probabilities, active, model_version, latency_ms, dropped, quota_remaining} hoặc {frame, error}
+    - Latest frame wins: inference chậm hơn camera thì frame cũ bị bỏ, chỉ xử lý frame mới nhất
+    - `fps`: số frame tối đa xử lý mỗi giây (0 = nhanh nhất có thể, giới hạn bởi STREAM_MAX_FPS)
+    - Quota được reserve theo block STREAM_USAGE_FLUSH_FRAMES frame, chỉ tính frame đã xử lý;
+      phần chưa dùng được trả lại sau STREAM_USAGE_FLUSH_SECONDS và khi stream kết thúc
+    """
+    quota_check = await asyncio.to_thread(_authorize, _bearer_token(websocket, token))
+    if not quota_check["allowed"]:
+        await websocket.close(code=POLICY_VIOLATION, reason=quota_check["reason"])
+        return
+    if threshold <= 0.0 or threshold >= 1.0:
+        await websocket.close(code=POLICY_VIOLATION, reason="Threshold must be in (0, 1)")
+        return
+    if not runtime.ready:
+        await websocket.close(code=TRY_AGAIN_LATER, reason=f"Model is {runtime.status}")
+        return
+
+    await websocket.accept()
+    target_fps = min(fps, settings.STREAM_MAX_FPS) if fps > 0 else settings.STREAM_MAX_FPS
+    interval = 1.0 / target_fps if target_fps > 0 else 0.0
+    await websocket.send_json({"classes": runtime.ml_service.class_names, "fps": target_fps})
+
+    slot = LatestFrameSlot()
+    meter = StreamUsageMeter(
+        quota_check["user_id"],
+        block_frames=settings.STREAM_USAGE_FLUSH_FRAMES,
+        release_seconds=settings.STREAM_USAGE_FLUSH_SECONDS
+    )
+    max_frame_bytes = settings.UPLOAD_MAX_MB * 1024 * 1024
+    loop = asyncio.get_running_loop()
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    slot.put(message["bytes"])
+        finally:
+            slot.close()
+
+    receiver = asyncio.create_task(receive_frames())
+    total_latency_ms = 0.0
+    next_due = 0.0
+    try:
+        while True:
+            # Giữ nhịp target FPS: frame đến trong lúc chờ sẽ ghi đè frame cũ
+            delay = next_due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                frame_id, data = await slot.take()
+            except StreamClosed:
+                break
+            next_due = loop.time() + interval
+
+            if not await meter.acquire():
+                reason = meter.reason or "Quota exceeded"
+                await websocket.send_json({"frame": frame_id, "error": reason})
+                await websocket.close(code=POLICY_VIOLATION, reason=reason)
+                break
+
+            try:
+                if len(data) > max_frame_bytes:
+                    raise ValueError(f"Frame too large (max {max_frame_bytes} bytes)")
+                check_image_header("image/jpeg", data[:SNIFF_BYTES])
+                started_at = time.perf_counter()
+                probabilities, model_version = await runtime.infer(data, threshold=threshold)
+            except InferenceQueueFull:
+                # Server quá tải → bỏ frame này, client sẽ gửi frame mới hơn
+                slot.dropped += 1
+                continue
+            except ValueError as e:
+                await websocket.send_json({"frame": frame_id, "error": str(e)})
+                continue
+
+            latency_ms = (time.perf_counter() - started_at) * 1000
+            total_latency_ms += latency_ms
+            meter.charge()
+            result = runtime.ml_service.postprocess(probabilities, threshold)
+            await websocket.send_json({
+                "frame": frame_id,
+                "probabilities": result["probabilities"],
+                "active": result["active"],
+                "model_version": model_version,
+                "latency_ms": round(latency_ms, 2),
+                "dropped": slot.dropped,
+                "quota_remaining": meter.remaining
+            })
+            if meter.release_due():
+                await meter.release()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        await meter.release()
+        if meter.charged:
+            usage_log_writer.record(
+                user_id=quota_check["user_id"],
+                endpoint="/api/v1/stream",
+                method="WS",
+                status_code=200,
+                response_time_ms=total_latency_ms / meter.charged
+            )
@@ -1,20 +1,55 @@
+import logging
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
 
 from app.config import get_settings
 from app.database import init_db
-from app.controllers import auth_router, payment_router, subscription_router, prediction_router
+from app.middleware import UploadLimitMiddleware, RateLimitMiddleware
+from app.controllers import (
+    auth_router, payment_router, subscription_router, prediction_router, stream_router, model_router, job_router
+)
+from app.services.inference_runtime import runtime
+from app.services.job_worker import JobWorker
+from app.services.quota_ledger import quota_ledger
+from app.services.rate_limiter import get_rate_limiter
+from app.services.usage_log_writer import usage_log_writer
+from app.services.request_timing import predict_histograms
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Log của app (load model, backend, precision...) hiện cùng log uvicorn
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(levelname)s:     %(name)s - %(message)s"))
+logging.getLogger("app").addHandler(_log_handler)
+logging.getLogger("app").setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
+
+job_worker = JobWorker(runtime)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize database on startup"""
+    """
+    Initialize database, load model in background on startup;
+    stop job / inference workers and flush pending quota usage / usage logs on shutdown
+    """
     init_db()
+    runtime.start()
+    if settings.QUOTA_LEDGER_ENABLED:
+        quota_ledger.start()
+    if settings.USAGE_LOG_ASYNC_ENABLED:
+        usage_log_writer.start()
+    if settings.JOB_WORKER_ENABLED:
+        job_worker.start()
     yield
+    await job_worker.stop()
+    await runtime.close()
+    await quota_ledger.stop()
+    await usage_log_writer.stop()
 
 
 app = FastAPI(
@@ -32,11 +67,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Giới hạn kích thước upload (413 trước khi đọc body / auth / DB)
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/api/v1/predict": settings.UPLOAD_MAX_MB * 1024 * 1024,
+        "/api/v1/predict/batch": settings.BATCH_UPLOAD_MAX_MB * 1024 * 1024,
+        "/api/v1/jobs": settings.JOB_UPLOAD_MAX_MB * 1024 * 1024,
+    },
+)
+
+# Rate limit theo user / gói (429 trước cả giới hạn upload, DB session và inference)
+# Chỉ các POST gửi inference; poll / liệt kê / huỷ job không tốn token
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=get_rate_limiter(),
+        routes=(
+            ("POST", "/api/v1/predict"),
+            ("POST", "/api/v1/predict/batch"),
+            ("POST", "/api/v1/jobs"),
+        ),
+    )
+
 # Register routers
 app.include_router(auth_router)
 app.include_router(payment_router)
 app.include_router(subscription_router)
 app.include_router(prediction_router)
+app.include_router(stream_router)
+app.include_router(model_router)
+app.include_router(job_router)
 
 
 @app.get("/")
@@ -51,6 +112,10 @@ def root():
             "payment": "/api/payment",
             "subscription": "/api/subscription",
             "prediction": "/api/v1",
+            "jobs": "/api/v1/jobs",
+            "health": "/health",
+            "ready": "/ready",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
@@ -58,9 +123,29 @@ def root():
 
 @app.get("/health")
 def health():
-    """Health check endpoint"""
+    """Liveness check (process còn sống, kể cả khi model chưa load xong)"""
     return {"status": "ok"}
 
+
+@app.get("/ready")
+def ready():
+    """Readiness check: 200 khi model đã load + warm-up xong, 503 trong lúc đang load"""
+    body = {"status": runtime.status, "stages_ms": runtime.stage_ms}
+    if not runtime.ready:
+        if runtime.error:
+            body["error"] = runtime.error
+        return JSONResponse(status_code=503, content=body)
+    body["model_version"] = runtime.ml_service.model_version
+    return body
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Histogram thời gian từng stage của /api/v1/predict (Prometheus text format, theo từng worker)"""
+    if not settings.METRICS_ENABLED:
+        return PlainTextResponse("Metrics are disabled\n", status_code=404)
+    return PlainTextResponse(predict_histograms.render(), media_type="text/plain; version=0.0.4")
+
 # Serve test HTML (simple MVC-like static)
 # Serve a simple FE for testing redirects (DEV only)
 if settings.DEBUG:
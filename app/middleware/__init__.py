@@ -1,6 +1,9 @@
 from app.middleware.auth_middleware import get_current_user_id
+from app.middleware.upload_limit_middleware import UploadLimitMiddleware
+from app.middleware.admin_middleware import require_admin_key
+from app.middleware.rate_limit_middleware import RateLimitMiddleware
 
-__all__ = ["get_current_user_id"]
+__all__ = ["get_current_user_id", "UploadLimitMiddleware", "require_admin_key", "RateLimitMiddleware"]
 
 
 
@@ -0,0 +1,16 @@
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+def require_admin_key(x_admin_key: Optional[str] = Header(None)):
+    """Endpoint quản trị (model registry, inference stats) yêu cầu header X-Admin-Key = ADMIN_API_KEY"""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin API is disabled (ADMIN_API_KEY not set)")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
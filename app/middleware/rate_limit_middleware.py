@@ -0,0 +1,72 @@
+import json
+from typing import FrozenSet, Optional, Tuple
+
+from app.services.auth_service import AuthService
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware giới hạn tốc độ request theo user (token bucket theo gói, xem RateLimiter)
+    - Chỉ áp dụng cho các cặp (method, path) trong `routes` (request gửi inference); GET / DELETE job
+      (poll trạng thái, huỷ) không tốn token. User lấy từ JWT trong header Authorization
+    - Vượt giới hạn → 429 + Retry-After ngay, trước khi đọc body / mở DB session / inference
+    - Mọi response của path được giới hạn có header RateLimit-Limit / -Remaining / -Reset
+    - Không có / sai token → cho qua để dependency auth trả 401 như cũ
+    """
+
+    def __init__(self, app, limiter, routes: Tuple[Tuple[str, str], ...]):
+        self.app = app
+        self.limiter = limiter
+        self.routes: FrozenSet[Tuple[str, str]] = frozenset((method.upper(), path.rstrip("/")) for method, path in routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or \
+                (scope.get("method", ""), scope.get("path", "").rstrip("/")) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        user_id = self._user_id(scope)
+        decision = await self.limiter.check(user_id) if user_id is not None else None
+        if decision is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = [
+            (b"ratelimit-limit", str(decision.limit).encode()),
+            (b"ratelimit-remaining", str(decision.remaining).encode()),
+            (b"ratelimit-reset", str(decision.reset_seconds).encode()),
+        ]
+        if not decision.allowed:
+            await self._reject(send, headers, decision.retry_after)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    @staticmethod
+    def _user_id(scope) -> Optional[int]:
+        for name, value in scope.get("headers", []):
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    return AuthService.decode_token(token.strip())
+                return None
+        return None
+
+    @staticmethod
+    async def _reject(send, headers, retry_after: int):
+        body = json.dumps({"detail": f"Rate limit exceeded, retry after {retry_after}s"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ] + headers,
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,87 @@
+import json
+import time
+from typing import Dict
+
+
+class RequestTooLarge(Exception):
+    """Body vượt giới hạn byte của endpoint"""
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware giới hạn kích thước body theo path (trả 413 trước khi đọc hết upload)
+    - Content-Length vượt limit → từ chối ngay, không đọc body, không chạm DB / auth
+    - Chunked / Content-Length sai → đếm byte khi stream, vượt limit thì dừng nhận body và trả 413
+    - Thời gian nhận body ghi vào request.state.upload_seconds (stage "upload" của Server-Timing)
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    too_large = int(value) > limit
+                except ValueError:
+                    too_large = False
+                if too_large:
+                    await self._reject(send, limit)
+                    return
+
+        received = 0
+        exceeded = False
+        response_started = False
+        state = scope.setdefault("state", {})
+        state["upload_seconds"] = 0.0
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            started_at = time.perf_counter()
+            message = await receive()
+            state["upload_seconds"] += time.perf_counter() - started_at
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise RequestTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # Parser body của FastAPI bọc lỗi thành 400 → thay bằng 413
+            if exceeded and not response_started:
+                response_started = True
+                await self._reject(send, limit)
+                return
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except RequestTooLarge:
+            if not response_started:
+                await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"Request body too large (max {limit} bytes)"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
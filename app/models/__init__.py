@@ -2,8 +2,9 @@ from app.models.user import User
 from app.models.subscription import Subscription
 from app.models.transaction import Transaction
 from app.models.usage_log import UsageLog
+from app.models.prediction_job import PredictionJob, PredictionJobItem
 
-__all__ = ["User", "Subscription", "Transaction", "UsageLog"]
+__all__ = ["User", "Subscription", "Transaction", "UsageLog", "PredictionJob", "PredictionJobItem"]
 
 
 
@@ -0,0 +1,67 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, Boolean, Enum as SQLEnum
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import enum
+import uuid
+from app.database import Base
+
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class CallbackStatus(str, enum.Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    DELIVERED = "delivered"
+    FAILED = "failed"
+
+
+class PredictionJob(Base):
+    __tablename__ = "prediction_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    subscription_id = Column(Integer, ForeignKey("subscriptions.id"), nullable=False)  # Quota đã reserve
+    status = Column(SQLEnum(JobStatus), default=JobStatus.QUEUED, nullable=False, index=True)
+    threshold = Column(Float, default=0.5, nullable=False)
+    total = Column(Integer, default=0, nullable=False)  # Số ảnh = số quota đã reserve
+    processed = Column(Integer, default=0, nullable=False)
+    succeeded = Column(Integer, default=0, nullable=False)
+    model_version = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    callback_url = Column(String, nullable=True)
+    callback_status = Column(SQLEnum(CallbackStatus), nullable=True)
+    worker_id = Column(String, nullable=True)  # Worker đang giữ lease
+    lease_expires_at = Column(DateTime, nullable=True)  # Hết hạn → worker khác được nhận lại job
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    user = relationship("User")
+    items = relationship("PredictionJobItem", back_populates="job", order_by="PredictionJobItem.position")
+
+
+class PredictionJobItem(Base):
+    """1 ảnh của job (tạo sẵn lúc submit, worker điền kết quả theo thứ tự position)"""
+    __tablename__ = "prediction_job_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, ForeignKey("prediction_jobs.id"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    filename = Column(String, nullable=False)
+    path = Column(String, nullable=False)  # File ảnh trong thư mục job (JOB_STORAGE_DIR)
+    done = Column(Boolean, default=False, nullable=False)
+    probabilities = Column(Text, nullable=True)  # JSON list
+    active = Column(Text, nullable=True)  # JSON list
+    error = Column(String, nullable=True)
+
+    # Relationships
+    job = relationship("PredictionJob", back_populates="items")
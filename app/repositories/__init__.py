@@ -2,8 +2,12 @@ from app.repositories.user_repository import UserRepository
 from app.repositories.subscription_repository import SubscriptionRepository
 from app.repositories.transaction_repository import TransactionRepository
 from app.repositories.usage_log_repository import UsageLogRepository
+from app.repositories.prediction_job_repository import PredictionJobRepository
 
-__all__ = ["UserRepository", "SubscriptionRepository", "TransactionRepository", "UsageLogRepository"]
+__all__ = [
+    "UserRepository", "SubscriptionRepository", "TransactionRepository", "UsageLogRepository",
+    "PredictionJobRepository"
+]
 
 
 
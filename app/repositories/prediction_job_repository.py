@@ -0,0 +1,184 @@
+from sqlalchemy import or_, and_, update, func
+from sqlalchemy.orm import Session
+from app.models.prediction_job import PredictionJob, PredictionJobItem, JobStatus, CallbackStatus
+from typing import Optional, List, Tuple
+from datetime import datetime, timedelta
+
+TERMINAL_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class PredictionJobRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def create(self, job: PredictionJob, items: List[Tuple[str, str]]) -> PredictionJob:
+        """Tạo job cùng các item (filename, path) trong 1 transaction"""
+        job.total = len(items)
+        self.db.add(job)
+        self.db.flush()
+        self.db.add_all([
+            PredictionJobItem(job_id=job.id, position=position, filename=filename, path=path)
+            for position, (filename, path) in enumerate(items)
+        ])
+        self.db.commit()
+        self.db.refresh(job)
+        return job
+
+    def get_by_id(self, job_id: str) -> Optional[PredictionJob]:
+        return self.db.query(PredictionJob).filter(PredictionJob.id == job_id).first()
+
+    def get_for_user(self, job_id: str, user_id: int) -> Optional[PredictionJob]:
+        return self.db.query(PredictionJob).filter(
+            PredictionJob.id == job_id,
+            PredictionJob.user_id == user_id
+        ).first()
+
+    def get_by_user(self, user_id: int, limit: int = 50) -> List[PredictionJob]:
+        return self.db.query(PredictionJob).filter(
+            PredictionJob.user_id == user_id
+        ).order_by(PredictionJob.created_at.desc()).limit(limit).all()
+
+    def get_items(self, job_id: str, offset: int = 0, limit: int = 100) -> List[PredictionJobItem]:
+        return self.db.query(PredictionJobItem).filter(
+            PredictionJobItem.job_id == job_id,
+            PredictionJobItem.done.is_(True),
+            PredictionJobItem.position >= offset
+        ).order_by(PredictionJobItem.position).limit(limit).all()
+
+    def get_pending_items(self, job_id: str, limit: int) -> List[PredictionJobItem]:
+        return self.db.query(PredictionJobItem).filter(
+            PredictionJobItem.job_id == job_id,
+            PredictionJobItem.done.is_(False)
+        ).order_by(PredictionJobItem.position).limit(limit).all()
+
+    def claimable_ids(self, now: datetime, limit: int = 5) -> List[str]:
+        """Job đang chờ, hoặc đang chạy nhưng worker giữ lease đã chết (lease hết hạn)"""
+        rows = self.db.query(PredictionJob.id).filter(or_(
+            PredictionJob.status == JobStatus.QUEUED,
+            and_(PredictionJob.status == JobStatus.RUNNING, PredictionJob.lease_expires_at < now)
+        )).order_by(PredictionJob.created_at).limit(limit).all()
+        return [row.id for row in rows]
+
+    def claim(self, job_id: str, worker_id: str, now: datetime, lease_seconds: float) -> bool:
+        """
+        Nhận job bằng 1 UPDATE có điều kiện → nhiều worker (process / máy) chạy song song
+        không bao giờ nhận trùng 1 job
+        """
+        result = self.db.execute(
+            update(PredictionJob).where(
+                PredictionJob.id == job_id,
+                or_(
+                    PredictionJob.status == JobStatus.QUEUED,
+                    and_(PredictionJob.status == JobStatus.RUNNING, PredictionJob.lease_expires_at < now)
+                )
+            ).values(
+                status=JobStatus.RUNNING,
+                worker_id=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                started_at=func.coalesce(PredictionJob.started_at, now)
+            ).execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount == 1
+
+    def save_chunk(self, job_id: str, results: List[dict], model_version: str,
+                   worker_id: str, lease_seconds: float) -> bool:
+        """
+        Lưu kết quả 1 chunk ({id, probabilities, active, error} mỗi item) + tiến độ + gia hạn lease
+        trong 1 transaction (restart → chạy tiếp từ item chưa done)
+        False nếu lease đã bị worker khác lấy (kết quả chunk bị bỏ)
+        """
+        now = datetime.utcnow()
+        result = self.db.execute(
+            update(PredictionJob).where(
+                PredictionJob.id == job_id,
+                PredictionJob.worker_id == worker_id,
+                PredictionJob.status == JobStatus.RUNNING
+            ).values(
+                processed=PredictionJob.processed + len(results),
+                succeeded=PredictionJob.succeeded + sum(1 for item in results if item["error"] is None),
+                model_version=model_version,
+                lease_expires_at=now + timedelta(seconds=lease_seconds)
+            ).execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            self.db.rollback()
+            return False
+        if results:
+            self.db.execute(update(PredictionJobItem), [{**item, "done": True} for item in results])
+        self.db.commit()
+        return True
+
+    def finish(self, job: PredictionJob, status: JobStatus, error: Optional[str],
+               worker_id: Optional[str]) -> bool:
+        """
+        Chuyển job sang trạng thái cuối bằng 1 UPDATE có điều kiện: job chưa kết thúc và vẫn do
+        `worker_id` giữ (None: job đang chờ, chưa worker nào nhận)
+        Không commit (caller commit cùng transaction với phần trả quota); False nếu job đã được
+        kết thúc / nhận bởi worker khác
+        """
+        result = self.db.execute(
+            update(PredictionJob).where(
+                PredictionJob.id == job.id,
+                PredictionJob.status.notin_(TERMINAL_STATUSES),
+                PredictionJob.worker_id == worker_id if worker_id else PredictionJob.worker_id.is_(None)
+            ).values(
+                status=status,
+                error=error,
+                finished_at=datetime.utcnow(),
+                lease_expires_at=None,
+                callback_status=CallbackStatus.PENDING if job.callback_url else job.callback_status
+            ).execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    def requeue(self, job_id: str, worker_id: str) -> bool:
+        result = self.db.execute(
+            update(PredictionJob).where(
+                PredictionJob.id == job_id,
+                PredictionJob.worker_id == worker_id,
+                PredictionJob.status == JobStatus.RUNNING
+            ).values(
+                status=JobStatus.QUEUED, worker_id=None, lease_expires_at=None
+            ).execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount == 1
+
+    def request_cancel(self, job: PredictionJob) -> PredictionJob:
+        job.cancel_requested = True
+        self.db.commit()
+        self.db.refresh(job)
+        return job
+
+    def claim_callback(self, worker_id: str, now: datetime, lease_seconds: float) -> Optional[PredictionJob]:
+        """Nhận 1 callback cần gửi (pending, hoặc sending nhưng worker gửi đã chết)"""
+        candidates = self.db.query(PredictionJob.id).filter(or_(
+            PredictionJob.callback_status == CallbackStatus.PENDING,
+            and_(PredictionJob.callback_status == CallbackStatus.SENDING, PredictionJob.lease_expires_at < now)
+        )).order_by(PredictionJob.finished_at).limit(5).all()
+        for row in candidates:
+            result = self.db.execute(
+                update(PredictionJob).where(
+                    PredictionJob.id == row.id,
+                    or_(
+                        PredictionJob.callback_status == CallbackStatus.PENDING,
+                        and_(PredictionJob.callback_status == CallbackStatus.SENDING,
+                             PredictionJob.lease_expires_at < now)
+                    )
+                ).values(
+                    callback_status=CallbackStatus.SENDING,
+                    worker_id=worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds)
+                ).execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+            if result.rowcount == 1:
+                return self.get_by_id(row.id)
+        return None
+
+    def update_callback_status(self, job_id: str, status: CallbackStatus):
+        self.db.query(PredictionJob).filter(PredictionJob.id == job_id).update(
+            {"callback_status": status, "lease_expires_at": None}, synchronize_session=False
+        )
+        self.db.commit()
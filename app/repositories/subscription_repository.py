@@ -1,8 +1,13 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import case, exists, or_, select, update
+from sqlalchemy.orm import Session, aliased
 from app.models.subscription import Subscription, PlanType, SubscriptionStatus
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from datetime import datetime
 
+# Subscription khác của cùng user (kiểm tra "đã có subscription mới hơn" trong reserve_usage);
+# tạo 1 lần, aliased() trong mỗi request tốn hơn cả câu UPDATE
+_newer = aliased(Subscription, name="newer")
+
 
 class SubscriptionRepository:
     def __init__(self, db: Session):
@@ -25,12 +30,21 @@ class SubscriptionRepository:
     def get_by_id(self, subscription_id: int) -> Optional[Subscription]:
         return self.db.query(Subscription).filter(Subscription.id == subscription_id).first()
     
+    def get_latest_since(self, user_id: int, subscription_id: int) -> Optional[Subscription]:
+        """
+        Subscription mới nhất của user có id >= subscription_id (kiểm tra snapshot trong cache:
+        id khác → worker khác đã tạo subscription mới hơn)
+        """
+        return self.db.query(Subscription).filter(
+            Subscription.user_id == user_id,
+            Subscription.id >= subscription_id
+        ).order_by(Subscription.id.desc()).first()
+    
     def get_active_by_user(self, user_id: int) -> Optional[Subscription]:
         """
         Get current active subscription for user
         Includes CANCELLED subscriptions that haven't expired yet
         """
-        from sqlalchemy import or_
         return self.db.query(Subscription).filter(
             Subscription.user_id == user_id,
             or_(
@@ -44,13 +58,86 @@ class SubscriptionRepository:
             Subscription.user_id == user_id
         ).order_by(Subscription.created_at.desc()).all()
     
-    def increment_usage(self, subscription_id: int, count: int = 1) -> Optional[Subscription]:
-        subscription = self.get_by_id(subscription_id)
-        if subscription:
-            subscription.used_quota += count
+    def increment_usage(self, subscription_id: int, count: int = 1) -> bool:
+        """Cộng usage bằng 1 UPDATE nguyên tử (không read-modify-write trong Python → không mất lượt khi chạy đồng thời)"""
+        result = self.db.execute(
+            update(Subscription).where(Subscription.id == subscription_id).values(
+                used_quota=Subscription.used_quota + count
+            ).execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount == 1
+    
+    def reserve_usage(self, user_id: int, count: int = 1, now: Optional[datetime] = None,
+                      subscription_id: Optional[int] = None,
+                      status: Optional[SubscriptionStatus] = None) -> Optional[Tuple[int, int]]:
+        """
+        Reserve `count` lượt quota của subscription hiện tại (mới nhất ACTIVE / CANCELLED, chưa hết hạn)
+        bằng 1 câu UPDATE ... WHERE used_quota + count <= monthly_quota: check và trừ quota là 1 thao tác
+        nguyên tử nên các request đồng thời không thể vượt quota
+        `subscription_id` + `status` (subscription đã cache): UPDATE theo id, chỉ khớp nếu status chưa đổi
+        và user chưa có subscription mới hơn
+        → (subscription_id, remaining) hoặc None nếu không reserve được
+        """
+        now = now or datetime.utcnow()
+        if subscription_id is not None:
+            current = subscription_id
+            conditions = [
+                Subscription.user_id == user_id,
+                Subscription.status == status,
+                ~exists().where(_newer.user_id == user_id, _newer.id > subscription_id)
+            ]
+        else:
+            current = select(Subscription.id).where(
+                Subscription.user_id == user_id,
+                or_(
+                    Subscription.status == SubscriptionStatus.ACTIVE,
+                    Subscription.status == SubscriptionStatus.CANCELLED
+                )
+            ).order_by(Subscription.created_at.desc()).limit(1).scalar_subquery()
+            conditions = []
+        statement = update(Subscription).where(
+            Subscription.id == current,
+            *conditions,
+            Subscription.used_quota + count <= Subscription.monthly_quota,
+            or_(Subscription.expires_at.is_(None), Subscription.expires_at >= now)
+        ).values(used_quota=Subscription.used_quota + count).execution_options(synchronize_session=False)
+        
+        if self.db.get_bind().dialect.update_returning:
+            row = self.db.execute(
+                statement.returning(Subscription.id, Subscription.monthly_quota - Subscription.used_quota)
+            ).first()
             self.db.commit()
-            self.db.refresh(subscription)
-        return subscription
+            return (row[0], row[1]) if row else None
+        
+        # DB không hỗ trợ UPDATE ... RETURNING: đọc lại số còn lại trong cùng transaction
+        if self.db.execute(statement).rowcount != 1:
+            self.db.rollback()
+            return None
+        row = self.db.execute(
+            select(Subscription.id, Subscription.monthly_quota - Subscription.used_quota).where(
+                Subscription.id == current
+            )
+        ).first()
+        self.db.commit()
+        return row[0], row[1]
+    
+    def release_usage(self, subscription_id: int, count: int, commit: bool = True) -> bool:
+        """
+        Trả lại quota đã reserve nhưng không dùng (UPDATE nguyên tử, không xuống dưới 0)
+        commit=False: caller commit cùng transaction với thay đổi khác
+        """
+        result = self.db.execute(
+            update(Subscription).where(Subscription.id == subscription_id).values(
+                used_quota=case(
+                    (Subscription.used_quota >= count, Subscription.used_quota - count),
+                    else_=0
+                )
+            ).execution_options(synchronize_session=False)
+        )
+        if commit:
+            self.db.commit()
+        return result.rowcount == 1
     
     def reset_usage(self, subscription_id: int) -> Optional[Subscription]:
         subscription = self.get_by_id(subscription_id)
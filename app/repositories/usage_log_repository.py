@@ -1,6 +1,7 @@
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from app.models.usage_log import UsageLog
-from typing import List
+from typing import Dict, List
 from datetime import datetime, timedelta
 
 
@@ -22,6 +23,14 @@ class UsageLogRepository:
         self.db.refresh(log)
         return log
     
+    def create_many(self, rows: List[Dict]) -> int:
+        """Bulk insert (executemany, không refresh từng row) cho UsageLogWriter"""
+        if not rows:
+            return 0
+        self.db.execute(insert(UsageLog), rows)
+        self.db.commit()
+        return len(rows)
+    
     def get_by_user(self, user_id: int, limit: int = 100) -> List[UsageLog]:
         return self.db.query(UsageLog).filter(
             UsageLog.user_id == user_id
@@ -2,6 +2,8 @@ from app.schemas.auth import *
 from app.schemas.payment import *
 from app.schemas.prediction import *
 from app.schemas.subscription import *
+from app.schemas.model import *
+from app.schemas.job import *
 
 __all__ = [
     "UserRegister",
@@ -14,8 +16,14 @@ __all__ = [
     "MoMoIPNRequest",
     "PredictionRequest",
     "PredictionResponse",
+    "TileResult",
+    "BatchPredictionItem",
+    "BatchPredictionResponse",
     "SubscriptionResponse",
     "PurchasePlanRequest",
+    "ModelLoadRequest",
+    "ModelCandidateRequest",
+    "JobResponse",
 ]
 
 
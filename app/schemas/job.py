@@ -0,0 +1,27 @@
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
+from datetime import datetime
+
+from app.schemas.prediction import BatchPredictionItem
+
+
+class JobResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())  # field model_version
+
+    id: str
+    status: str  # queued | running | succeeded | failed | cancelled
+    total: int
+    processed: int
+    succeeded: int
+    failed: int
+    threshold: float
+    model_version: Optional[str]
+    error: Optional[str]
+    cancel_requested: bool
+    callback_status: Optional[str]  # pending | sending | delivered | failed
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    classes: Optional[List[str]] = None
+    results: Optional[List[BatchPredictionItem]] = None  # 1 trang kết quả (?offset=&limit=)
+    next_offset: Optional[int] = None  # Còn kết quả → gọi lại với offset này
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import Literal
+
+
+class ModelLoadRequest(BaseModel):
+    path: str
+    activate: bool = False  # Tự chuyển traffic sang version mới sau khi load + warm-up xong
+
+
+class ModelCandidateRequest(BaseModel):
+    mode: Literal["shadow", "ab"] = "shadow"
+    percent: float = 10.0  # % request được route sang candidate
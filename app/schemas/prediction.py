@@ -1,16 +1,41 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
 
 
 class PredictionRequest(BaseModel):
     threshold: float = 0.5
 
 
+class TileResult(BaseModel):
+    box: List[int]  # [x0, y0, x1, y1] theo toạ độ ảnh gốc
+    probabilities: List[float]
+    active: List[str]
+
+
 class PredictionResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())  # field model_version
+
     classes: List[str]
     probabilities: List[float]
     active: List[str]
+    model_version: str
     quota_remaining: int
+    tiles: Optional[List[TileResult]] = None  # Tiled mode: các tile có class vượt threshold
 
 
+class BatchPredictionItem(BaseModel):
+    filename: str
+    probabilities: Optional[List[float]] = None
+    active: Optional[List[str]] = None
+    error: Optional[str] = None
 
+
+class BatchPredictionResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())  # field model_version
+
+    classes: List[str]
+    results: List[BatchPredictionItem]
+    succeeded: int
+    failed: int
+    model_version: str
+    quota_remaining: int
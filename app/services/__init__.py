@@ -1,9 +1,13 @@
 from app.services.auth_service import AuthService
 from app.services.payment_service import PaymentService
 from app.services.subscription_service import SubscriptionService
-from app.services.ml_inference_service import MLInferenceService
 
 __all__ = ["AuthService", "PaymentService", "SubscriptionService", "MLInferenceService"]
 
 
-
+def __getattr__(name):
+    # MLInferenceService import torch → chỉ import khi thật sự cần (lazy)
+    if name == "MLInferenceService":
+        from app.services.ml_inference_service import MLInferenceService
+        return MLInferenceService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -48,8 +48,9 @@ class AuthService:
         encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
         return encoded_jwt
     
-    def decode_token(self, token: str) -> Optional[int]:
-        """Giải mã JWT token và trả về user_id"""
+    @staticmethod
+    def decode_token(token: str) -> Optional[int]:
+        """Giải mã JWT token và trả về user_id (không cần DB: dùng được trong middleware)"""
         try:
             payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
             user_id: str = payload.get("sub")
@@ -0,0 +1,90 @@
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import torch
+import torch.nn.functional as F
+
+
+class CascadeStage:
+    """
+    Pass rẻ chạy trước model đầy đủ (cùng network ở độ phân giải thấp, vd 128px thay vì 224px)
+    - Ảnh mà mọi class đều cách threshold của request ít nhất `margin` → trả kết quả pass rẻ luôn
+    - Ảnh còn lại (probability gần threshold) được escalate lên model đầy đủ
+    - Input là tensor đã preprocess ở kích thước đầy đủ, thu nhỏ bằng interpolate (không decode lại)
+    """
+
+    def __init__(self, backend, img_size: int, margin: float):
+        self.backend = backend
+        self.img_size = img_size
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._images = 0
+        self._escalated = 0
+
+    def confident(self, probabilities: Sequence[float], threshold: float = 0.5) -> bool:
+        return all(abs(p - threshold) >= self.margin for p in probabilities)
+
+    def forward(self, batch: torch.Tensor) -> List[List[float]]:
+        """Sigmoid probabilities của pass rẻ cho batch (N, 3, H, W) ở kích thước đầy đủ"""
+        small = F.interpolate(batch, size=(self.img_size, self.img_size), mode="bilinear",
+                              align_corners=False, antialias=True)
+        return torch.sigmoid(self.backend(small).float()).cpu().numpy().tolist()
+
+    def run(self, batch: torch.Tensor, thresholds: Sequence[float],
+            full_forward) -> Tuple[List[List[float]], List[bool]]:
+        """
+        Pass rẻ cho cả batch, escalate các ảnh chưa chắc chắn lên `full_forward` trong 1 batch con
+        `thresholds`: threshold của từng ảnh (request khác nhau có threshold khác nhau)
+        → (probabilities, True nếu ảnh đó có kết quả của model đầy đủ)
+        """
+        probabilities = self.forward(batch)
+        escalate = [
+            i for i, (row, threshold) in enumerate(zip(probabilities, thresholds))
+            if not self.confident(row, threshold)
+        ]
+        full = [False] * len(probabilities)
+        if escalate:
+            index = torch.tensor(escalate, dtype=torch.long)
+            for i, row in zip(escalate, full_forward(batch.index_select(0, index))):
+                probabilities[i] = row
+                full[i] = True
+        with self._lock:
+            self._images += len(probabilities)
+            self._escalated += len(escalate)
+        return probabilities, full
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "img_size": self.img_size,
+                "margin": self.margin,
+                "images": self._images,
+                "escalated": self._escalated,
+                "escalation_rate": self._escalated / self._images if self._images else 0.0,
+            }
+
+
+def compare_cascade(full_probabilities: List[List[float]], cascade_probabilities: List[List[float]],
+                    margin: float, threshold: float = 0.5) -> Dict:
+    """
+    Mô phỏng cascade với `margin` trên kết quả có sẵn của 2 pass (không chạy lại model)
+    → escalation rate và độ khớp `active` classes end-to-end so với model đầy đủ
+    """
+    escalated = agreed = 0
+    max_drift = 0.0
+    for full, cheap in zip(full_probabilities, cascade_probabilities):
+        if any(abs(p - threshold) < margin for p in cheap):
+            escalated += 1
+            agreed += 1
+            continue
+        max_drift = max(max_drift, max(abs(a - b) for a, b in zip(full, cheap)))
+        agreed += [p >= threshold for p in full] == [p >= threshold for p in cheap]
+    total = len(full_probabilities)
+    return {
+        "margin": margin,
+        "samples": total,
+        "escalation_rate": escalated / total if total else 0.0,
+        "agreement": agreed / total if total else 1.0,
+        "max_drift_accepted": max_drift,
+    }
+
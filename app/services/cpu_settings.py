@@ -0,0 +1,82 @@
+import logging
+import os
+import tempfile
+from typing import List, Optional
+
+import torch
+
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Giữ file lock của slot CPU suốt vòng đời process
+_slot_lock = None
+# Chỉ áp dụng 1 lần mỗi process (registry có thể load nhiều model version)
+_applied = False
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """'0-3,8' → [0, 1, 2, 3, 8]"""
+    cpus = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _claim_slot(slots: int) -> Optional[int]:
+    """Mỗi worker giữ 1 file lock để nhận 1 slot CPU riêng (uvicorn không cho worker biết index)"""
+    global _slot_lock
+    try:
+        import fcntl
+    except ImportError:
+        return None
+
+    plan_id = os.environ.get("INFERENCE_PLAN_ID", str(os.getppid()))
+    for slot in range(slots):
+        path = os.path.join(tempfile.gettempdir(), f"inference-plan-{plan_id}-slot{slot}.lock")
+        handle = open(path, "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _slot_lock = handle
+        return slot
+    return None
+
+
+def apply_cpu_settings():
+    """
+    Áp dụng thread / CPU affinity cho process worker hiện tại (theo plan của run.py)
+    - TORCH_NUM_THREADS / TORCH_INTEROP_THREADS: 0 = để torch tự chọn
+    - INFERENCE_CPU_AFFINITY: danh sách CPU cho từng worker, ngăn cách bởi ';' (vd '0-3;4-7')
+    """
+    global _applied
+    if _applied:
+        return
+    _applied = True
+
+    if settings.INFERENCE_CPU_AFFINITY and hasattr(os, "sched_setaffinity"):
+        plans = [spec for spec in settings.INFERENCE_CPU_AFFINITY.split(";") if spec.strip()]
+        slot = _claim_slot(len(plans))
+        if slot is not None:
+            cpus = parse_cpu_list(plans[slot])
+            os.sched_setaffinity(0, cpus)
+            logger.info("Worker %d pinned to CPUs %s (slot %d)", os.getpid(), plans[slot], slot)
+
+    if settings.TORCH_NUM_THREADS > 0:
+        torch.set_num_threads(settings.TORCH_NUM_THREADS)
+    if settings.TORCH_INTEROP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(settings.TORCH_INTEROP_THREADS)
+        except RuntimeError:
+            # Chỉ set được trước khi torch chạy tác vụ song song đầu tiên
+            pass
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from typing import Optional, Tuple
+
+from app.database import SessionLocal
+from app.services.subscription_service import SubscriptionService
+
+
+class StreamClosed(Exception):
+    """Client đã ngắt kết nối, không còn frame để xử lý"""
+
+
+class LatestFrameSlot:
+    """
+    Slot 1 phần tử cho frame mới nhất (latest frame wins)
+    - Frame mới ghi đè frame chưa xử lý → frame cũ bị bỏ (đếm vào `dropped`)
+    - Inference chậm hơn camera thì luôn xử lý frame gần nhất, không dồn hàng đợi
+    """
+
+    def __init__(self):
+        self._frame: Optional[Tuple[int, bytes]] = None
+        self._event = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, data: bytes) -> int:
+        """Đặt frame mới, trả về frame id"""
+        self.received += 1
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = (self.received, data)
+        self._event.set()
+        return self.received
+
+    def close(self):
+        self._closed = True
+        self._event.set()
+
+    async def take(self) -> Tuple[int, bytes]:
+        """Chờ và lấy frame mới nhất; raise StreamClosed khi client ngắt và không còn frame"""
+        while self._frame is None:
+            if self._closed:
+                raise StreamClosed()
+            self._event.clear()
+            await self._event.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class StreamUsageMeter:
+    """
+    Quota của stream theo block: reserve_quota(`block_frames`) 1 lần, mỗi frame đã xử lý lấy 1 lượt
+    từ block (không query DB), hết block thì reserve block tiếp theo
+    - Quota bị trừ trong DB trước khi dùng → nhiều stream / /predict đồng thời không vượt quota
+    - Block giữ quá `release_seconds` (stream chậm / idle) và khi stream kết thúc: trả lại phần chưa dùng
+    """
+
+    def __init__(self, user_id: int, block_frames: int, release_seconds: float):
+        self.user_id = user_id
+        self.block_frames = max(1, block_frames)
+        self.release_seconds = release_seconds
+        self.subscription_id: Optional[int] = None
+        self.remaining = 0  # quota còn lại của user (tính cả phần chưa dùng của block)
+        self.reason: Optional[str] = None
+        self.charged = 0
+        self._available = 0
+        self._reserved_at = 0.0
+
+    async def acquire(self) -> bool:
+        """Còn lượt cho 1 frame (reserve block mới nếu cần) - False nếu hết quota (xem `reason`)"""
+        if self._available <= 0:
+            await self._reserve_block()
+        return self._available > 0
+
+    def charge(self):
+        self._available -= 1
+        self.remaining -= 1
+        self.charged += 1
+
+    def release_due(self) -> bool:
+        return self._available > 0 and time.monotonic() - self._reserved_at >= self.release_seconds
+
+    async def release(self):
+        """Trả lại phần chưa dùng của block hiện tại (chạy ở thread, không chặn event loop)"""
+        count, self._available = self._available, 0
+        if count > 0:
+            await asyncio.to_thread(self._release_usage, self.subscription_id, count)
+
+    async def _reserve_block(self):
+        subscription_id, count, remaining, reason = await asyncio.to_thread(self._reserve_usage)
+        self._available, self.reason = count, reason
+        self.remaining = remaining + count
+        self._reserved_at = time.monotonic()
+        if subscription_id is not None:
+            self.subscription_id = subscription_id
+
+    def _reserve_usage(self) -> Tuple[Optional[int], int, int, Optional[str]]:
+        """Reserve 1 block, không đủ thì reserve phần quota còn lại → (subscription_id, count, remaining, reason)"""
+        db = SessionLocal()
+        try:
+            service = SubscriptionService(db)
+            reservation = service.reserve_quota(self.user_id, self.block_frames)
+            if not reservation.allowed and 0 < reservation.remaining < self.block_frames:
+                reservation = service.reserve_quota(self.user_id, reservation.remaining)
+            return reservation.subscription_id, reservation.count, reservation.remaining, reservation.reason
+        finally:
+            db.close()
+
+    @staticmethod
+    def _release_usage(subscription_id: int, count: int):
+        db = SessionLocal()
+        try:
+            SubscriptionService(db).release_quota(subscription_id, count)
+        finally:
+            db.close()
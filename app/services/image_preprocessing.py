@@ -0,0 +1,90 @@
+from typing import Sequence
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from app.services.upload_utils import BufferReader, ImageBuffer, check_pixel_limit, parse_raw_frame
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def build_reference_transform(size: int) -> transforms.Compose:
+    """Transform gốc giống notebook training (full decode → Resize → ToTensor → Normalize), dùng để so parity"""
+    return transforms.Compose([
+        transforms.Resize((size, size)),
+        transforms.ToTensor(),
+        transforms.Normalize(list(IMAGENET_MEAN), list(IMAGENET_STD))
+    ])
+
+
+class ImagePreprocessor:
+    """
+    Decode ảnh ở kích thước gần target và chuẩn hoá thành tensor (3, size, size)
+    - JPEG: dùng draft mode (DCT scaling của libjpeg) để decode thẳng ở 1/2, 1/4, 1/8 kích thước
+      thay vì decode full resolution rồi mới resize
+    - Bỏ qua bước convert("RGB") nếu ảnh đã là RGB (tránh thêm 1 bản copy full-size)
+    - Normalize gộp thành 1 phép nhân + trừ vectorized trên uint8 → float
+    - Nhận bytes / memoryview / mmap (đọc trực tiếp từ spool upload, không copy) và
+      từ chối ảnh vượt max_pixels trước khi decode pixel (decompression bomb)
+    """
+
+    def __init__(
+        self,
+        size: int = 224,
+        mean: Sequence[float] = IMAGENET_MEAN,
+        std: Sequence[float] = IMAGENET_STD,
+        max_pixels: int = 0
+    ):
+        self.size = size
+        self.max_pixels = max_pixels
+        # (x / 255 - mean) / std == x * scale - bias
+        std_tensor = torch.tensor(std, dtype=torch.float32).view(3, 1, 1)
+        self._scale = 1.0 / (255.0 * std_tensor)
+        self._bias = torch.tensor(mean, dtype=torch.float32).view(3, 1, 1) / std_tensor
+        self._scale_np = self._scale.numpy()
+        self._bias_np = self._bias.numpy()
+
+    def decode(self, image_bytes: ImageBuffer) -> Image.Image:
+        """Decode ảnh về RGB kích thước (size, size); raise ValueError nếu không phải ảnh hợp lệ / quá lớn"""
+        with BufferReader(image_bytes) as reader:
+            try:
+                image = Image.open(reader)
+            except Exception:
+                raise ValueError("Invalid image format")
+            # Header đã có kích thước → kiểm tra trước khi decode pixel
+            check_pixel_limit(image.width, image.height, self.max_pixels)
+            try:
+                if image.format == "JPEG":
+                    # Chọn scale DCT lớn nhất mà ảnh vẫn >= target size
+                    image.draft("RGB", (self.size, self.size))
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                return image.resize((self.size, self.size), Image.BILINEAR)
+            except Exception:
+                raise ValueError("Invalid image format")
+
+    def to_tensor(self, image: Image.Image) -> torch.Tensor:
+        """uint8 HWC → float CHW đã normalize (ImageNet mean/std)"""
+        array = torch.from_numpy(np.array(image)).permute(2, 0, 1)
+        return array.to(torch.float32).mul_(self._scale).sub_(self._bias)
+
+    def from_raw(self, buffer: ImageBuffer, raw_format: str) -> torch.Tensor:
+        """
+        Frame đã decode sẵn (raw RGB / .npy uint8 HWC đúng size x size) → tensor đã normalize
+        Đọc thẳng từ buffer upload (view, không copy) và ghi 1 lần vào tensor float output
+        """
+        frame = parse_raw_frame(buffer, raw_format, self.size)
+        output = np.empty((3, self.size, self.size), dtype=np.float32)
+        self.normalize_into(frame, output)
+        return torch.from_numpy(output)
+
+    def normalize_into(self, pixels: np.ndarray, output: np.ndarray):
+        """uint8 HWC (view bất kỳ) → ghi float CHW đã normalize vào `output` (3, H, W), không tạo bản trung gian"""
+        np.multiply(pixels.transpose(2, 0, 1), self._scale_np, out=output)
+        np.subtract(output, self._bias_np, out=output)
+
+    def __call__(self, image_bytes: ImageBuffer) -> torch.Tensor:
+        return self.to_tensor(self.decode(image_bytes))
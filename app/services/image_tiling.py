@@ -0,0 +1,101 @@
+import math
+from typing import List, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.services.image_preprocessing import ImagePreprocessor
+from app.services.upload_utils import (
+    MERGE_METHODS, BufferReader, ImageBuffer, check_pixel_limit, check_tiled_decode
+)
+
+Box = Tuple[int, int, int, int]
+
+
+def tile_positions(length: int, tile: int, overlap: float) -> List[int]:
+    """Vị trí bắt đầu các tile (phủ hết chiều dài, chồng lấn ít nhất `overlap`, tile cuối sát mép)"""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    count = math.ceil((length - tile) / stride) + 1
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def merge_probabilities(probabilities: List[List[float]], method: str = "max") -> List[float]:
+    """
+    Gộp probabilities của global view + các tile thành 1 kết quả cho ảnh
+    - max: class xuất hiện ở tile nào cũng được giữ nguyên độ tin cậy cao nhất
+    - noisy_or: 1 - prod(1 - p), coi các tile là bằng chứng độc lập
+    """
+    array = np.asarray(probabilities, dtype=np.float64)
+    if method == "max":
+        return array.max(axis=0).tolist()
+    if method == "noisy_or":
+        return (1.0 - np.prod(1.0 - array, axis=0)).tolist()
+    raise ValueError(f"Invalid merge method {method!r}, expected one of {MERGE_METHODS}")
+
+
+class ImageTiler:
+    """
+    Chia ảnh lớn thành các tile (size x size) chồng lấn + 1 global view, trả về 1 batch tensor
+    - Ảnh được thu nhỏ về cạnh dài <= max_side trước khi cắt tile. JPEG decode bằng draft ở kích thước
+      gần đó → bộ nhớ bị chặn theo max_side / max_tiles; format khác decode đầy đủ rồi mới thu nhỏ nên
+      bị giới hạn max_decode_pixels
+    - Box của từng tile trả về theo toạ độ ảnh gốc
+    """
+
+    def __init__(self, preprocessor: ImagePreprocessor, max_side: int = 896, overlap: float = 0.25,
+                 max_tiles: int = 32, max_decode_pixels: int = 16_000_000):
+        self.preprocessor = preprocessor
+        self.size = preprocessor.size
+        self.max_side = max(max_side, self.size)
+        self.overlap = min(max(overlap, 0.0), 0.9)
+        self.max_tiles = max(1, max_tiles)
+        self.max_decode_pixels = max_decode_pixels
+
+    def _work_size(self, width: int, height: int) -> Tuple[Tuple[int, int], List[int], List[int]]:
+        """Kích thước ảnh để cắt tile và lưới tile, thu nhỏ dần đến khi số tile <= max_tiles"""
+        scale = min(1.0, self.max_side / max(width, height))
+        while True:
+            work_size = (max(self.size, round(width * scale)), max(self.size, round(height * scale)))
+            xs = tile_positions(work_size[0], self.size, self.overlap)
+            ys = tile_positions(work_size[1], self.size, self.overlap)
+            if len(xs) * len(ys) <= self.max_tiles:
+                return work_size, xs, ys
+            scale *= 0.9
+
+    def __call__(self, image_bytes: ImageBuffer) -> Tuple[torch.Tensor, List[Box]]:
+        """→ (tensor (1 + số tile, 3, size, size) với global view ở index 0, box của từng tile)"""
+        with BufferReader(image_bytes) as reader:
+            try:
+                image = Image.open(reader)
+            except Exception:
+                raise ValueError("Invalid image format")
+            width, height = image.size
+            check_pixel_limit(width, height, self.preprocessor.max_pixels)
+            check_tiled_decode(image.format, width, height, self.max_decode_pixels)
+            work_size, xs, ys = self._work_size(width, height)
+            try:
+                if image.format == "JPEG":
+                    image.draft("RGB", work_size)
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                work = image.resize(work_size, Image.BILINEAR) if image.size != work_size else image
+                global_view = work.resize((self.size, self.size), Image.BILINEAR)
+                pixels = np.asarray(work)
+            except Exception:
+                raise ValueError("Invalid image format")
+
+        batch = np.empty((1 + len(xs) * len(ys), 3, self.size, self.size), dtype=np.float32)
+        self.preprocessor.normalize_into(np.asarray(global_view), batch[0])
+        scale_x, scale_y = width / work_size[0], height / work_size[1]
+        boxes = []
+        for y in ys:
+            for x in xs:
+                self.preprocessor.normalize_into(pixels[y:y + self.size, x:x + self.size], batch[len(boxes) + 1])
+                boxes.append((
+                    round(x * scale_x), round(y * scale_y),
+                    round((x + self.size) * scale_x), round((y + self.size) * scale_y)
+                ))
+        return torch.from_numpy(batch), boxes
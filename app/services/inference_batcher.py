@@ -0,0 +1,134 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+from app.services.ml_inference_service import MLInferenceService
+from app.services.inference_executor import InferenceExecutor
+from app.services.request_timing import NULL_TIMER
+
+
+class InferenceBatcher:
+    """
+    Gom các request predict đồng thời thành 1 batch (dynamic micro-batching)
+    - Chờ tối đa max_wait_ms hoặc đến khi đủ max_batch_size ảnh
+    - Stack thành 1 tensor, chạy 1 lần forward, trả probabilities về cho từng request
+    - Threshold được áp riêng ở từng request sau khi có kết quả (cascade dùng threshold
+      của từng ảnh để quyết định có escalate lên model đầy đủ hay không)
+    - Forward chạy trên InferenceExecutor để không block event loop
+    """
+
+    def __init__(self, ml_service: MLInferenceService, executor: InferenceExecutor,
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.ml_service = ml_service
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batches = 0
+        self._items = 0
+        self._inflight = 0
+
+    def _ensure_started(self):
+        """Khởi động worker task trên event loop hiện tại (lazy, tạo lại nếu loop đổi)"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, input_tensor: torch.Tensor, timer=NULL_TIMER,
+                     threshold: float = 0.5) -> Tuple[List[float], bool]:
+        """
+        Đưa 1 ảnh đã preprocess (3, H, W) vào hàng đợi, chờ (probabilities, full) của ảnh đó
+        `full`: kết quả của model đầy đủ (False: kết quả pass rẻ của cascade)
+        `timer` nhận thời gian chờ gom batch (batch_wait) và forward của batch chứa ảnh
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._inflight += 1
+        try:
+            await self._queue.put((input_tensor, future, timer, time.perf_counter(), threshold))
+            return await future
+        finally:
+            self._inflight -= 1
+
+    async def drain(self, timeout: float = 30.0):
+        """Chờ các request đang xử lý xong (trước khi gỡ 1 model version khỏi registry)"""
+        deadline = time.monotonic() + timeout
+        while self._inflight and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def close(self):
+        """Dừng worker task (gọi khi shutdown)"""
+        if self._worker and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+    async def _collect(self) -> List[Tuple]:
+        """Lấy request đầu tiên rồi gom thêm cho đến khi đủ batch hoặc hết max_wait"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+
+            # Bỏ các request đã bị huỷ (client ngắt kết nối) trước khi forward
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            self._batches += 1
+            self._items += len(batch)
+            forward_started_at = time.perf_counter()
+            for _, _, timer, enqueued_at, _ in batch:
+                timer.add("batch_wait", forward_started_at - enqueued_at)
+            try:
+                results = await self.executor.run(
+                    self._forward, [item[0] for item in batch], [item[4] for item in batch], admission=False
+                )
+            except Exception as e:
+                for _, future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            forward_seconds = time.perf_counter() - forward_started_at
+            for (_, future, timer, _, _), probabilities, full in zip(batch, *results):
+                timer.add("forward", forward_seconds)
+                if not future.done():
+                    future.set_result((probabilities, full))
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "batches": self._batches,
+            "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+        }
+
+    def _forward(self, tensors: List[torch.Tensor], thresholds: List[float]) -> Tuple[List[List[float]], List[bool]]:
+        return self.ml_service.forward_cascade(torch.stack(tensors), thresholds)
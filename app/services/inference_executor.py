@@ -0,0 +1,99 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class InferenceQueueFull(Exception):
+    """Hàng đợi inference đã đầy - request bị từ chối ngay (backpressure)"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full, please retry later")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Thread pool riêng cho inference (decode ảnh + forward) để không block event loop
+    - max_workers: số tác vụ inference chạy song song
+    - max_queue: số tác vụ được phép chờ; vượt quá thì raise InferenceQueueFull
+    - Ghi lại queue depth và thời gian chờ để theo dõi / sizing workers
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 64):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+
+    async def run(self, fn: Callable, *args, admission: bool = True) -> Any:
+        """
+        Chạy fn(*args) trên thread pool và chờ kết quả
+        admission=False dùng cho tác vụ nội bộ (vd: forward của batcher) - không bị từ chối
+        """
+        with self._lock:
+            if admission and self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise InferenceQueueFull(self._retry_after())
+            self._pending += 1
+
+        enqueued_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._running += 1
+            try:
+                return fn(*args)
+            finally:
+                finished_at = time.perf_counter()
+                with self._lock:
+                    wait = started_at - enqueued_at
+                    self._running -= 1
+                    self._completed += 1
+                    self._total_wait += wait
+                    self._max_wait = max(self._max_wait, wait)
+                    self._total_run += finished_at - started_at
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, task)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    @property
+    def busy(self) -> bool:
+        """Tất cả worker đang bận (có tác vụ phải xếp hàng)"""
+        return self._pending >= self.max_workers
+
+    def _retry_after(self) -> int:
+        """Ước lượng số giây cần chờ để hàng đợi vơi bớt (tối thiểu 1s)"""
+        avg_run = self._total_run / self._completed if self._completed else 0.1
+        return max(1, math.ceil(avg_run * self._pending / self.max_workers))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            completed = self._completed
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "completed": completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": (self._total_wait / completed * 1000) if completed else 0.0,
+                "max_wait_ms": self._max_wait * 1000,
+                "avg_run_ms": (self._total_run / completed * 1000) if completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
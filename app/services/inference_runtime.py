@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from app.config import get_settings
+from app.services.inference_executor import InferenceExecutor
+from app.services.model_registry import ModelRegistry
+from app.services.prediction_cache import PredictionCache
+from app.services.process_memory import process_memory
+from app.services.request_timing import NULL_TIMER
+from app.services.upload_utils import ImageBuffer
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReady(Exception):
+    """Model đang load / warm-up (hoặc load lỗi) - request nên thử lại sau"""
+
+
+class InferenceRuntime:
+    """
+    Giữ các thành phần inference của 1 worker (model registry, executor, cache) và vòng đời của chúng
+    - Import torch + load weights chạy trong lifespan ở background thread,
+      nên import app (run.py --init-db, scripts) không phải load model
+    - Warm-up vài lần forward ở các batch size cấu hình rồi mới báo ready (/ready)
+    - Thời gian cold start được đo và log theo từng stage
+    - Model version phục vụ request do ModelRegistry chọn (hot-swap, shadow / A-B)
+    """
+
+    def __init__(self):
+        self.executor = InferenceExecutor(
+            max_workers=settings.INFERENCE_WORKERS,
+            max_queue=settings.INFERENCE_MAX_QUEUE
+        )
+        self.cache = PredictionCache(
+            max_entries=settings.PREDICTION_CACHE_MAX_ENTRIES,
+            max_bytes=settings.PREDICTION_CACHE_MAX_MB * 1024 * 1024,
+            ttl_seconds=settings.PREDICTION_CACHE_TTL_SECONDS
+        ) if settings.PREDICTION_CACHE_ENABLED else None
+        self.registry = ModelRegistry(self.executor)
+        self.status = "not_started"
+        self.error: Optional[str] = None
+        self.stage_ms: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    @property
+    def ml_service(self):
+        """MLInferenceService của version đang active"""
+        return self.registry.active.ml_service if self.registry.active else None
+
+    def start(self):
+        """Bắt đầu load model ở background (gọi trong lifespan startup)"""
+        if self._task is None:
+            self.status = "loading"
+            self._task = asyncio.get_running_loop().create_task(self._startup())
+
+    async def wait_ready(self):
+        """Chờ load + warm-up xong (dùng cho scripts / benchmark)"""
+        self.start()
+        await asyncio.shield(self._task)
+        if not self.ready:
+            raise ModelNotReady(self.error or self.status)
+
+    async def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        await self.registry.close()
+        self.executor.shutdown()
+
+    async def _startup(self):
+        try:
+            slot = await asyncio.to_thread(self._load)
+            await self.registry.add(slot)
+            self.status = "ready"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            logger.exception("Model loading failed")
+
+    def _load(self):
+        started_at = stage_at = time.perf_counter()
+
+        def mark(stage: str):
+            nonlocal stage_at
+            now = time.perf_counter()
+            self.stage_ms[stage] = (now - stage_at) * 1000
+            stage_at = now
+            if stage == "load_model":
+                self.status = "warming_up"
+
+        # Import riêng để đo thời gian import torch / torchvision
+        import torch  # noqa: F401
+        import app.services.ml_inference_service  # noqa: F401
+        mark("import_torch")
+
+        slot = self.registry.load(settings.MODEL_PATH, mark)
+        self.stage_ms["total"] = (time.perf_counter() - started_at) * 1000
+
+        memory = process_memory()
+        logger.info(
+            "Cold start %.0f ms (%s)",
+            self.stage_ms["total"],
+            ", ".join(f"{stage} {ms:.0f} ms" for stage, ms in self.stage_ms.items() if stage != "total")
+        )
+        logger.info(
+            "Worker %d ready (model %s, shared weights %s): RSS %.0f MB (anon %.0f MB, file-backed %.0f MB), PSS %.0f MB",
+            memory["pid"], slot.version, settings.MODEL_SHARED_WEIGHTS, memory.get("rss_mb", 0),
+            memory.get("rss_anon_mb", 0), memory.get("rss_file_mb", 0), memory.get("pss_mb", 0)
+        )
+        return slot
+
+    def require_ready(self):
+        if not self.ready:
+            raise ModelNotReady(self.error if self.status == "failed" else f"Model is {self.status}")
+
+    @contextmanager
+    def _route(self):
+        """(slot, shadow) registry chọn cho 1 request; slot không bị unload cho đến khi request xong"""
+        self.require_ready()
+        slot, shadow = self.registry.route()
+        try:
+            yield slot, shadow
+        finally:
+            self.registry.release(slot, shadow)
+
+    async def infer(
+        self, image_bytes: ImageBuffer, timer=NULL_TIMER, raw_format: Optional[str] = None, threshold: float = 0.5
+    ) -> Tuple[List[float], str]:
+        """
+        (probabilities, model version) cho 1 ảnh: lookup cache trước,
+        miss thì decode + forward qua batcher của version được registry chọn
+        `timer` (StageTimer) nhận thời gian cache, queue, decode, transform, batch_wait, forward
+        `raw_format` ('raw' / 'npy'): frame đã decode sẵn, không qua PIL
+        `threshold`: threshold của request (cascade escalate ảnh có probability gần threshold)
+        """
+        with self._route() as (slot, shadow):
+            if self.cache:
+                with timer.stage("cache"):
+                    cache_key = PredictionCache.make_key(image_bytes, slot.version)
+                    cached = self._cache_get(slot, cache_key, threshold)
+                if cached is not None:
+                    return cached, slot.version
+
+            if timer.enabled:
+                input_tensor = await self.executor.run(
+                    self._preprocess_timed, slot.ml_service, image_bytes, raw_format, timer, time.perf_counter()
+                )
+            else:
+                input_tensor = await self.executor.run(slot.ml_service.preprocess, image_bytes, raw_format)
+            probabilities, full = await slot.batcher.submit(input_tensor, timer, threshold)
+            slot.served += 1
+            if shadow:
+                self.registry.shadow(shadow, input_tensor, probabilities, threshold)
+
+            if self.cache:
+                self.cache.put(cache_key, probabilities, full)
+            return probabilities, slot.version
+
+    async def infer_tiled(
+        self, image_bytes: ImageBuffer, merge: str = "max", timer=NULL_TIMER
+    ) -> Tuple[List[float], List[Tuple[Tuple[int, int, int, int], List[float]]], str]:
+        """
+        Tiled mode cho ảnh lớn: global view + các tile chồng lấn chạy trong 1 lần forward
+        → (probabilities đã gộp, [(box, probabilities) từng tile], model version)
+        Không qua batcher (bản thân đã là 1 batch) và không cache
+        """
+        from app.services.image_tiling import merge_probabilities
+
+        with self._route() as (slot, _):
+            with timer.stage("tile"):
+                batch, boxes = await self.executor.run(slot.ml_service.tiler, image_bytes)
+            with timer.stage("forward"):
+                probabilities = await self.executor.run(slot.ml_service.forward, batch, admission=False)
+            slot.served += 1
+            merged = merge_probabilities(probabilities, merge)
+            return merged, list(zip(boxes, probabilities[1:])), slot.version
+
+    async def infer_many(
+        self, images: List[bytes], threshold: float = 0.5
+    ) -> Tuple[List[Optional[List[float]]], List[Optional[str]], str]:
+        """
+        Probabilities cho nhiều ảnh (cùng 1 model version): cache lookup, decode các ảnh miss
+        trong 1 tác vụ executor, forward qua batcher. Ảnh lỗi có probabilities None và error tương ứng
+        """
+        with self._route() as (slot, shadow):
+            cache_keys = [PredictionCache.make_key(data, slot.version) for data in images] if self.cache else []
+            probabilities = (
+                [self._cache_get(slot, key, threshold) for key in cache_keys] if self.cache else [None] * len(images)
+            )
+            errors: List[Optional[str]] = [None] * len(images)
+            misses = [i for i, cached in enumerate(probabilities) if cached is None]
+            if not misses:
+                return probabilities, errors, slot.version
+
+            decoded = await self.executor.run(self._preprocess_all, slot.ml_service, [images[i] for i in misses])
+            pending = [(i, tensor) for i, (tensor, _) in zip(misses, decoded) if tensor is not None]
+            forwarded = await asyncio.gather(*[
+                slot.batcher.submit(tensor, threshold=threshold) for _, tensor in pending
+            ])
+            slot.served += len(pending)
+
+            for i, (_, error) in zip(misses, decoded):
+                errors[i] = error
+            for (i, tensor), (result, full) in zip(pending, forwarded):
+                probabilities[i] = result
+                if shadow:
+                    self.registry.shadow(shadow, tensor, result, threshold)
+                if self.cache:
+                    self.cache.put(cache_keys[i], result, full)
+            return probabilities, errors, slot.version
+
+    def _cache_get(self, slot, cache_key: str, threshold: float) -> Optional[List[float]]:
+        """
+        Cache lookup; kết quả của model đầy đủ luôn dùng lại được. Kết quả pass rẻ của cascade
+        chưa chắc chắn với threshold của request này (cache từ request có threshold khác) là miss
+        """
+        entry = self.cache.lookup(cache_key)
+        if entry is None:
+            return None
+        cached, full = entry
+        cascade = slot.ml_service.cascade
+        if not full and cascade is not None and not cascade.confident(cached, threshold):
+            return None
+        return cached
+
+    @staticmethod
+    def _preprocess_timed(ml_service, image_bytes: ImageBuffer, raw_format: Optional[str], timer, submitted_at: float):
+        """preprocess() tách thời gian chờ executor / decode / transform"""
+        timer.add("queue", time.perf_counter() - submitted_at)
+        if raw_format:
+            with timer.stage("transform"):
+                return ml_service.preprocess(image_bytes, raw_format)
+        with timer.stage("decode"):
+            image = ml_service.transform.decode(image_bytes)
+        with timer.stage("transform"):
+            return ml_service.transform.to_tensor(image)
+
+    @staticmethod
+    def _preprocess_all(ml_service, images: List[bytes]) -> list:
+        """Decode cả batch trong 1 tác vụ executor; ảnh lỗi trả về (None, error) thay vì raise"""
+        results = []
+        for image_bytes in images:
+            try:
+                results.append((ml_service.preprocess(image_bytes), None))
+            except ValueError as e:
+                results.append((None, str(e)))
+        return results
+
+    def stats(self) -> Dict:
+        ml_service = self.ml_service
+        return {
+            "status": self.status,
+            "model_version": ml_service.model_version if ml_service else None,
+            "backend": ml_service.backend.name if ml_service else None,
+            "precision": ml_service.precision if ml_service else None,
+            "cold_start_ms": self.stage_ms,
+            "executor": self.executor.stats(),
+            "batcher": self.registry.active.batcher.stats() if self.registry.active else None,
+            "cascade": ml_service.cascade.stats() if ml_service and ml_service.cascade else None,
+            "models": self.registry.describe(),
+            "cache": self.cache.stats() if self.cache else None,
+            "memory": process_memory()
+        }
+
+
+runtime = InferenceRuntime()
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import signal
+import socket
+import uuid
+from typing import Optional
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models.prediction_job import JobStatus
+from app.services.inference_executor import InferenceQueueFull
+from app.services.inference_runtime import ModelNotReady
+from app.services.prediction_job_service import PredictionJobService, read_inputs, validate_callback_url
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class JobWorker:
+    """
+    Xử lý prediction job nền bằng InferenceRuntime của process hiện tại
+    - Nhận job bằng lease trong DB → chạy được nhiều worker (uvicorn workers / `run.py --job-worker`)
+    - Mỗi chunk JOB_BATCH_SIZE ảnh đi qua runtime.infer_many (cache + micro-batcher),
+      nhường executor cho request online khi đang bận
+    - Tắt graceful → trả job đang chạy về hàng đợi; chết đột ngột → lease hết hạn, worker khác nhận lại
+    """
+
+    def __init__(self, runtime, worker_id: Optional[str] = None):
+        self.runtime = runtime
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.processed = 0
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Dừng sau chunk đang chạy (tối đa `timeout` giây)"""
+        self._stopping.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        logger.info("Job worker %s started", self.worker_id)
+        while not self._stopping.is_set():
+            try:
+                busy = await self._run_once()
+            except Exception:
+                logger.exception("Job worker iteration failed")
+                busy = False
+            if not busy:
+                await self._sleep(settings.JOB_POLL_SECONDS)
+
+    async def _run_once(self) -> bool:
+        """Gửi callback đang chờ, rồi nhận và chạy 1 job; False nếu không có việc"""
+        delivered = await self._deliver_callbacks()
+        if not self.runtime.ready:
+            return delivered
+        job_id = await self._db(PredictionJobService.claim_next, self.worker_id)
+        if job_id is None:
+            return delivered
+        await self._process(job_id)
+        await self._deliver_callbacks()
+        return True
+
+    async def _process(self, job_id: str):
+        logger.info("Job %s claimed by %s", job_id, self.worker_id)
+        try:
+            while True:
+                chunk = await self._db(PredictionJobService.next_chunk, job_id, self.worker_id)
+                if chunk is None:
+                    logger.warning("Job %s lease lost, stopping", job_id)
+                    return
+                if chunk["cancel_requested"]:
+                    await self._db(PredictionJobService.settle, job_id, JobStatus.CANCELLED, None, self.worker_id)
+                    return
+                if not chunk["items"]:
+                    await self._db(PredictionJobService.settle, job_id, JobStatus.SUCCEEDED, None, self.worker_id)
+                    logger.info("Job %s finished", job_id)
+                    return
+                if self._stopping.is_set():
+                    await self._db(PredictionJobService.requeue, job_id, self.worker_id)
+                    return
+                results, model_version = await self._infer_chunk(chunk)
+                if results is None:
+                    continue
+                saved = await self._db(PredictionJobService.save_chunk, job_id, self.worker_id, results, model_version)
+                if not saved:
+                    logger.warning("Job %s lease lost, chunk discarded", job_id)
+                    return
+                self.processed += len(results)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            settled = await self._db(PredictionJobService.settle, job_id, JobStatus.FAILED,
+                                     f"Inference failed: {e}", self.worker_id)
+            if settled is None:
+                logger.warning("Job %s already settled or lease lost, quota not released", job_id)
+
+    async def _infer_chunk(self, chunk):
+        """Kết quả từng item của chunk, hoặc (None, None) nếu cần thử lại sau (queue đầy / đang đổi model)"""
+        item_ids = [item_id for item_id, _ in chunk["items"]]
+        images = await asyncio.to_thread(read_inputs, [path for _, path in chunk["items"]])
+        present = [i for i, data in enumerate(images) if data is not None]
+
+        # Job là traffic nền: chờ executor rảnh để không chiếm chỗ của request online
+        while self.runtime.executor.busy and not self._stopping.is_set():
+            await asyncio.sleep(0.05)
+        try:
+            probabilities, errors, model_version = await self.runtime.infer_many(
+                [images[i] for i in present], chunk["threshold"]
+            )
+        except InferenceQueueFull as e:
+            await self._sleep(e.retry_after)
+            return None, None
+        except ModelNotReady:
+            await self._sleep(settings.JOB_POLL_SECONDS)
+            return None, None
+
+        results = [
+            {"id": item_id, "probabilities": None, "active": None, "error": "Input file missing"}
+            for item_id in item_ids
+        ]
+        ml_service = self.runtime.ml_service
+        for i, image_probabilities, error in zip(present, probabilities, errors):
+            if image_probabilities is None:
+                results[i]["error"] = error
+                continue
+            result = ml_service.postprocess(image_probabilities, chunk["threshold"])
+            results[i].update(probabilities=result["probabilities"], active=result["active"], error=None)
+        return results, model_version
+
+    async def _deliver_callbacks(self) -> bool:
+        """Gửi các callback đang chờ (at-least-once, ký HMAC nếu có JOB_CALLBACK_SECRET)"""
+        delivered = False
+        while not self._stopping.is_set():
+            claimed = await self._db(PredictionJobService.claim_callback, self.worker_id)
+            if claimed is None:
+                return delivered
+            url, payload = claimed
+            ok = await self._post_callback(url, payload)
+            await self._db(PredictionJobService.finish_callback, payload["id"], ok)
+            delivered = True
+        return delivered
+
+    async def _post_callback(self, url: str, payload: dict) -> bool:
+        import httpx
+
+        try:
+            await asyncio.to_thread(validate_callback_url, url)
+        except ValueError as e:
+            logger.warning("Callback for job %s refused: %s", payload["id"], e)
+            return False
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json"}
+        if settings.JOB_CALLBACK_SECRET:
+            signature = hmac.new(settings.JOB_CALLBACK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Job-Signature"] = f"sha256={signature}"
+        async with httpx.AsyncClient(timeout=settings.JOB_CALLBACK_TIMEOUT) as client:
+            for attempt in range(settings.JOB_CALLBACK_RETRIES + 1):
+                try:
+                    response = await client.post(url, content=body, headers=headers)
+                    if response.status_code < 300:
+                        return True
+                    logger.warning("Callback for job %s returned %d", payload["id"], response.status_code)
+                except httpx.HTTPError as e:
+                    logger.warning("Callback for job %s failed: %s", payload["id"], e)
+                if attempt < settings.JOB_CALLBACK_RETRIES:
+                    await self._sleep(2 ** attempt)
+        return False
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    @staticmethod
+    async def _db(method, *args):
+        """Gọi 1 method của PredictionJobService với session riêng trong thread (không block event loop)"""
+        def call():
+            db = SessionLocal()
+            try:
+                return method(PredictionJobService(db), *args)
+            finally:
+                db.close()
+        return await asyncio.to_thread(call)
+
+    def stats(self) -> dict:
+        return {"worker_id": self.worker_id, "running": self._task is not None, "processed": self.processed}
+
+
+async def run_standalone():
+    """Process worker riêng (`run.py --job-worker`): load model, xử lý job đến khi nhận SIGINT / SIGTERM"""
+    from app.database import init_db
+    from app.services.inference_runtime import runtime
+
+    init_db()
+    worker = JobWorker(runtime)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker._stopping.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await runtime.wait_ready()
+        await worker.run()
+    finally:
+        await runtime.close()
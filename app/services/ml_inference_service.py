@@ -1,14 +1,30 @@
 import torch
 import torch.nn as nn
-import torchvision.transforms as transforms
 from torchvision import models
-from PIL import Image
-from typing import List, Dict
-import io
+from typing import List, Dict, Optional, Tuple
+import hashlib
+import logging
 
 from app.config import get_settings
+from app.services.image_preprocessing import ImagePreprocessor
+from app.services.image_tiling import ImageTiler
+from app.services.cascade_inference import CascadeStage
+from app.services.upload_utils import ImageBuffer
+from app.services.model_backends import build_backend
+from app.services.model_precision import build_precision_model
+from app.services.cpu_settings import apply_cpu_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: str) -> str:
+    """Hash nội dung file weights (dùng làm model version / key cho cache)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
 class MultilabelMobileNetV2(nn.Module):
@@ -37,11 +53,18 @@ class MultilabelMobileNetV2(nn.Module):
 class MLInferenceService:
     """Service load model AI và thực hiện inference (detect dangerous objects)"""
     
-    def __init__(self):
+    def __init__(self, model_path: Optional[str] = None):
+        apply_cpu_settings()
+        self.model_path = model_path or settings.MODEL_PATH
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model = None
+        self.backend = None
         self.transform = None
+        self.tiler = None
+        self.cascade: Optional[CascadeStage] = None
         self.class_names = settings.MODEL_CLASSES
+        self.model_version = None
+        self.precision = "fp32"
         self._load_model()
     
     def _load_model(self):
@@ -50,41 +73,107 @@ class MLInferenceService:
             # Tạo model với cùng kiến trúc như lúc training
             self.model = MultilabelMobileNetV2(num_classes=len(self.class_names), pretrained=False)
             
+            # Model version = hash nội dung weights (đổi file .pth → version mới)
+            weights_hash = file_sha256(self.model_path)
+            self.model_version = weights_hash[:12]
+            
             # Load state dict
-            state_dict = torch.load(settings.MODEL_PATH, map_location=self.device)
-            self.model.load_state_dict(state_dict)
+            if settings.MODEL_SHARED_WEIGHTS and self.device.type == "cpu":
+                self._load_shared_weights()
+            else:
+                state_dict = torch.load(self.model_path, map_location=self.device)
+                self.model.load_state_dict(state_dict)
             
             self.model.to(self.device)
             self.model.eval()
             
-            # Transform giống như trong notebook (validation transform)
-            self.transform = transforms.Compose([
-                transforms.Resize((settings.MODEL_IMG_SIZE, settings.MODEL_IMG_SIZE)),
-                transforms.ToTensor(),
-                transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-            ])
+            # Transform tương đương validation transform trong notebook (decode nhanh bằng JPEG draft)
+            self.transform = ImagePreprocessor(settings.MODEL_IMG_SIZE, max_pixels=settings.MAX_IMAGE_PIXELS)
+            # Tiled mode cho ảnh độ phân giải cao (vật thể nhỏ)
+            self.tiler = ImageTiler(
+                self.transform, settings.TILED_MAX_SIDE, settings.TILE_OVERLAP, settings.TILED_MAX_TILES,
+                settings.TILED_MAX_DECODE_PIXELS
+            )
+            
+            # Precision mode (int8 / bf16 / channels_last), bị từ chối nếu drift vượt budget
+            serving_model = build_precision_model(
+                self.model, settings.MODEL_PRECISION, settings.MODEL_CHANNELS_LAST,
+                settings.MODEL_CALIBRATION_DIR, self.transform, self.class_names,
+                settings.MODEL_DRIFT_BUDGET, settings.MODEL_MAX_FLIP_RATE
+            ) if self.device.type == "cpu" else self.model
+            backend_name = settings.MODEL_BACKEND
+            if serving_model is not self.model:
+                self.precision = settings.MODEL_PRECISION
+                if backend_name != "eager":
+                    logger.warning("MODEL_PRECISION=%s only runs on the eager backend, ignoring MODEL_BACKEND=%s",
+                                   self.precision, backend_name)
+                    backend_name = "eager"
+            
+            # Backend tối ưu (TorchScript / ONNX Runtime), artifact cache theo hash weights
+            self.backend = build_backend(
+                backend_name, serving_model, self.device, weights_hash,
+                settings.MODEL_ARTIFACT_DIR, settings.MODEL_IMG_SIZE, settings.MODEL_BACKEND_TOLERANCE
+            )
+            
+            # Cascade: pass rẻ cùng network ở độ phân giải thấp, chỉ ảnh chưa chắc chắn mới chạy model đầy đủ
+            if settings.CASCADE_ENABLED:
+                if 32 <= settings.CASCADE_IMG_SIZE < settings.MODEL_IMG_SIZE:
+                    cascade_backend = build_backend(
+                        backend_name, serving_model, self.device, weights_hash, settings.MODEL_ARTIFACT_DIR,
+                        settings.CASCADE_IMG_SIZE, settings.MODEL_BACKEND_TOLERANCE
+                    )
+                    self.cascade = CascadeStage(cascade_backend, settings.CASCADE_IMG_SIZE, settings.CASCADE_MARGIN)
+                else:
+                    logger.warning("CASCADE_IMG_SIZE=%d must be in [32, MODEL_IMG_SIZE), cascade disabled",
+                                   settings.CASCADE_IMG_SIZE)
         except Exception as e:
             raise RuntimeError(f"Failed to load ML model: {e}")
     
-    def predict(self, image_bytes: bytes, threshold: float = 0.5) -> Dict:
-        """Dự đoán dangerous objects trong ảnh (trả về classes, probabilities, active classes)"""
+    def _load_shared_weights(self):
+        """
+        mmap file weights (read-only, MAP_PRIVATE) và gán thẳng tensor vào model (assign=True)
+        → các worker dùng chung page cache của file thay vì mỗi worker 1 bản copy
+        """
+        try:
+            state_dict = torch.load(self.model_path, map_location="cpu", mmap=True, weights_only=True)
+        except RuntimeError as e:
+            # File .pth định dạng cũ (không phải zip) không mmap được
+            logger.warning("Cannot mmap %s (%s), loading a private copy", self.model_path, e)
+            state_dict = torch.load(self.model_path, map_location="cpu")
+        self.model.load_state_dict(state_dict, assign=True)
+    
+    def preprocess(self, image_bytes: ImageBuffer, raw_format: Optional[str] = None) -> torch.Tensor:
+        """
+        Decode ảnh và transform thành tensor (3, H, W) - chưa có chiều batch
+        raw_format ('raw' / 'npy'): frame đã decode sẵn, bỏ qua decode và normalize trực tiếp
+        """
         if not self.model or not self.transform:
             raise RuntimeError("Model not loaded")
         
-        # Load and preprocess image
-        try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        except Exception:
-            raise ValueError("Invalid image format")
-        
-        input_tensor = self.transform(image).unsqueeze(0).to(self.device)
-        
-        # Inference
-        with torch.no_grad():
-            logits = self.model(input_tensor)
-            probabilities = torch.sigmoid(logits).cpu().numpy()[0].tolist()
+        if raw_format:
+            return self.transform.from_raw(image_bytes, raw_format)
+        return self.transform(image_bytes)
+    
+    def forward(self, batch: torch.Tensor) -> List[List[float]]:
+        """Chạy 1 lần forward cho cả batch (N, 3, H, W), trả về sigmoid probabilities cho từng ảnh"""
+        if not self.backend:
+            raise RuntimeError("Model not loaded")
         
-        # Filter active classes
+        logits = self.backend(batch)
+        return torch.sigmoid(logits.float()).cpu().numpy().tolist()
+    
+    def forward_cascade(self, batch: torch.Tensor, thresholds: List[float]) -> Tuple[List[List[float]], List[bool]]:
+        """
+        forward() qua cascade nếu bật (CASCADE_ENABLED): ảnh chắc chắn dùng kết quả pass rẻ,
+        ảnh có probability gần threshold của request chạy lại bằng model đầy đủ
+        → (probabilities, True nếu ảnh đó có kết quả của model đầy đủ)
+        """
+        if self.cascade is None:
+            return self.forward(batch), [True] * len(batch)
+        return self.cascade.run(batch, thresholds, self.forward)
+    
+    def postprocess(self, probabilities: List[float], threshold: float = 0.5) -> Dict:
+        """Áp threshold lên probabilities của 1 ảnh (threshold riêng cho từng request)"""
         active_classes = [
             cls for cls, prob in zip(self.class_names, probabilities)
             if prob >= threshold
@@ -95,4 +184,9 @@ class MLInferenceService:
             "probabilities": probabilities,
             "active": active_classes
         }
-
+    
+    def predict(self, image_bytes: bytes, threshold: float = 0.5) -> Dict:
+        """Dự đoán dangerous objects trong ảnh (trả về classes, probabilities, active classes)"""
+        input_tensor = self.preprocess(image_bytes).unsqueeze(0)
+        probabilities = self.forward(input_tensor)[0]
+        return self.postprocess(probabilities, threshold)
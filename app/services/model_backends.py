@@ -0,0 +1,143 @@
+import copy
+import inspect
+import logging
+import os
+from pathlib import Path
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "torchscript", "onnxruntime")
+
+
+class EagerBackend:
+    """Chạy trực tiếp nn.Module (eager mode)"""
+
+    name = "eager"
+
+    def __init__(self, model: nn.Module, device: torch.device):
+        self.model = model
+        self.device = device
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.model(batch.to(self.device))
+
+
+class TorchScriptBackend:
+    """TorchScript (trace + freeze), artifact .pt được cache trên disk"""
+
+    name = "torchscript"
+
+    def __init__(self, model: nn.Module, device: torch.device, artifact_path: Path, img_size: int):
+        self.device = device
+        if artifact_path.exists():
+            logger.info("Loading TorchScript artifact %s", artifact_path)
+            self.module = torch.jit.load(str(artifact_path), map_location=device)
+        else:
+            logger.info("Exporting TorchScript artifact %s", artifact_path)
+            example = torch.zeros(1, 3, img_size, img_size, device=device)
+            with torch.no_grad():
+                traced = torch.jit.freeze(torch.jit.trace(model, example))
+            _atomic_save(artifact_path, lambda tmp: torch.jit.save(traced, str(tmp)))
+            self.module = traced
+        self.module.eval()
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.module(batch.to(self.device))
+
+
+class OnnxRuntimeBackend:
+    """ONNX Runtime (CPU), artifact .onnx được cache trên disk"""
+
+    name = "onnxruntime"
+
+    def __init__(self, model: nn.Module, artifact_path: Path, img_size: int):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("MODEL_BACKEND=onnxruntime requires `pip install onnxruntime onnx`")
+
+        if not artifact_path.exists():
+            logger.info("Exporting ONNX artifact %s", artifact_path)
+            example = torch.zeros(1, 3, img_size, img_size)
+            cpu_model = model if next(model.parameters()).device.type == "cpu" else copy.deepcopy(model).cpu()
+            # torch >= 2.5 mặc định dùng dynamo exporter; giữ exporter TorchScript cho dynamic batch
+            extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+            _atomic_save(artifact_path, lambda tmp: torch.onnx.export(
+                cpu_model, example, str(tmp),
+                input_names=["input"], output_names=["logits"],
+                dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                **extra
+            ))
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            str(artifact_path), options, providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        outputs = self.session.run(["logits"], {"input": batch.cpu().contiguous().numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+def _atomic_save(path: Path, save_fn):
+    """Ghi artifact ra file tạm rồi rename (nhiều worker export cùng lúc không đọc phải file dở)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        save_fn(tmp)
+        tmp.replace(path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def max_probability_drift(reference, candidate, img_size: int, batch_size: int = 4) -> float:
+    """Sai lệch sigmoid probability lớn nhất giữa 2 backend trên cùng 1 input ngẫu nhiên"""
+    generator = torch.Generator().manual_seed(0)
+    batch = torch.randn(batch_size, 3, img_size, img_size, generator=generator)
+    expected = torch.sigmoid(reference(batch).float().cpu())
+    actual = torch.sigmoid(candidate(batch).float().cpu())
+    return (expected - actual).abs().max().item()
+
+
+def build_backend(name: str, model: nn.Module, device: torch.device, weights_hash: str,
+                  artifact_dir: str, img_size: int, tolerance: float):
+    """
+    Tạo backend theo tên (eager / torchscript / onnxruntime)
+    - Artifact lưu tại artifact_dir, key = hash nội dung weights + torch version + img size
+    - Kiểm tra output khớp eager trong tolerance; không khớp hoặc lỗi → fallback về eager
+    """
+    eager = EagerBackend(model, device)
+    if name == "eager":
+        return eager
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown MODEL_BACKEND '{name}'. Choose one of {BACKENDS}")
+
+    suffix = "pt" if name == "torchscript" else "onnx"
+    torch_version = torch.__version__.split("+")[0]
+    artifact_path = Path(artifact_dir) / f"{weights_hash[:16]}-{img_size}-torch{torch_version}.{suffix}"
+
+    try:
+        if name == "torchscript":
+            backend = TorchScriptBackend(model, device, artifact_path, img_size)
+        else:
+            backend = OnnxRuntimeBackend(model, artifact_path, img_size)
+        drift = max_probability_drift(eager, backend, img_size)
+    except Exception as e:
+        logger.warning("Backend %s unavailable (%s), falling back to eager", name, e)
+        return eager
+
+    if drift > tolerance:
+        logger.warning("Backend %s drift %.2e exceeds tolerance %.2e, falling back to eager",
+                       name, drift, tolerance)
+        artifact_path.unlink(missing_ok=True)
+        return eager
+
+    logger.info("Serving with backend %s (max drift vs eager %.2e)", name, drift)
+    return backend
@@ -0,0 +1,168 @@
+import copy
+import csv
+import logging
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+from app.services.image_preprocessing import ImagePreprocessor
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = ("fp32", "int8_dynamic", "int8_static", "bf16")
+SAMPLE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+class PrecisionModel(nn.Module):
+    """Bọc model đã quantize / channels_last / bf16 autocast, output luôn là fp32 logits"""
+
+    def __init__(self, model: nn.Module, channels_last: bool = False, bf16: bool = False):
+        super().__init__()
+        self.model = model
+        self.channels_last = channels_last
+        self.bf16 = bf16
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        autocast = torch.autocast("cpu", dtype=torch.bfloat16) if self.bf16 else nullcontext()
+        with autocast:
+            return self.model(x).float()
+
+
+def bf16_supported() -> bool:
+    """CPU có hỗ trợ bf16 qua oneDNN (AVX512-BF16 / AMX) hay không"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def load_samples(sample_dir: str, preprocessor: ImagePreprocessor, limit: int = 256) -> Tuple[List[str], torch.Tensor]:
+    """Đọc tối đa `limit` ảnh mẫu trong thư mục (bỏ qua ảnh lỗi), trả về (tên file, tensor N×3×H×W)"""
+    names, tensors = [], []
+    for path in sorted(Path(sample_dir).rglob("*")):
+        if len(tensors) >= limit:
+            break
+        if path.suffix.lower() not in SAMPLE_EXTENSIONS:
+            continue
+        try:
+            tensors.append(preprocessor(path.read_bytes()))
+            names.append(str(path.relative_to(sample_dir)))
+        except ValueError:
+            continue
+    if not tensors:
+        raise ValueError(f"No sample images found in {sample_dir}")
+    return names, torch.stack(tensors)
+
+
+def load_labels(labels_path: str) -> Dict[str, List[str]]:
+    """labels.csv: mỗi dòng `filename,class1;class2` (class active của ảnh)"""
+    labels = {}
+    with open(labels_path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if row and not row[0].startswith("#"):
+                labels[row[0]] = [c for c in (row[1] if len(row) > 1 else "").split(";") if c]
+    return labels
+
+
+def apply_precision(model: nn.Module, mode: str, channels_last: bool = False,
+                    calibration: Optional[torch.Tensor] = None, batch_size: int = 16) -> nn.Module:
+    """
+    Tạo bản model theo precision mode (model gốc fp32 không bị thay đổi)
+    - int8_dynamic: quantize động các lớp Linear
+    - int8_static: FX graph mode quantization, calibrate trên ảnh mẫu
+    - bf16: autocast bf16 (chỉ khi CPU hỗ trợ)
+    """
+    if mode not in PRECISIONS:
+        raise ValueError(f"Unknown MODEL_PRECISION '{mode}'. Choose one of {PRECISIONS}")
+
+    candidate = copy.deepcopy(model).eval()
+    bf16 = False
+
+    if mode == "int8_dynamic":
+        candidate = torch.ao.quantization.quantize_dynamic(candidate, {nn.Linear}, dtype=torch.qint8)
+    elif mode == "int8_static":
+        if calibration is None:
+            raise ValueError("int8_static requires calibration images (MODEL_CALIBRATION_DIR)")
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+        torch.backends.quantized.engine = engine
+        prepared = prepare_fx(candidate, get_default_qconfig_mapping(engine), (calibration[:1],))
+        with torch.no_grad():
+            for batch in calibration.split(batch_size):
+                prepared(batch)
+        candidate = convert_fx(prepared)
+        # Model quantized không dùng channels_last được
+        channels_last = False
+    elif mode == "bf16":
+        if not bf16_supported():
+            raise ValueError("bf16 is not supported on this CPU")
+        bf16 = True
+
+    if channels_last:
+        candidate = candidate.to(memory_format=torch.channels_last)
+
+    return PrecisionModel(candidate, channels_last=channels_last, bf16=bf16).eval()
+
+
+def compare_precision(reference: nn.Module, candidate: nn.Module, samples: torch.Tensor,
+                      class_names: List[str], threshold: float = 0.5, batch_size: int = 16) -> Dict:
+    """So sánh candidate với fp32: drift probability lớn nhất/trung bình và số ảnh bị đổi `active` classes"""
+    with torch.no_grad():
+        expected = torch.cat([torch.sigmoid(reference(b).float()) for b in samples.split(batch_size)])
+        actual = torch.cat([torch.sigmoid(candidate(b).float()) for b in samples.split(batch_size)])
+
+    drift = (expected - actual).abs()
+    flips = ((expected >= threshold) != (actual >= threshold))
+    flipped_images = flips.any(dim=1)
+    return {
+        "samples": samples.shape[0],
+        "max_drift": drift.max().item(),
+        "mean_drift": drift.mean().item(),
+        "flipped_images": int(flipped_images.sum().item()),
+        "flips_per_class": {name: int(flips[:, i].sum().item()) for i, name in enumerate(class_names)},
+        "reference_probabilities": expected,
+        "candidate_probabilities": actual,
+    }
+
+
+def build_precision_model(model: nn.Module, mode: str, channels_last: bool, sample_dir: str,
+                          preprocessor: ImagePreprocessor, class_names: List[str],
+                          drift_budget: float, max_flip_rate: float) -> nn.Module:
+    """
+    Bật precision mode cho model đang serve, có guardrail:
+    đo drift trên ảnh mẫu (hoặc input ngẫu nhiên nếu không có MODEL_CALIBRATION_DIR),
+    vượt budget hoặc lỗi → giữ nguyên model fp32
+    """
+    if mode == "fp32" and not channels_last:
+        return model
+
+    try:
+        if sample_dir:
+            _, samples = load_samples(sample_dir, preprocessor)
+        else:
+            generator = torch.Generator().manual_seed(0)
+            samples = torch.randn(8, 3, preprocessor.size, preprocessor.size, generator=generator)
+        candidate = apply_precision(model, mode, channels_last, calibration=samples if sample_dir else None)
+        report = compare_precision(model, candidate, samples, class_names)
+    except Exception as e:
+        logger.warning("Precision mode %s unavailable (%s), serving fp32", mode, e)
+        return model
+
+    flip_rate = report["flipped_images"] / report["samples"]
+    if report["max_drift"] > drift_budget or flip_rate > max_flip_rate:
+        logger.warning(
+            "Precision mode %s refused: max drift %.4f (budget %.4f), flip rate %.3f (budget %.3f)",
+            mode, report["max_drift"], drift_budget, flip_rate, max_flip_rate
+        )
+        return model
+
+    logger.info("Serving precision mode %s (channels_last=%s, max drift %.4f, flips %d/%d)",
+                mode, channels_last, report["max_drift"], report["flipped_images"], report["samples"])
+    return candidate
@@ -0,0 +1,277 @@
+import asyncio
+import io
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+from app.services.inference_executor import InferenceExecutor
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CANDIDATE_MODES = ("shadow", "ab")
+
+
+class ModelSlot:
+    """1 model version đã load + warm-up, có batcher riêng (forward không lẫn batch giữa các version)"""
+
+    def __init__(self, ml_service, batcher, path: str):
+        self.ml_service = ml_service
+        self.batcher = batcher
+        self.path = path
+        self.version = ml_service.model_version
+        self.loaded_at = datetime.utcnow()
+        self.served = 0
+        self.in_use = 0  # request đã được route vào slot và chưa xong (kể cả đang decode / chờ shadow)
+        # So sánh shadow với version đang active (cùng ảnh)
+        self.shadow_compared = 0
+        self.shadow_skipped = 0
+        self.shadow_flips = 0
+        self.shadow_max_drift = 0.0
+        self._shadow_total_drift = 0.0
+
+    def record_shadow(self, primary: List[float], shadow: List[float], threshold: float):
+        """Drift lớn nhất giữa 2 version; flip: tập nhãn >= threshold (của request) khác nhau"""
+        drift = max(abs(a - b) for a, b in zip(primary, shadow))
+        self.shadow_compared += 1
+        self.shadow_max_drift = max(self.shadow_max_drift, drift)
+        self._shadow_total_drift += drift
+        if [p >= threshold for p in primary] != [p >= threshold for p in shadow]:
+            self.shadow_flips += 1
+
+    async def drain(self, timeout: float = 30.0):
+        """Chờ các request đã route vào slot xong (kể cả chưa submit vào batcher), rồi chờ batcher"""
+        deadline = time.monotonic() + timeout
+        while self.in_use and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        if self.in_use:
+            logger.warning("Model %s still has %d routed request(s) after %.0fs", self.version, self.in_use, timeout)
+        await self.batcher.drain(max(0.0, deadline - time.monotonic()))
+
+    def describe(self) -> Dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at.isoformat(),
+            "backend": self.ml_service.backend.name,
+            "precision": self.ml_service.precision,
+            "served": self.served,
+            "shadow": {
+                "compared": self.shadow_compared,
+                "skipped": self.shadow_skipped,
+                "flips": self.shadow_flips,
+                "max_drift": self.shadow_max_drift,
+                "mean_drift": self._shadow_total_drift / self.shadow_compared if self.shadow_compared else 0.0,
+            },
+        }
+
+
+def warm_up(ml_service, mark: Optional[Callable[[str], None]] = None):
+    """Decode 1 ảnh JPEG + forward ở từng batch size để cấp phát sẵn buffer / chọn kernel"""
+    from PIL import Image
+
+    mark = mark or (lambda stage: None)
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (127, 127, 127)).save(buffer, "JPEG")
+    input_tensor = ml_service.preprocess(buffer.getvalue())
+    mark("warmup_decode")
+
+    for batch_size in settings.INFERENCE_WARMUP_BATCH_SIZES:
+        batch = input_tensor.unsqueeze(0).expand(batch_size, -1, -1, -1).contiguous()
+        ml_service.forward(batch)
+        if ml_service.cascade:
+            ml_service.cascade.forward(batch)
+        mark(f"warmup_batch_{batch_size}")
+
+
+class ModelRegistry:
+    """
+    Các model version đang nằm trong RAM của worker và version nào nhận traffic
+    - Load version mới ở background thread (load + warm-up), xong mới đổi `active` → không downtime,
+      request đang chạy trên version cũ vẫn hoàn tất trên batcher của version đó
+    - Candidate: version thứ 2 nhận `candidate_percent`% traffic
+      + shadow: vẫn trả kết quả của active, candidate chạy song song để so drift / flips
+      + ab: request được chọn trả kết quả của candidate
+    - Giữ tối đa MODEL_MAX_RESIDENT version, version cũ nhất không dùng bị gỡ
+    """
+
+    def __init__(self, executor: InferenceExecutor):
+        self.executor = executor
+        self.slots: Dict[str, ModelSlot] = {}
+        self.active: Optional[ModelSlot] = None
+        self.candidate: Optional[ModelSlot] = None
+        self.candidate_mode = "shadow"
+        self.candidate_percent = 0.0
+        self.loading: Dict[str, Dict] = {}
+        self._tasks = set()
+
+    def load(self, path: str, mark: Optional[Callable[[str], None]] = None) -> ModelSlot:
+        """Load + warm-up 1 file weights (blocking - gọi trong thread)"""
+        from app.services.ml_inference_service import MLInferenceService
+        from app.services.inference_batcher import InferenceBatcher
+
+        ml_service = MLInferenceService(path)
+        if mark:
+            mark("load_model")
+        warm_up(ml_service, mark)
+        batcher = InferenceBatcher(
+            ml_service,
+            self.executor,
+            max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+            max_wait_ms=settings.INFERENCE_MAX_WAIT_MS
+        )
+        return ModelSlot(ml_service, batcher, path)
+
+    def start_load(self, path: str, activate: bool = False):
+        """Load version mới ở background; trạng thái xem ở `loading` / describe()"""
+        if not os.path.isfile(path):
+            raise ValueError(f"Model file not found: {path}")
+        if self.loading.get(path, {}).get("status") == "loading":
+            raise ValueError(f"Model {path} is already loading")
+        self.loading[path] = {"status": "loading", "activate": activate}
+        task = asyncio.get_running_loop().create_task(self._load_in_background(path, activate))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load_in_background(self, path: str, activate: bool):
+        started_at = time.perf_counter()
+        try:
+            slot = await asyncio.to_thread(self.load, path)
+        except Exception as e:
+            logger.exception("Loading model %s failed", path)
+            self.loading[path] = {"status": "failed", "error": str(e)}
+            return
+        slot = await self.add(slot)
+        self.loading.pop(path, None)
+        logger.info("Model %s (%s) loaded in %.0f ms", slot.version, path, (time.perf_counter() - started_at) * 1000)
+        if activate:
+            self.activate(slot.version)
+
+    async def add(self, slot: ModelSlot) -> ModelSlot:
+        """Đăng ký version đã load (cùng weights hash → dùng lại slot cũ), gỡ bớt version thừa"""
+        existing = self.slots.get(slot.version)
+        if existing:
+            return existing
+        self.slots[slot.version] = slot
+        if self.active is None:
+            self.active = slot
+        await self._evict()
+        return slot
+
+    async def _evict(self):
+        idle = sorted(
+            (slot for slot in self.slots.values() if slot is not self.active and slot is not self.candidate),
+            key=lambda slot: slot.loaded_at
+        )
+        while len(self.slots) > max(1, settings.MODEL_MAX_RESIDENT) and idle:
+            await self.unload(idle.pop(0).version)
+
+    def get(self, version: str) -> ModelSlot:
+        slot = self.slots.get(version)
+        if slot is None:
+            raise ValueError(f"Model version {version} is not loaded")
+        return slot
+
+    def activate(self, version: str) -> ModelSlot:
+        """Chuyển toàn bộ traffic sang version đã load (đổi 1 tham chiếu trên event loop → atomic)"""
+        slot = self.get(version)
+        previous, self.active = self.active, slot
+        if self.candidate is slot:
+            self.clear_candidate()
+        logger.info("Serving model %s (previous %s)", slot.version, previous.version if previous else None)
+        return slot
+
+    def set_candidate(self, version: str, mode: str, percent: float) -> ModelSlot:
+        if mode not in CANDIDATE_MODES:
+            raise ValueError(f"Invalid mode {mode!r}, expected one of {CANDIDATE_MODES}")
+        if not 0.0 <= percent <= 100.0:
+            raise ValueError("Percent must be in [0, 100]")
+        slot = self.get(version)
+        if slot is self.active:
+            raise ValueError(f"Model {version} is already active")
+        self.candidate, self.candidate_mode, self.candidate_percent = slot, mode, percent
+        return slot
+
+    def clear_candidate(self):
+        self.candidate, self.candidate_percent = None, 0.0
+
+    async def unload(self, version: str):
+        """Gỡ version không còn dùng (chờ request đang chạy trên version đó xong)"""
+        slot = self.get(version)
+        if slot is self.active:
+            raise ValueError("Cannot unload the active model")
+        if slot is self.candidate:
+            self.clear_candidate()
+        self.slots.pop(version, None)
+        await slot.drain()
+        await slot.batcher.close()
+        logger.info("Unloaded model %s", version)
+
+    def route(self) -> Tuple[ModelSlot, Optional[ModelSlot]]:
+        """
+        Chọn (slot trả kết quả, slot chạy shadow hoặc None) cho 1 request
+        Các slot được chọn tính là đang dùng cho đến release() → unload chờ request đó xong
+        """
+        active, candidate = self.active, self.candidate
+        if candidate is None or random.random() * 100 >= self.candidate_percent:
+            routed = active, None
+        elif self.candidate_mode == "ab":
+            routed = candidate, None
+        else:
+            routed = active, candidate
+        for slot in routed:
+            if slot:
+                slot.in_use += 1
+        return routed
+
+    @staticmethod
+    def release(*slots: Optional[ModelSlot]):
+        for slot in slots:
+            if slot:
+                slot.in_use -= 1
+
+    def shadow(self, slot: ModelSlot, input_tensor, primary: List[float], threshold: float):
+        """
+        Chạy candidate trên cùng tensor ở background, không ảnh hưởng latency của request
+        Flip được tính theo threshold của request (đúng nhãn client nhận được)
+        """
+        if self.executor.busy:
+            # Đang quá tải → ưu tiên traffic thật, bỏ qua lần so sánh này
+            slot.shadow_skipped += 1
+            return
+        slot.in_use += 1
+        task = asyncio.get_running_loop().create_task(self._compare(slot, input_tensor, primary, threshold))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _compare(self, slot: ModelSlot, input_tensor, primary: List[float], threshold: float):
+        try:
+            probabilities, _ = await slot.batcher.submit(input_tensor, threshold=threshold)
+            slot.record_shadow(primary, probabilities, threshold)
+        except Exception:
+            slot.shadow_skipped += 1
+        finally:
+            slot.in_use -= 1
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        for slot in self.slots.values():
+            await slot.batcher.close()
+
+    def describe(self) -> Dict:
+        return {
+            "active": self.active.version if self.active else None,
+            "candidate": {
+                "version": self.candidate.version,
+                "mode": self.candidate_mode,
+                "percent": self.candidate_percent,
+            } if self.candidate else None,
+            "max_resident": settings.MODEL_MAX_RESIDENT,
+            "versions": [slot.describe() for slot in self.slots.values()],
+            "loading": self.loading,
+        }
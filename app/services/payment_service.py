@@ -9,6 +9,7 @@ from app.config import get_settings
 from app.repositories.user_repository import UserRepository
 from app.repositories.transaction_repository import TransactionRepository
 from app.models.transaction import TransactionType, TransactionStatus
+from app.services.subscription_service import SubscriptionService
 
 settings = get_settings()
 
@@ -149,6 +150,7 @@ class PaymentService:
                 momo_transaction_id=str(ipn_data.get("transId")),
             )
             self.user_repo.update_credits(tx.user_id, tx.amount)
+            SubscriptionService(self.db).invalidate_subscription(tx.user_id)
             return True
         else:
             self.transaction_repo.update_status(tx.id, TransactionStatus.FAILED)
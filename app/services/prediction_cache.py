@@ -0,0 +1,91 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Ước lượng bộ nhớ cho 1 entry: key + tuple float + overhead OrderedDict
+_ENTRY_OVERHEAD_BYTES = 200
+_FLOAT_BYTES = 32
+
+
+class PredictionCache:
+    """
+    Cache LRU + TTL cho kết quả predict, key = hash(bytes ảnh) + model version
+    - Lưu probabilities thô để áp threshold bất kỳ sau khi lookup, kèm cờ `full`
+      (kết quả model đầy đủ hay pass rẻ của cascade)
+    - Giới hạn theo số entry và theo bộ nhớ ước lượng (evict LRU khi vượt)
+    - Đếm hit/miss/eviction để theo dõi
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[float, ...], bool, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_version: str) -> str:
+        return f"{hashlib.blake2b(image_bytes, digest_size=16).hexdigest()}:{model_version}"
+
+    def get(self, key: str) -> Optional[List[float]]:
+        entry = self.lookup(key)
+        return entry[0] if entry else None
+
+    def lookup(self, key: str) -> Optional[Tuple[List[float], bool]]:
+        """(probabilities, full) hoặc None nếu miss / hết hạn"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            expires_at, probabilities, full, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return list(probabilities), full
+
+    def put(self, key: str, probabilities: List[float], full: bool = True):
+        size = _ENTRY_OVERHEAD_BYTES + len(key) + _FLOAT_BYTES * len(probabilities)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, tuple(probabilities), full, size)
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str):
+        _, _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
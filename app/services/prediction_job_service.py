@@ -0,0 +1,265 @@
+import ipaddress
+import json
+import os
+import shutil
+import socket
+import uuid
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.prediction_job import PredictionJob, JobStatus, CallbackStatus
+from app.repositories.prediction_job_repository import PredictionJobRepository, TERMINAL_STATUSES
+from app.services.subscription_service import SubscriptionService
+from app.services.upload_utils import IMAGE_EXTENSIONS, is_archive, iter_archive_images
+
+settings = get_settings()
+
+
+class JobQuotaExceeded(Exception):
+    """Không đủ quota để reserve cho toàn bộ ảnh của job"""
+
+
+def validate_callback_url(url: str):
+    """
+    Chặn SSRF qua callback_url: chỉ http(s); host trong JOB_CALLBACK_ALLOWED_HOSTS được cho qua,
+    host khác phải resolve ra toàn địa chỉ public (không loopback / private / link-local / metadata)
+    Gọi lúc submit và lại ngay trước khi gửi (DNS có thể đã đổi). Raise ValueError nếu không hợp lệ
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url must be an http(s) URL")
+    host = parts.hostname.lower()
+    allowed = {h.strip().lower() for h in settings.JOB_CALLBACK_ALLOWED_HOSTS.split(",") if h.strip()}
+    if host in allowed:
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)}
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"callback_url host cannot be resolved: {host}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"callback_url host is not a public address: {host}")
+
+
+def job_dir(job_id: str) -> str:
+    return os.path.join(settings.JOB_STORAGE_DIR, job_id)
+
+
+def stage_inputs(job_id: str, files: List[Tuple[str, Optional[str], BinaryIO]]) -> List[Tuple[str, str]]:
+    """
+    Ghi ảnh đầu vào của job ra JOB_STORAGE_DIR/<job_id>/ (archive được giải nén từng ảnh,
+    không load cả archive vào RAM) → [(filename, path)] theo thứ tự xử lý
+    Raise ValueError nếu archive hỏng, quá JOB_MAX_IMAGES hoặc không có ảnh nào
+    """
+    directory = job_dir(job_id)
+    os.makedirs(directory, exist_ok=True)
+    items = []
+
+    def write(filename: str, data: bytes):
+        if len(items) >= settings.JOB_MAX_IMAGES:
+            raise ValueError(f"Too many images in job (max {settings.JOB_MAX_IMAGES})")
+        extension = os.path.splitext(filename)[1].lower()
+        path = os.path.join(directory, f"{len(items):06d}{extension if extension in IMAGE_EXTENSIONS else ''}")
+        with open(path, "wb") as f:
+            f.write(data)
+        items.append((filename, path))
+
+    try:
+        for filename, content_type, fileobj in files:
+            if is_archive(filename, content_type):
+                # Giới hạn tổng số ảnh của job được kiểm tra trong write()
+                for name, data in iter_archive_images(filename, fileobj, settings.JOB_MAX_IMAGES + 1):
+                    write(name, data)
+            else:
+                fileobj.seek(0)
+                write(filename, fileobj.read())
+        if not items:
+            raise ValueError("No images in job")
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return items
+
+
+def read_inputs(paths: List[str]) -> List[Optional[bytes]]:
+    """Đọc ảnh của 1 chunk (None nếu file đã mất)"""
+    images = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                images.append(f.read())
+        except OSError:
+            images.append(None)
+    return images
+
+
+class PredictionJobService:
+    """
+    Prediction job chạy nền (archive lớn vượt timeout của 1 request HTTP)
+    - Submit: ghi ảnh ra disk, reserve quota cho toàn bộ ảnh, lưu job + item vào DB
+    - Worker (JobWorker, trong process API hoặc `run.py --job-worker`) nhận job bằng lease,
+      lưu kết quả sau mỗi chunk → restart thì chạy tiếp từ item chưa xong
+    - Kết thúc: settle quota (trả lại phần ảnh lỗi / chưa chạy), xoá ảnh đầu vào, gửi callback
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.job_repo = PredictionJobRepository(db)
+        self.subscription_service = SubscriptionService(db)
+
+    @staticmethod
+    def new_job_id() -> str:
+        return uuid.uuid4().hex
+
+    def submit(self, job_id: str, user_id: int, items: List[Tuple[str, str]], threshold: float,
+               callback_url: Optional[str] = None) -> PredictionJob:
+        """
+        Reserve quota cho len(items) ảnh và tạo job (ảnh đã được stage_inputs ghi ra disk)
+        QUOTA_LEDGER_ENABLED: phần reserve được ghi xuống DB trước khi tạo job, vì settle trả quota
+        thẳng vào DB (cùng transaction với trạng thái job, có thể ở process `--job-worker` khác)
+        → refund không bị kẹp ở 0 rồi bị +N của lần flush sau tính lại
+        """
+        reservation = self.subscription_service.reserve_quota(user_id, len(items))
+        if not reservation.allowed:
+            shutil.rmtree(job_dir(job_id), ignore_errors=True)
+            raise JobQuotaExceeded(reservation.reason)
+        try:
+            self.subscription_service.persist_reservation(user_id, reservation.subscription_id, reservation.count)
+        except Exception:
+            self.db.rollback()
+            reservation.release()
+            shutil.rmtree(job_dir(job_id), ignore_errors=True)
+            raise
+        job = PredictionJob(
+            id=job_id,
+            user_id=user_id,
+            subscription_id=reservation.subscription_id,
+            threshold=threshold,
+            callback_url=callback_url
+        )
+        try:
+            return self.job_repo.create(job, items)
+        except Exception:
+            self.db.rollback()
+            reservation.release()
+            shutil.rmtree(job_dir(job_id), ignore_errors=True)
+            raise
+
+    def get_job(self, job_id: str, user_id: int) -> Optional[PredictionJob]:
+        return self.job_repo.get_for_user(job_id, user_id)
+
+    def list_jobs(self, user_id: int, limit: int = 50) -> List[PredictionJob]:
+        return self.job_repo.get_by_user(user_id, limit)
+
+    def get_results(self, job: PredictionJob, offset: int = 0, limit: int = 100) -> List[Dict]:
+        return [
+            {
+                "filename": item.filename,
+                "probabilities": json.loads(item.probabilities) if item.probabilities else None,
+                "active": json.loads(item.active) if item.active else None,
+                "error": item.error,
+            }
+            for item in self.job_repo.get_items(job.id, offset, limit)
+        ]
+
+    def cancel(self, job_id: str, user_id: int) -> PredictionJob:
+        """Job đang chờ → huỷ ngay; đang chạy → worker dừng sau chunk hiện tại"""
+        job = self.job_repo.get_for_user(job_id, user_id)
+        if not job:
+            raise ValueError("Job not found")
+        if job.status in TERMINAL_STATUSES:
+            raise ValueError(f"Job already {job.status.value}")
+        if job.status == JobStatus.QUEUED:
+            settled = self.settle(job.id, JobStatus.CANCELLED)
+            if settled:
+                return settled
+            self.db.refresh(job)
+        return self.job_repo.request_cancel(job)
+
+    # --- Worker ---
+
+    def claim_next(self, worker_id: str) -> Optional[str]:
+        now = datetime.utcnow()
+        for job_id in self.job_repo.claimable_ids(now):
+            if self.job_repo.claim(job_id, worker_id, now, settings.JOB_LEASE_SECONDS):
+                return job_id
+        return None
+
+    def next_chunk(self, job_id: str, worker_id: str) -> Optional[Dict]:
+        """Trạng thái job + các item chưa xử lý tiếp theo (None nếu job không còn do worker này giữ)"""
+        job = self.job_repo.get_by_id(job_id)
+        if not job or job.worker_id != worker_id or job.status != JobStatus.RUNNING:
+            return None
+        items = self.job_repo.get_pending_items(job_id, settings.JOB_BATCH_SIZE)
+        return {
+            "threshold": job.threshold,
+            "cancel_requested": job.cancel_requested,
+            "items": [(item.id, item.path) for item in items],
+        }
+
+    def save_chunk(self, job_id: str, worker_id: str, results: List[Dict], model_version: str) -> bool:
+        for item in results:
+            item["probabilities"] = json.dumps(item["probabilities"]) if item["probabilities"] is not None else None
+            item["active"] = json.dumps(item["active"]) if item["active"] is not None else None
+        return self.job_repo.save_chunk(job_id, results, model_version, worker_id, settings.JOB_LEASE_SECONDS)
+
+    def requeue(self, job_id: str, worker_id: str):
+        """Worker tắt (graceful) → trả job về hàng đợi để worker khác / lần chạy sau nhận ngay"""
+        self.job_repo.requeue(job_id, worker_id)
+
+    def settle(self, job_id: str, status: JobStatus, error: Optional[str] = None,
+               worker_id: Optional[str] = None) -> Optional[PredictionJob]:
+        """
+        Kết thúc job: chỉ tính quota cho ảnh predict thành công, trả lại phần còn lại
+        worker_id: worker đang giữ lease (None: huỷ job đang chờ)
+        Trạng thái job và quota được commit trong cùng 1 transaction, chỉ khi job chưa kết thúc và
+        vẫn do worker_id giữ → None (không trả quota) nếu job đã được settle / nhận bởi worker khác
+        """
+        job = self.job_repo.get_by_id(job_id)
+        if not job or not self.job_repo.finish(job, status, error, worker_id):
+            self.db.rollback()
+            return None
+        self.subscription_service.release_quota(job.subscription_id, job.total - job.succeeded, commit=False)
+        self.db.commit()
+        self.db.refresh(job)
+        self.subscription_service.invalidate_subscription(job.user_id)
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
+        return job
+
+    def claim_callback(self, worker_id: str) -> Optional[Dict]:
+        job = self.job_repo.claim_callback(worker_id, datetime.utcnow(), settings.JOB_LEASE_SECONDS)
+        if not job:
+            return None
+        payload = describe_job(job)
+        payload.pop("callback_status")
+        return job.callback_url, payload
+
+    def finish_callback(self, job_id: str, delivered: bool):
+        self.job_repo.update_callback_status(
+            job_id, CallbackStatus.DELIVERED if delivered else CallbackStatus.FAILED
+        )
+
+
+def describe_job(job: PredictionJob) -> Dict:
+    """Thông tin job (response GET /api/v1/jobs/{id} và body callback)"""
+    return {
+        "id": job.id,
+        "status": job.status.value,
+        "total": job.total,
+        "processed": job.processed,
+        "succeeded": job.succeeded,
+        "failed": job.processed - job.succeeded,
+        "threshold": job.threshold,
+        "model_version": job.model_version,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "callback_status": job.callback_status.value if job.callback_status else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,26 @@
+import os
+from typing import Dict
+
+_STATUS_FIELDS = {"VmRSS": "rss_mb", "RssAnon": "rss_anon_mb", "RssFile": "rss_file_mb", "RssShmem": "rss_shmem_mb"}
+
+
+def process_memory() -> Dict[str, float]:
+    """
+    Bộ nhớ của process hiện tại (Linux /proc), đơn vị MB
+    - rss_file_mb: trang map từ file (vd weights mmap) - dùng chung giữa các worker
+    - pss_mb: RSS chia đều phần dùng chung → tổng PSS các worker = RAM thực tế
+    """
+    memory = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in _STATUS_FIELDS:
+                    memory[_STATUS_FIELDS[key]] = int(value.split()[0]) / 1024
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    memory["pss_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return memory
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, case, select
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models.subscription import Subscription
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    subscription_id: int
+    monthly_quota: int
+    used: int  # used_quota trong DB lúc đọc (chưa gồm phần pending)
+    expires_at: Optional[datetime]
+    loaded_at: float
+
+
+class QuotaLedger:
+    """
+    Đếm quota trong RAM, ghi dồn (write-behind) vào subscriptions.used_quota
+    - Cache giới hạn subscription hiện tại của từng user (TTL QUOTA_LEDGER_TTL_SECONDS, không quá expires_at)
+    - check / reserve / release chỉ đổi bộ đếm trong RAM, không ghi DB trên đường request
+    - Flusher ghi các delta gộp theo subscription bằng 1 bulk UPDATE mỗi QUOTA_LEDGER_FLUSH_MS
+      hoặc khi đủ QUOTA_LEDGER_FLUSH_EVENTS thay đổi, và khi shutdown
+    - Crash → mất tối đa phần chưa flush (≈ 1 chu kỳ flush); nhiều worker → mỗi worker thấy
+      usage của worker khác sau lần flush / reload tiếp theo, có thể vượt quota trong khoảng đó
+    """
+
+    def __init__(self, flush_ms: int = 500, flush_events: int = 200, ttl_seconds: float = 30.0):
+        self.flush_ms = flush_ms
+        self.flush_events = flush_events
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._users: Dict[int, _Entry] = {}
+        self._pending: Dict[int, int] = {}  # subscription_id → delta chưa flush
+        self._in_flight: Dict[int, int] = {}  # delta đang được flush (chưa commit)
+        self._events = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._flushes = 0
+        self._flushed_events = 0
+        self._flush_errors = 0
+
+    @property
+    def active(self) -> bool:
+        """Chỉ dùng ledger khi flusher đang chạy (process API); script / job worker riêng ghi thẳng DB"""
+        return self._task is not None
+
+    # --- Request path ---
+
+    def check(self, user_id: int, count: int, loader: Callable[[], Optional[Subscription]]) -> Dict:
+        entry = self._entry(user_id, loader)
+        if entry is None:
+            return {"allowed": False, "reason": "No active subscription", "remaining": 0}
+        with self._lock:
+            remaining = self._remaining(entry)
+        return quota_result(entry.subscription_id, remaining, count)
+
+    def reserve(self, user_id: int, count: int,
+                loader: Callable[[], Optional[Subscription]]) -> Tuple[Optional[int], int, Optional[str]]:
+        """Giữ `count` lượt nếu đủ quota → (subscription_id hoặc None, remaining, reason)"""
+        entry = self._entry(user_id, loader)
+        if entry is None:
+            return None, 0, "No active subscription"
+        with self._lock:
+            remaining = self._remaining(entry)
+            if remaining < count:
+                result = quota_result(entry.subscription_id, remaining, count)
+                return None, result["remaining"], result["reason"]
+            self._add(entry.subscription_id, count)
+        return entry.subscription_id, remaining - count, None
+
+    def add(self, subscription_id: int, delta: int):
+        """Cộng (hoặc trả lại nếu âm) usage của subscription, ghi DB ở lần flush sau"""
+        if delta:
+            with self._lock:
+                self._add(subscription_id, delta)
+
+    def invalidate(self, user_id: int):
+        """Bỏ giới hạn đã cache của user (mua / huỷ gói, hết hạn, quota đổi ngoài ledger)"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def _entry(self, user_id: int, loader: Callable[[], Optional[Subscription]]) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._users.get(user_id)
+        now = time.monotonic()
+        if entry and now - entry.loaded_at < self.ttl_seconds and (
+            entry.expires_at is None or entry.expires_at >= datetime.utcnow()
+        ):
+            return entry
+        # Miss / hết TTL / subscription hết hạn: loader (get_active_subscription) xử lý hết hạn → FREE
+        subscription = loader()
+        if subscription is None:
+            self.invalidate(user_id)
+            return None
+        entry = _Entry(subscription.id, subscription.monthly_quota, subscription.used_quota,
+                       subscription.expires_at, now)
+        with self._lock:
+            self._users[user_id] = entry
+        return entry
+
+    def _remaining(self, entry: _Entry) -> int:
+        used = entry.used + self._pending.get(entry.subscription_id, 0) \
+            + self._in_flight.get(entry.subscription_id, 0)
+        return entry.monthly_quota - used
+
+    def _add(self, subscription_id: int, delta: int):
+        self._pending[subscription_id] = self._pending.get(subscription_id, 0) + delta
+        self._events += 1
+        if self._events >= self.flush_events and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # --- Flusher ---
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Dừng flusher và ghi nốt phần pending (lifespan shutdown)"""
+        if self._task:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+            self._loop = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("Quota ledger flush failed, retrying next cycle")
+
+    def flush(self) -> int:
+        """
+        Ghi các delta đang pending bằng 1 bulk UPDATE (executemany), rồi đọc lại used_quota
+        của các subscription đó (gồm usage do worker khác ghi) → số subscription đã ghi
+        Lỗi → delta được gộp lại vào pending để thử lại lần sau
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            events, self._events = self._events, 0
+            self._in_flight = batch
+        rows = [{"sid": subscription_id, "delta": delta} for subscription_id, delta in batch.items() if delta]
+        table = Subscription.__table__
+        db = SessionLocal()
+        try:
+            if rows:
+                new_used = table.c.used_quota + bindparam("delta")
+                db.execute(
+                    table.update().where(table.c.id == bindparam("sid")).values(
+                        used_quota=case((new_used < 0, 0), else_=new_used)
+                    ),
+                    rows
+                )
+            db.commit()
+            used = dict(db.execute(
+                select(table.c.id, table.c.used_quota).where(table.c.id.in_(list(batch)))
+            ).all())
+        except Exception:
+            db.rollback()
+            with self._lock:
+                for subscription_id, delta in batch.items():
+                    self._pending[subscription_id] = self._pending.get(subscription_id, 0) + delta
+                self._events += events
+                self._in_flight = {}
+                self._flush_errors += 1
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            self._in_flight = {}
+            for entry in self._users.values():
+                if entry.subscription_id in used:
+                    entry.used = used[entry.subscription_id]
+            self._flushes += 1
+            self._flushed_events += events
+        return len(rows)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "active": self.active,
+                "cached_users": len(self._users),
+                "pending_subscriptions": len(self._pending),
+                "pending_events": self._events,
+                "flushes": self._flushes,
+                "flushed_events": self._flushed_events,
+                "flush_errors": self._flush_errors,
+            }
+
+
+def quota_result(subscription_id: int, remaining: int, count: int) -> Dict:
+    """Kết quả check_quota chung cho đường DB và ledger"""
+    result = {
+        "allowed": remaining >= count,
+        "remaining": max(remaining, 0),
+        "subscription_id": subscription_id,
+    }
+    if remaining <= 0:
+        result["reason"] = "Quota exceeded"
+    elif remaining < count:
+        result["reason"] = f"Insufficient quota: {count} requested, {remaining} remaining"
+    return result
+
+
+quota_ledger = QuotaLedger(
+    flush_ms=settings.QUOTA_LEDGER_FLUSH_MS,
+    flush_events=settings.QUOTA_LEDGER_FLUSH_EVENTS,
+    ttl_seconds=settings.QUOTA_LEDGER_TTL_SECONDS,
+)
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models.subscription import PlanType
+from app.repositories.subscription_repository import SubscriptionRepository
+from app.services.subscription_cache import SubscriptionSnapshot, subscription_cache
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    limit: int  # dung lượng bucket (burst)
+    remaining: int  # số request còn gửi được ngay
+    reset_seconds: int  # thời gian đến khi bucket đầy lại
+    retry_after: int  # thời gian đến khi có lại 1 token (chỉ dùng khi bị chặn)
+
+
+class MemoryBucketStore:
+    """Token bucket trong RAM của process (1 worker, hoặc khi không cần chia sẻ giữa worker)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, key: str, rate: float, capacity: float, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, max(updated, now))
+            return allowed, tokens
+
+
+class SQLiteBucketStore:
+    """
+    Token bucket trong 1 file SQLite dùng chung giữa các uvicorn worker trên cùng máy
+    - Mỗi lần take là 1 transaction BEGIN IMMEDIATE (đọc + ghi bucket nguyên tử giữa các process)
+    - WAL + synchronous=OFF: state tạm, mất khi crash cũng không sao (bucket đầy lại)
+    """
+
+    PRUNE_EVERY = 10000  # Xoá bucket không dùng > 1 giờ sau mỗi N lần take
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._calls = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rate: float, capacity: float, now: float) -> Tuple[bool, float]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            # `now` được lấy trước khi chờ lock: không lùi `updated` (tránh tính refill 2 lần)
+            conn.execute(
+                "INSERT INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, max(row[1], now) if row else now)
+            )
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM rate_limit_buckets WHERE updated < ?", (now - 3600,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens
+
+
+class RateLimiter:
+    """
+    Giới hạn tốc độ request theo user bằng token bucket, tốc độ / burst theo gói (RATE_LIMIT_<PLAN>_*)
+    - Gói của user lấy từ subscription_cache (chỉ query DB khi miss, cache bị xoá khi mua / huỷ gói)
+    - Lỗi store (vd SQLite bị khoá quá lâu) → cho qua (fail open), không chặn traffic hợp lệ
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.rates = {
+            PlanType.FREE: (settings.RATE_LIMIT_FREE_PER_SECOND, settings.RATE_LIMIT_FREE_BURST),
+            PlanType.PLUS: (settings.RATE_LIMIT_PLUS_PER_SECOND, settings.RATE_LIMIT_PLUS_BURST),
+            PlanType.PRO: (settings.RATE_LIMIT_PRO_PER_SECOND, settings.RATE_LIMIT_PRO_BURST),
+        }
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._limited = 0
+        self._errors = 0
+
+    async def check(self, user_id: int) -> Optional[RateLimitDecision]:
+        """Lấy 1 token của user → quyết định (None nếu store lỗi)"""
+        plan = await self.plan_for(user_id)
+        rate, capacity = self.rates.get(plan, self.rates[PlanType.FREE])
+        try:
+            allowed, tokens = await asyncio.to_thread(
+                self.store.take, f"user:{user_id}", rate, capacity, time.time()
+            )
+        except Exception as e:
+            logger.warning("Rate limit store failed, allowing request: %s", e)
+            with self._lock:
+                self._errors += 1
+            return None
+        with self._lock:
+            if allowed:
+                self._allowed += 1
+            else:
+                self._limited += 1
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=int(capacity),
+            remaining=int(tokens),
+            reset_seconds=math.ceil((capacity - tokens) / rate),
+            retry_after=max(1, math.ceil((1 - tokens) / rate)),
+        )
+
+    async def plan_for(self, user_id: int) -> PlanType:
+        snapshot = subscription_cache.get(user_id)
+        if snapshot is None:
+            snapshot = await asyncio.to_thread(self._load_snapshot, user_id)
+        return snapshot.plan if snapshot else PlanType.FREE
+
+    @staticmethod
+    def _load_snapshot(user_id: int) -> Optional[SubscriptionSnapshot]:
+        """Miss: đọc subscription hiện tại (không ghi DB, hết hạn thì tính như FREE và không cache)"""
+        db = SessionLocal()
+        try:
+            subscription = SubscriptionRepository(db).get_active_by_user(user_id)
+        finally:
+            db.close()
+        if not subscription or (subscription.expires_at and subscription.expires_at < datetime.utcnow()):
+            return None
+        return subscription_cache.put(user_id, subscription)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": type(self.store).__name__,
+                "allowed": self._allowed,
+                "limited": self._limited,
+                "store_errors": self._errors,
+            }
+
+
+@lru_cache()
+def get_rate_limiter() -> RateLimiter:
+    """RateLimiter của process (tạo lần đầu khi dùng: file SQLite chỉ được mở khi RATE_LIMIT_ENABLED)"""
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        store = MemoryBucketStore()
+    elif settings.RATE_LIMIT_BACKEND == "sqlite":
+        store = SQLiteBucketStore(settings.RATE_LIMIT_DB_PATH)
+    else:
+        raise ValueError("RATE_LIMIT_BACKEND must be 'sqlite' or 'memory'")
+    return RateLimiter(store)
@@ -0,0 +1,137 @@
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+
+settings = get_settings()
+
+# Bucket (giây) cho histogram thời gian từng stage
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class StageHistograms:
+    """
+    Histogram thời gian theo stage (định dạng Prometheus text, scrape ở /metrics)
+    - Số liệu nằm trong từng worker process (mỗi worker 1 bộ, scrape theo từng worker / cộng ở Prometheus)
+    """
+
+    def __init__(self, name: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+
+    def observe(self, stages: Dict[str, float]):
+        """Ghi 1 request: {stage: giây}"""
+        with self._lock:
+            for stage, seconds in stages.items():
+                counts = self._counts.get(stage)
+                if counts is None:
+                    counts = self._counts[stage] = [0] * (len(self.buckets) + 1)
+                    self._sums[stage] = 0.0
+                counts[bisect.bisect_left(self.buckets, seconds)] += 1
+                self._sums[stage] += seconds
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} Time spent in each stage of a prediction request",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for stage in sorted(self._counts):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), self._counts[stage]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{self.name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{stage="{stage}"}} {self._sums[stage]}')
+                lines.append(f'{self.name}_count{{stage="{stage}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+predict_histograms = StageHistograms("predict_stage_duration_seconds")
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "started_at")
+
+    def __init__(self, timer: "StageTimer", name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.started_at)
+        return False
+
+
+class StageTimer:
+    """
+    Đo thời gian các stage của 1 request (read, quota, decode, forward, db...)
+    - Stage lặp lại được cộng dồn; add() gọi được từ thread inference
+    - header() → giá trị Server-Timing, finish() → ghi vào histogram
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def header(self) -> str:
+        total = time.perf_counter() - self.started_at
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+    def finish(self, histograms: StageHistograms = predict_histograms) -> str:
+        """Ghi histogram và trả về header Server-Timing"""
+        header = self.header()
+        histograms.observe({**self.stages, "total": time.perf_counter() - self.started_at})
+        return header
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTimer:
+    """Timer khi METRICS_ENABLED=false: mọi thao tác là no-op (không gọi perf_counter, không cấp phát)"""
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name: str) -> _NullStage:
+        return self._stage
+
+    def add(self, name: str, seconds: float):
+        pass
+
+    def finish(self, histograms: StageHistograms = predict_histograms) -> Optional[str]:
+        return None
+
+
+NULL_TIMER = NullTimer()
+
+
+def request_timer():
+    """StageTimer mới cho 1 request, hoặc NULL_TIMER dùng chung khi tắt metrics"""
+    return StageTimer() if settings.METRICS_ENABLED else NULL_TIMER
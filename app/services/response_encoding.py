@@ -0,0 +1,95 @@
+import json
+from typing import Dict, List, Optional, Sequence
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # Optional: JSON nhanh hơn, fallback stdlib json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional: chỉ cần khi client gửi Accept: application/msgpack
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+# quantize=true: probability → số nguyên 0..QUANTIZE_SCALE (client chia lại cho QUANTIZE_SCALE)
+QUANTIZE_SCALE = 255
+
+# Key của compact response (mô tả ở GET /api/v1/metadata)
+COMPACT_KEYS = {
+    "f": "batch: filename từng ảnh (member của archive) theo cùng thứ tự với p / a / e",
+    "p": "probabilities theo thứ tự classes (batch: 1 list / ảnh, null nếu lỗi)",
+    "a": "index các class vượt threshold (batch: 1 list / ảnh)",
+    "e": "batch: lỗi của từng ảnh (null nếu thành công)",
+    "t": "tiled mode: [[x0, y0, x1, y1, [probabilities]], ...] các tile vượt threshold",
+    "v": "model version",
+    "q": "quota còn lại",
+}
+
+
+class EncodingNotAvailable(Exception):
+    """Client yêu cầu định dạng mà server chưa cài thư viện (vd msgpack)"""
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """'msgpack' nếu header Accept ưu tiên msgpack hơn JSON, ngược lại 'json'"""
+    if not accept or "msgpack" not in accept:
+        return "json"
+    best, best_q = "json", -1.0
+    for item in accept.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in MSGPACK_MEDIA_TYPES:
+            encoding = "msgpack"
+        elif media_type in ("application/json", "application/*", "*/*"):
+            encoding = "json"
+        else:
+            continue
+        # Cùng q thì ưu tiên msgpack (client đã chủ động khai báo)
+        if q > best_q or (q == best_q and encoding == "msgpack"):
+            best, best_q = encoding, q
+    return best
+
+
+def check_available(encoding: str):
+    if encoding == "msgpack" and msgpack is None:
+        raise EncodingNotAvailable("msgpack is not installed on this server")
+
+
+def encode_response(payload, encoding: str = "json", headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Serialize payload (dict / list đơn giản) bằng msgpack hoặc orjson (fallback json stdlib)
+    - msgpack dùng float32 (probabilities vốn là float32) → 5 byte / số thay vì 9
+    """
+    if encoding == "msgpack":
+        check_available(encoding)
+        body = msgpack.packb(payload, use_single_float=True)
+        return Response(content=body, media_type="application/msgpack", headers=headers)
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def shape_probabilities(probabilities: Sequence[float], precision: Optional[int] = None,
+                        quantize: bool = False) -> List:
+    """Làm tròn `precision` chữ số hoặc quantize về int 0..255 (giảm kích thước response)"""
+    if quantize:
+        return [round(p * QUANTIZE_SCALE) for p in probabilities]
+    if precision is not None:
+        return [round(p, precision) for p in probabilities]
+    return list(probabilities)
+
+
+def active_indices(class_names: Sequence[str], active: Sequence[str]) -> List[int]:
+    active = set(active)
+    return [i for i, name in enumerate(class_names) if name in active]
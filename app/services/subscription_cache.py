@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.config import get_settings
+from app.models.subscription import PlanType, Subscription, SubscriptionStatus
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class SubscriptionSnapshot:
+    """Phần ít thay đổi của subscription hiện tại (không có used_quota: luôn đọc từ DB / quota ledger)"""
+    subscription_id: int
+    plan: PlanType
+    status: SubscriptionStatus
+    monthly_quota: int
+    expires_at: Optional[datetime]
+
+    @classmethod
+    def of(cls, subscription: Subscription) -> "SubscriptionSnapshot":
+        return cls(subscription.id, subscription.plan, subscription.status,
+                   subscription.monthly_quota, subscription.expires_at)
+
+    def matches(self, subscription: Subscription) -> bool:
+        return (self.subscription_id, self.plan, self.status, self.monthly_quota, self.expires_at) == (
+            subscription.id, subscription.plan, subscription.status,
+            subscription.monthly_quota, subscription.expires_at
+        )
+
+
+class SubscriptionCache:
+    """
+    Cache subscription hiện tại của từng user trong process (thay cho query OR status + ORDER BY
+    created_at của get_active_by_user trên mỗi request)
+    - Hết hạn sau SUBSCRIPTION_CACHE_TTL_SECONDS, không bao giờ quá expires_at của subscription
+    - Xoá ngay khi mua / huỷ gói, subscription hết hạn, IPN thanh toán (SubscriptionService.invalidate_subscription)
+    - Worker khác đổi subscription / tạo subscription mới hơn: SubscriptionService đọc lại row mới nhất
+      từ id của snapshot và bỏ snapshot không còn khớp
+    - Đầy max_entries → bỏ user ít dùng gần đây nhất (LRU), không xoá cả cache
+    Đánh đổi: chỉ plan của rate limiter là không cần DB. Hit ở get_active_subscription vẫn tốn 1 query
+    theo id (cần used_quota mới nhất và để thấy gói do worker khác tạo), reserve_quota vẫn là 1 câu UPDATE
+    (theo id của snapshot thay vì subquery) → so với không cache chỉ rẻ hơn ở dạng query, không bớt round-trip
+    """
+
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 100000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[SubscriptionSnapshot, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+
+    def get(self, user_id: int) -> Optional[SubscriptionSnapshot]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, user_id: int, subscription: Subscription) -> SubscriptionSnapshot:
+        snapshot = SubscriptionSnapshot.of(subscription)
+        ttl = self.ttl_seconds
+        if snapshot.expires_at is not None:
+            ttl = min(ttl, (snapshot.expires_at - datetime.utcnow()).total_seconds())
+        if ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (snapshot, time.monotonic() + ttl)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > max(1, self.max_entries):
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        return snapshot
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self._invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "evictions": self._evictions,
+            }
+
+
+subscription_cache = SubscriptionCache(
+    ttl_seconds=settings.SUBSCRIPTION_CACHE_TTL_SECONDS,
+    max_entries=settings.SUBSCRIPTION_CACHE_MAX_ENTRIES,
+)
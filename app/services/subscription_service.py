@@ -8,6 +8,8 @@ from app.repositories.subscription_repository import SubscriptionRepository
 from app.repositories.transaction_repository import TransactionRepository
 from app.models.subscription import Subscription, PlanType, SubscriptionStatus
 from app.models.transaction import TransactionType, TransactionStatus
+from app.services.quota_ledger import quota_ledger, quota_result
+from app.services.subscription_cache import subscription_cache
 
 settings = get_settings()
 
@@ -38,7 +40,7 @@ class SubscriptionService:
         - CANCELLED subscription: User vẫn dùng đến hết hạn
         - EXPIRED: Tự động chuyển về FREE
         """
-        subscription = self.subscription_repo.get_active_by_user(user_id)
+        subscription = self._current_subscription(user_id)
         now = datetime.utcnow()
         
         # Handle expired subscriptions
@@ -46,6 +48,7 @@ class SubscriptionService:
             # Auto-downgrade to FREE if was ACTIVE or CANCELLED
             if subscription.status in (SubscriptionStatus.ACTIVE, SubscriptionStatus.CANCELLED):
                 self.subscription_repo.update_status(subscription.id, SubscriptionStatus.EXPIRED)
+                self.invalidate_subscription(user_id)
                 return self.subscription_repo.create(
                     user_id=user_id, plan=PlanType.FREE,
                     monthly_quota=settings.PLAN_FREE_MONTHLY_QUOTA
@@ -53,6 +56,24 @@ class SubscriptionService:
         
         return subscription
     
+    def _current_subscription(self, user_id: int) -> Optional[Subscription]:
+        """
+        Subscription hiện tại qua subscription_cache: hit → đọc row mới nhất từ id của snapshot trở đi
+        (used_quota mới nhất); worker khác đã đổi row hoặc tạo subscription mới hơn, hoặc miss
+        → get_active_by_user và cache lại
+        """
+        snapshot = subscription_cache.get(user_id)
+        if snapshot:
+            subscription = self.subscription_repo.get_latest_since(user_id, snapshot.subscription_id)
+            if subscription and snapshot.matches(subscription):
+                return subscription
+            subscription_cache.invalidate(user_id)
+        
+        subscription = self.subscription_repo.get_active_by_user(user_id)
+        if subscription:
+            subscription_cache.put(user_id, subscription)
+        return subscription
+    
     def purchase_plan(self, user_id: int, plan: str) -> Subscription:
         """Mua gói PLUS/PRO bằng credits trong ví (30 ngày)"""
         if plan not in ("plus", "pro"):
@@ -100,10 +121,12 @@ class SubscriptionService:
         if current_subscription:
             self.subscription_repo.update_status(current_subscription.id, SubscriptionStatus.CANCELLED)
         
-        return self.subscription_repo.create(
+        subscription = self.subscription_repo.create(
             user_id=user_id, plan=plan_type, monthly_quota=plan_details["quota"],
             expires_at=datetime.utcnow() + timedelta(days=30)
         )
+        self.invalidate_subscription(user_id)
+        return subscription
     
     def cancel_subscription(self, user_id: int) -> Subscription:
         """
@@ -120,6 +143,7 @@ class SubscriptionService:
         
         # Mark as cancelled - user can still use until expires_at
         self.subscription_repo.update_status(current_subscription.id, SubscriptionStatus.CANCELLED)
+        self.invalidate_subscription(user_id)
         
         return current_subscription  # Return cancelled subscription
     
@@ -129,24 +153,123 @@ class SubscriptionService:
         if subscription and subscription.expires_at and subscription.status == SubscriptionStatus.ACTIVE:
             if subscription.expires_at < datetime.utcnow():
                 self.subscription_repo.update_status(subscription.id, SubscriptionStatus.EXPIRED)
+                self.invalidate_subscription(user_id)
     
-    def check_quota(self, user_id: int) -> dict:
-        """Kiểm tra user còn quota để gọi API hay không"""
+    def check_quota(self, user_id: int, count: int = 1) -> dict:
+        """
+        Kiểm tra user còn đủ quota cho `count` lượt gọi API hay không
+        QUOTA_LEDGER_ENABLED: trả lời từ bộ đếm trong RAM (không query DB khi đã cache)
+        """
+        if quota_ledger.active:
+            return quota_ledger.check(user_id, count, lambda: self.get_active_subscription(user_id))
+        
         subscription = self.get_active_subscription(user_id)
         
         if not subscription:
             return {"allowed": False, "reason": "No active subscription", "remaining": 0}
         
-        remaining = subscription.monthly_quota - subscription.used_quota
+        return quota_result(subscription.id, subscription.monthly_quota - subscription.used_quota, count)
+    
+    def increment_usage(self, subscription_id: int, count: int = 1):
+        """Tăng số lần đã dùng API (dùng sau mỗi lần predict, hoặc 1 lần cho cả batch)"""
+        if count > 0:
+            if quota_ledger.active:
+                quota_ledger.add(subscription_id, count)
+            else:
+                self.subscription_repo.increment_usage(subscription_id, count)
+    
+    def persist_reservation(self, user_id: int, subscription_id: int, count: int):
+        """
+        QUOTA_LEDGER_ENABLED: chuyển `count` lượt đã reserve trong ledger sang DB ngay (UPDATE bằng session
+        của request, không đợi flusher / không lấy thêm connection), rồi bỏ khỏi pending của ledger
+        Giữa 2 bước lượt này bị tính 2 lần (chỉ từ chối sớm hơn, không vượt quota)
+        """
+        if count > 0 and quota_ledger.active:
+            self.subscription_repo.increment_usage(subscription_id, count)
+            quota_ledger.add(subscription_id, -count)
+            quota_ledger.invalidate(user_id)
+    
+    def invalidate_subscription(self, user_id: int):
+        """
+        Subscription / used_quota của user vừa đổi (mua / huỷ gói, hết hạn, thanh toán, job settle)
+        → bỏ snapshot trong subscription_cache và quota ledger, lần sau đọc lại từ DB
+        """
+        subscription_cache.invalidate(user_id)
+        quota_ledger.invalidate(user_id)
+    
+    def reserve_quota(self, user_id: int, count: int = 1) -> "QuotaReservation":
+        """
+        Giữ trước `count` lượt quota bằng 1 câu UPDATE có điều kiện (check + trừ nguyên tử)
+        - Trừ ngay trước khi predict: request đồng thời không thể vượt quota
+        - Phần không dùng (inference lỗi, ảnh lỗi, job bị huỷ) được trả lại bằng reservation.release()
+        - QUOTA_LEDGER_ENABLED: reserve trong RAM, ghi DB ở lần flush sau của ledger
+        """
+        if quota_ledger.active:
+            subscription_id, remaining, reason = quota_ledger.reserve(
+                user_id, count, lambda: self.get_active_subscription(user_id)
+            )
+            return QuotaReservation(self, subscription_id, count if subscription_id else 0, remaining, reason)
         
-        return {
-            "allowed": remaining > 0,
-            "remaining": max(remaining, 0),
-            "subscription_id": subscription.id,
-            **({"reason": "Quota exceeded"} if remaining <= 0 else {})
-        }
+        reserved = self._reserve_usage(user_id, count)
+        if reserved is None:
+            # Không có subscription / đã hết hạn / snapshot cũ / không đủ quota: check_quota xử lý
+            # hết hạn (tự chuyển về FREE), làm mới cache và lý do từ chối, sau đó thử lại 1 lần
+            quota_check = self.check_quota(user_id, count=count)
+            if not quota_check["allowed"]:
+                return QuotaReservation(self, None, 0, quota_check["remaining"], quota_check.get("reason"))
+            reserved = self._reserve_usage(user_id, count)
+            if reserved is None:
+                return QuotaReservation(self, None, 0, 0, "Quota exceeded")
+        subscription_id, remaining = reserved
+        return QuotaReservation(self, subscription_id, count, remaining)
+    
+    def _reserve_usage(self, user_id: int, count: int):
+        """UPDATE theo id của snapshot trong cache (không cần subquery tìm subscription hiện tại) nếu có"""
+        snapshot = subscription_cache.get(user_id)
+        if snapshot:
+            return self.subscription_repo.reserve_usage(
+                user_id, count, subscription_id=snapshot.subscription_id, status=snapshot.status
+            )
+        return self.subscription_repo.reserve_usage(user_id, count)
     
-    def increment_usage(self, subscription_id: int):
-        """Tăng số lần đã dùng API (dùng sau mỗi lần predict)"""
-        self.subscription_repo.increment_usage(subscription_id, 1)
+    def release_quota(self, subscription_id: int, count: int, commit: bool = True):
+        """
+        Trả lại quota đã reserve nhưng không dùng (ảnh lỗi, job bị huỷ / lỗi)
+        commit=False (cùng transaction với thay đổi khác) luôn ghi thẳng DB, không qua quota ledger:
+        phần reserve tương ứng phải đã ở DB (persist_reservation), nếu không refund bị kẹp ở 0
+        """
+        if count > 0:
+            if commit and quota_ledger.active:
+                quota_ledger.add(subscription_id, -count)
+            else:
+                self.subscription_repo.release_usage(subscription_id, count, commit=commit)
 
+
+class QuotaReservation:
+    """
+    Kết quả SubscriptionService.reserve_quota: quota đã được trừ trong DB
+    - commit(): giữ reservation (không còn release được)
+    - release(count): trả lại `count` lượt chưa dùng (mặc định toàn bộ)
+    """
+    
+    def __init__(self, service: SubscriptionService, subscription_id: Optional[int], count: int,
+                 remaining: int, reason: Optional[str] = None):
+        self.service = service
+        self.subscription_id = subscription_id
+        self.count = count
+        self.remaining = max(remaining, 0)
+        self.reason = reason
+    
+    @property
+    def allowed(self) -> bool:
+        return self.subscription_id is not None
+    
+    def commit(self):
+        self.count = 0
+    
+    def release(self, count: Optional[int] = None):
+        count = self.count if count is None else min(count, self.count)
+        if self.allowed and count > 0:
+            self.service.release_quota(self.subscription_id, count)
+            self.count -= count
+            self.remaining += count
@@ -0,0 +1,264 @@
+import io
+import mmap
+import tarfile
+import zipfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+# bytes / memoryview của spool upload / mmap của spool file trên disk
+ImageBuffer = Union[bytes, memoryview, mmap.mmap]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif")
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+TAR_CONTENT_TYPES = ("application/x-tar", "application/gzip", "application/x-gzip", "application/x-gtar")
+# Client không khai báo content type cụ thể → dựa vào magic bytes
+GENERIC_CONTENT_TYPES = ("", "application/octet-stream")
+# Đủ để nhận diện magic bytes của các format ảnh hỗ trợ
+SNIFF_BYTES = 16
+# Frame đã decode sẵn (edge box): raw RGB uint8 HWC hoặc .npy có header shape / dtype
+RAW_CONTENT_TYPES = {"application/x-raw-rgb": "raw", "application/x-npy": "npy"}
+RAW_EXTENSIONS = {".rgb": "raw", ".raw": "raw", ".npy": "npy"}
+NPY_MAGIC = b"\x93NUMPY"
+# tiled=true: cách gộp probabilities của các tile (image_tiling.merge_probabilities, module đó import torch)
+MERGE_METHODS = ("max", "noisy_or")
+
+
+def is_archive(filename: str, content_type: str = None) -> bool:
+    """File upload là archive zip/tar (chứa nhiều ảnh) hay không"""
+    name = (filename or "").lower()
+    return (
+        name.endswith((".zip", ".tar", ".tar.gz", ".tgz"))
+        or content_type in ZIP_CONTENT_TYPES
+        or content_type in TAR_CONTENT_TYPES
+    )
+
+
+def extract_images(filename: str, data: bytes, max_images: int) -> List[Tuple[str, bytes]]:
+    """
+    Giải nén các file ảnh trong archive zip/tar (bỏ qua thư mục và file không phải ảnh)
+    Raise ValueError nếu archive hỏng hoặc có nhiều hơn max_images ảnh
+    """
+    return list(iter_archive_images(filename, io.BytesIO(data), max_images))
+
+
+def iter_archive_images(filename: str, fileobj: BinaryIO, max_images: int) -> Iterator[Tuple[str, bytes]]:
+    """
+    Như extract_images nhưng đọc từ file object (spool / file trên disk) và trả về từng ảnh
+    → chỉ giữ 1 ảnh trong RAM (archive lớn của prediction job)
+    """
+    count = 0
+    try:
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    _check_limit(count, max_images)
+                    count += 1
+                    yield f"{filename}/{info.filename}", archive.read(info)
+        else:
+            fileobj.seek(0)
+            with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+                for member in archive:
+                    if not member.isfile() or not member.name.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    _check_limit(count, max_images)
+                    count += 1
+                    yield f"{filename}/{member.name}", archive.extractfile(member).read()
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError):
+        raise ValueError(f"Invalid archive: {filename}")
+
+
+def _check_limit(count: int, max_images: int):
+    if count >= max_images:
+        raise ValueError(f"Too many images in batch (max {max_images})")
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """Nhận diện format ảnh từ magic bytes đầu file (None nếu không phải ảnh hỗ trợ)"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "GIF"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    if header.startswith(b"BM"):
+        return "BMP"
+    return None
+
+
+def check_image_header(content_type: Optional[str], header: bytes):
+    """Từ chối sớm upload không phải ảnh (content type + magic bytes), raise ValueError"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if not content_type.startswith("image/") and content_type not in GENERIC_CONTENT_TYPES:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    if sniff_image_format(header) is None:
+        raise ValueError("Unsupported image format")
+
+
+def detect_raw_format(content_type: Optional[str], filename: Optional[str], header: bytes) -> Optional[str]:
+    """'raw' / 'npy' nếu upload là frame đã decode sẵn, None nếu là file ảnh thường"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in RAW_CONTENT_TYPES:
+        return RAW_CONTENT_TYPES[content_type]
+    if header.startswith(NPY_MAGIC):
+        return "npy"
+    if content_type in GENERIC_CONTENT_TYPES:
+        name = (filename or "").lower()
+        for extension, raw_format in RAW_EXTENSIONS.items():
+            if name.endswith(extension):
+                return raw_format
+    return None
+
+
+def parse_raw_frame(buffer: ImageBuffer, raw_format: str, size: int) -> np.ndarray:
+    """
+    View (không copy) uint8 (size, size, 3) trên buffer upload
+    - raw: đúng size * size * 3 byte RGB theo thứ tự HWC
+    - npy: header .npy phải là dtype uint8, shape (size, size, 3), C order
+    Raise ValueError nếu sai kích thước / dtype / shape
+    """
+    expected = (size, size, 3)
+    offset = 0
+    if raw_format == "npy":
+        with BufferReader(buffer) as reader:
+            try:
+                version = np.lib.format.read_magic(reader)
+                read_header = (
+                    np.lib.format.read_array_header_1_0 if version == (1, 0)
+                    else np.lib.format.read_array_header_2_0
+                )
+                shape, fortran_order, dtype = read_header(reader)
+            except Exception:
+                raise ValueError("Invalid .npy header")
+            offset = reader.tell()
+        if dtype != np.uint8 or fortran_order or tuple(shape) != expected:
+            raise ValueError(f"Expected uint8 array of shape {expected} in C order, got {dtype} {tuple(shape)}")
+    elif raw_format != "raw":
+        raise ValueError(f"Unsupported raw format: {raw_format}")
+
+    count = size * size * 3
+    if len(buffer) - offset != count:
+        raise ValueError(f"Expected {count} bytes of {size}x{size} RGB data, got {len(buffer) - offset}")
+    return np.frombuffer(buffer, dtype=np.uint8, count=count, offset=offset).reshape(expected)
+
+
+class BufferReader(io.RawIOBase):
+    """File-like read-only trên 1 buffer (bytes / memoryview / mmap) - đọc từng đoạn, không copy cả buffer"""
+
+    def __init__(self, buffer: ImageBuffer):
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        size = min(len(target), len(self._view) - self._position)
+        if size <= 0:
+            return 0
+        target[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        # Trả lại export của buffer gốc (BytesIO / mmap không close được khi còn view)
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+def probe_image(buffer: ImageBuffer, max_pixels: int) -> Tuple[str, int, int]:
+    """
+    Đọc header ảnh (không decode pixel) → (format, width, height)
+    Raise ValueError nếu không phải ảnh hợp lệ hoặc vượt max_pixels (decompression bomb)
+    """
+    try:
+        with BufferReader(buffer) as reader:
+            with Image.open(reader) as image:
+                image_format, (width, height) = image.format, image.size
+    except Exception:
+        raise ValueError("Invalid image format")
+    check_pixel_limit(width, height, max_pixels)
+    return image_format, width, height
+
+
+def check_pixel_limit(width: int, height: int, max_pixels: int):
+    if max_pixels and width * height > max_pixels:
+        raise ValueError(f"Image too large: {width}x{height} pixels (max {max_pixels})")
+
+
+def check_tiled_decode(image_format: str, width: int, height: int, max_pixels: int):
+    """
+    Tiled mode chỉ decode JPEG ở kích thước nhỏ (draft); PNG / WebP / ... được decode đầy đủ
+    trước khi thu nhỏ → giới hạn riêng số pixel cho ảnh không phải JPEG
+    """
+    if image_format != "JPEG" and max_pixels and width * height > max_pixels:
+        raise ValueError(
+            f"Image too large for tiled mode: {width}x{height} {image_format} pixels "
+            f"(max {max_pixels} for non-JPEG, use JPEG for larger images)"
+        )
+
+
+@contextmanager
+def spooled_buffer(spool: BinaryIO) -> Iterator[ImageBuffer]:
+    """
+    Buffer của file upload không copy dữ liệu:
+    - Spool còn trong RAM (SpooledTemporaryFile chưa roll) → memoryview của BytesIO bên trong
+    - Spool đã ghi ra disk → mmap read-only của file tạm
+    Buffer chỉ hợp lệ trong block `with` (được release trước khi UploadFile close)
+    """
+    if getattr(spool, "_rolled", True) is False and isinstance(getattr(spool, "_file", None), io.BytesIO):
+        view = spool._file.getbuffer()
+        try:
+            yield view
+        finally:
+            _release(view.release)
+        return
+
+    try:
+        spool.flush()
+        fileno = spool.fileno()
+        size = spool.seek(0, io.SEEK_END)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        # Không phải file thật → đọc toàn bộ
+        spool.seek(0)
+        yield spool.read()
+        return
+
+    if size == 0:
+        yield b""
+        return
+    mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    try:
+        yield mapped
+    finally:
+        _release(mapped.close)
+
+
+def _release(close):
+    try:
+        close()
+    except BufferError:
+        # Decoder vẫn đang đọc (request bị huỷ giữa chừng) → buffer được giải phóng khi decoder xong
+        pass
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.repositories.usage_log_repository import UsageLogRepository
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+
+class UsageLogWriter:
+    """
+    Ghi usage_logs nền theo lô thay vì add + commit + refresh mỗi request
+    - record() chỉ thêm 1 dict vào hàng đợi trong RAM (request không chờ DB)
+    - Flusher bulk insert mỗi USAGE_LOG_FLUSH_MS hoặc khi đủ USAGE_LOG_BATCH_SIZE row, và khi shutdown
+    - Hàng đợi giới hạn USAGE_LOG_MAX_QUEUE row; đầy thì bỏ row cũ nhất (drop_oldest) hoặc
+      row mới (drop_newest), có đếm số row bị bỏ
+    - Flusher chưa chạy (script, job worker riêng) → ghi thẳng DB như trước
+    """
+
+    def __init__(self, batch_size: int = 500, flush_ms: int = 1000, max_queue: int = 10000,
+                 overflow: str = "drop_oldest"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"USAGE_LOG_OVERFLOW must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._queue: deque = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._enqueued = 0
+        self._flushed = 0
+        self._dropped = 0
+        self._batches = 0
+        self._flush_errors = 0
+
+    @property
+    def active(self) -> bool:
+        return self._task is not None
+
+    def record(self, user_id: int, endpoint: str, method: str,
+               status_code: Optional[int] = None, response_time_ms: Optional[float] = None):
+        row = {
+            "user_id": user_id,
+            "endpoint": endpoint,
+            "method": method,
+            "status_code": status_code,
+            "response_time_ms": response_time_ms,
+            "created_at": datetime.utcnow(),  # thời điểm request, không phải lúc flush
+        }
+        if not self.active:
+            self._write([row])
+            return
+        with self._lock:
+            self._enqueued += 1
+            if len(self._queue) >= self.max_queue:
+                self._dropped += 1
+                if self.overflow == "drop_newest":
+                    return
+                self._queue.popleft()
+            self._queue.append(row)
+            full = len(self._queue) >= self.batch_size
+        if full:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # --- Flusher ---
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Dừng flusher và ghi nốt hàng đợi (lifespan shutdown)"""
+        if self._task:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+            self._loop = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("Usage log flush failed, retrying next cycle")
+
+    def flush(self) -> int:
+        """
+        Ghi toàn bộ hàng đợi theo lô USAGE_LOG_BATCH_SIZE row → số row đã ghi
+        Lỗi → lô đang ghi được đưa lại đầu hàng đợi (trong giới hạn max_queue) để thử lại lần sau
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    return written
+                try:
+                    self._write(batch)
+                except Exception:
+                    with self._lock:
+                        room = max(0, self.max_queue - len(self._queue))
+                        self._queue.extendleft(reversed(batch[:room]))
+                        self._dropped += len(batch) - min(room, len(batch))
+                        self._flush_errors += 1
+                    raise
+                written += len(batch)
+                with self._lock:
+                    self._flushed += len(batch)
+                    self._batches += 1
+
+    @staticmethod
+    def _write(rows: List[Dict]):
+        db = SessionLocal()
+        try:
+            UsageLogRepository(db).create_many(rows)
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "active": self.active,
+                "queued": len(self._queue),
+                "enqueued": self._enqueued,
+                "flushed": self._flushed,
+                "dropped": self._dropped,
+                "batches": self._batches,
+                "flush_errors": self._flush_errors,
+                "overflow": self.overflow,
+            }
+
+
+usage_log_writer = UsageLogWriter(
+    batch_size=settings.USAGE_LOG_BATCH_SIZE,
+    flush_ms=settings.USAGE_LOG_FLUSH_MS,
+    max_queue=settings.USAGE_LOG_MAX_QUEUE,
+    overflow=settings.USAGE_LOG_OVERFLOW,
+)
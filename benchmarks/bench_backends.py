@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+So sánh tốc độ các inference backend (eager / torchscript / onnxruntime) trên CPU
+ở batch size 1/8/32, để chọn MODEL_BACKEND cho từng loại node.
+
+Sử dụng:
+  python benchmarks/bench_backends.py
+  python benchmarks/bench_backends.py --model mobilenetv2_dangerous_objects.pth --threads 4
+  python benchmarks/bench_backends.py --random-weights --batch-sizes 1 8 32 --repeat 20
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import get_settings  # noqa: E402
+from app.services.ml_inference_service import MultilabelMobileNetV2, file_sha256  # noqa: E402
+from app.services.model_backends import BACKENDS, build_backend, max_probability_drift  # noqa: E402
+
+settings = get_settings()
+
+
+def load_model(args) -> tuple:
+    model = MultilabelMobileNetV2(num_classes=len(settings.MODEL_CLASSES), pretrained=False)
+    if args.random_weights:
+        return model.eval(), "random-" + str(time.time_ns())
+    model.load_state_dict(torch.load(args.model, map_location="cpu"))
+    return model.eval(), file_sha256(args.model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inference backends")
+    parser.add_argument("--model", default=settings.MODEL_PATH)
+    parser.add_argument("--random-weights", action="store_true", help="Không cần file .pth (chỉ đo tốc độ)")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0 = mặc định)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--artifact-dir", default=None, help="Mặc định: thư mục tạm")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    model, weights_hash = load_model(args)
+    device = torch.device("cpu")
+    artifact_dir = args.artifact_dir or tempfile.mkdtemp(prefix="model_artifacts_")
+    eager = build_backend("eager", model, device, weights_hash, artifact_dir, settings.MODEL_IMG_SIZE, 0)
+
+    print(f"torch {torch.__version__}, threads={torch.get_num_threads()}, artifacts={artifact_dir}")
+    print(f"{'backend':<12} {'batch':>5} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>9} {'drift':>9}")
+    for name in args.backends:
+        start = time.perf_counter()
+        backend = build_backend(name, model, device, weights_hash, artifact_dir,
+                                settings.MODEL_IMG_SIZE, float("inf"))
+        build_ms = (time.perf_counter() - start) * 1000
+        if backend.name != name:
+            print(f"{name:<12} unavailable (fell back to {backend.name})")
+            continue
+        drift = max_probability_drift(eager, backend, settings.MODEL_IMG_SIZE)
+
+        for batch_size in args.batch_sizes:
+            batch = torch.randn(batch_size, 3, settings.MODEL_IMG_SIZE, settings.MODEL_IMG_SIZE)
+            backend(batch)  # warm-up
+            timings = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                backend(batch)
+                timings.append((time.perf_counter() - t0) * 1000)
+            timings.sort()
+            p50 = statistics.median(timings)
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{name:<12} {batch_size:>5} {p50:>9.2f} {p95:>9.2f} "
+                  f"{batch_size / p50 * 1000:>9.1f} {drift:>9.1e}")
+        print(f"{'':<12} (build/load {build_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark decode + preprocess theo từng format (JPEG/PNG/WebP) và kiểm tra parity
+giữa ImagePreprocessor (JPEG draft) và transform gốc của notebook.
+
+Sử dụng:
+  python benchmarks/bench_decode.py
+  python benchmarks/bench_decode.py --sizes 640x480 4000x3000 --repeat 20 --tolerance 0.15
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.image_preprocessing import ImagePreprocessor, build_reference_transform  # noqa: E402
+
+FORMATS = {"JPEG": {"quality": 90}, "PNG": {}, "WEBP": {"quality": 90}}
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> Image.Image:
+    """Ảnh giả lập: gradient mượt + nhiễu nhẹ (gần ảnh camera hơn nhiễu thuần)"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None, None]
+    base = np.concatenate([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2)
+    noise = rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **FORMATS[fmt])
+    return buffer.getvalue()
+
+
+def time_ms(fn, data: bytes, repeat: int) -> float:
+    fn(data)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(data)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode benchmark + parity check")
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1920x1080", "4000x3000"])
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="Sai lệch trung bình tối đa (đơn vị sau normalize) so với transform gốc")
+    args = parser.parse_args()
+
+    fast = ImagePreprocessor(args.img_size)
+    reference = build_reference_transform(args.img_size)
+
+    def reference_path(data: bytes) -> torch.Tensor:
+        return reference(Image.open(io.BytesIO(data)).convert("RGB"))
+
+    failed = False
+    print(f"{'format':<6} {'size':>10} {'KB':>8} {'ref ms':>9} {'fast ms':>9} {'speedup':>8} {'max diff':>9} {'mean diff':>10}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split("x"))
+        image = synthetic_image(width, height)
+        for fmt in FORMATS:
+            data = encode(image, fmt)
+            ref_ms = time_ms(reference_path, data, args.repeat)
+            fast_ms = time_ms(fast, data, args.repeat)
+
+            diff = (fast(data) - reference_path(data)).abs()
+            mean_diff = diff.mean().item()
+            failed |= mean_diff > args.tolerance
+
+            print(f"{fmt:<6} {size:>10} {len(data) / 1024:>8.0f} {ref_ms:>9.2f} {fast_ms:>9.2f} "
+                  f"{ref_ms / fast_ms:>7.2f}x {diff.max().item():>9.3f} {mean_diff:>10.4f}")
+
+    if failed:
+        print(f"\n[ERROR] Parity vượt tolerance {args.tolerance}")
+        sys.exit(1)
+    print("\n[OK] Parity trong tolerance")
+
+
+if __name__ == "__main__":
+    main()
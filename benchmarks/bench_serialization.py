@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark serialize response của /api/v1/predict và /api/v1/predict/batch:
+FastAPI mặc định (jsonable_encoder + JSONResponse) so với orjson / msgpack, full / compact,
+precision / quantize. Báo µs / response và số byte.
+
+Sử dụng:
+  python benchmarks/bench_serialization.py
+  python benchmarks/bench_serialization.py --classes 20 --batch 100 --repeat 2000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.controllers.prediction_controller import ResponseOptions, _encode_batch, _encode_prediction  # noqa: E402
+from app.schemas.prediction import BatchPredictionItem, BatchPredictionResponse, PredictionResponse  # noqa: E402
+from app.services import response_encoding  # noqa: E402
+
+VARIANTS = [
+    # (tên, Accept, compact, precision, quantize)
+    ("json", "application/json", False, None, False),
+    ("json precision=3", "application/json", False, 3, False),
+    ("json compact", "application/json", True, None, False),
+    ("json compact precision=3", "application/json", True, 3, False),
+    ("json compact quantize", "application/json", True, None, True),
+    ("msgpack", "application/msgpack", False, None, False),
+    ("msgpack compact", "application/msgpack", True, None, False),
+    ("msgpack compact quantize", "application/msgpack", True, None, True),
+]
+
+
+def options(accept: str, compact: bool, precision, quantize: bool) -> ResponseOptions:
+    request = Request({"type": "http", "headers": [(b"accept", accept.encode())]})
+    return ResponseOptions(request, compact=compact, precision=precision, quantize=quantize)
+
+
+def fake_prediction(classes: List[str], rng: np.random.Generator) -> dict:
+    probabilities = rng.random(len(classes), dtype=np.float32).tolist()
+    return {
+        "classes": classes,
+        "probabilities": probabilities,
+        "active": [cls for cls, p in zip(classes, probabilities) if p >= 0.5],
+    }
+
+
+def measure(fn: Callable, repeat: int) -> float:
+    """µs / lần gọi (lấy min của 5 vòng để bớt nhiễu)"""
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization microbenchmark")
+    parser.add_argument("--classes", type=int, default=4, help="Số class của model")
+    parser.add_argument("--batch", type=int, default=100, help="Số ảnh trong response batch")
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    classes = [f"class_{i}" for i in range(args.classes)]
+    single = PredictionResponse(**fake_prediction(classes, rng), model_version="a7e6aed6370a", quota_remaining=42)
+    batch = BatchPredictionResponse(
+        classes=classes,
+        results=[
+            BatchPredictionItem(filename=f"{i}.jpg", **{k: v for k, v in fake_prediction(classes, rng).items() if k != "classes"})
+            for i in range(args.batch)
+        ],
+        succeeded=args.batch,
+        failed=0,
+        model_version="a7e6aed6370a",
+        quota_remaining=42,
+    )
+
+    print(f"orjson={'yes' if response_encoding.orjson else 'no'}, "
+          f"msgpack={'yes' if response_encoding.msgpack else 'no'}, classes={args.classes}, batch={args.batch}")
+    for name, response, encode in (
+        ("predict", single, _encode_prediction),
+        (f"predict/batch ({args.batch})", batch, _encode_batch),
+    ):
+        baseline = measure(lambda: JSONResponse(jsonable_encoder(response)), args.repeat)
+        baseline_bytes = len(JSONResponse(jsonable_encoder(response)).body)
+        print(f"\n{name}")
+        print(f"{'variant':<28} {'µs':>9} {'bytes':>8} {'speedup':>8} {'size':>7}")
+        print(f"{'fastapi default':<28} {baseline:>9.1f} {baseline_bytes:>8} {'1.00x':>8} {'100%':>7}")
+        for variant, accept, compact, precision, quantize in VARIANTS:
+            if "msgpack" in accept and response_encoding.msgpack is None:
+                continue
+            opts = options(accept, compact, precision, quantize)
+            if encode is _encode_prediction:
+                call = lambda: encode(response, opts, {})  # noqa: E731
+            else:
+                call = lambda: encode(response, opts)  # noqa: E731
+            micros = measure(call, args.repeat)
+            size = len(call().body)
+            print(f"{variant:<28} {micros:>9.1f} {size:>8} {baseline / micros:>7.2f}x {size / baseline_bytes:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Benchmark toàn bộ pipeline inference (offline, ảnh synthetic):
+decode → transform → forward (sweep batch size x số thread) → MLInferenceService.predict
+→ full HTTP POST /api/v1/predict (ASGI client in-process, SQLite tạm)
+
+Mỗi stage báo p50 / p95 / p99 (ms) và img/s. Kết quả ghi ra JSON để so 2 lần chạy:
+exit 1 nếu p50 của stage nào chậm hơn baseline quá --max-regression.
+
+Sử dụng:
+  python benchmarks/bench_suite.py --random-weights --output results.json
+  python benchmarks/bench_suite.py --baseline results.json --max-regression 0.10
+  python benchmarks/bench_suite.py --stages decode forward --batch-sizes 1 8 32 --threads 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# app.* đọc Settings lúc import → chỉ import sau prepare_environment()
+STAGES = ("decode", "transform", "forward", "predict", "http")
+
+
+def summarize(timings_ms: List[float], images_per_call: int = 1) -> Dict:
+    """p50 / p95 / p99 / mean (ms) và img/s từ danh sách thời gian mỗi lần gọi"""
+    timings = np.asarray(timings_ms)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        "n": len(timings_ms),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(timings.mean()),
+        "img_per_s": float(images_per_call * 1000 / timings.mean()),
+    }
+
+
+def measure(fn: Callable, repeat: int, warmup: int = 2) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def build_images(sizes: List[str], formats: List[str]) -> Dict[str, bytes]:
+    from bench_decode import encode, synthetic_image
+
+    images = {}
+    for size in sizes:
+        width, height = map(int, size.lower().split("x"))
+        image = synthetic_image(width, height)
+        for fmt in formats:
+            images[f"{fmt.lower()}-{size}"] = encode(image, fmt)
+    return images
+
+
+def prepare_environment(args, workdir: str):
+    """Env cho app.config (phải set trước khi import app.*): weights, SQLite tạm, tắt cache"""
+    if args.random_weights:
+        args.model = os.path.join(workdir, "random.pth")
+    if args.model:
+        os.environ["MODEL_PATH"] = args.model
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["PREDICTION_CACHE_ENABLED"] = "false"  # đo đường decode + forward thật
+    os.environ["PLAN_FREE_MONTHLY_QUOTA"] = str(10 ** 9)
+    os.environ["RATE_LIMIT_ENABLED"] = "false"  # đo throughput, không phải giới hạn của gói
+    os.environ["INFERENCE_MAX_QUEUE"] = str(max(64, args.http_concurrency * 2))
+
+    import torch
+    from app.config import get_settings
+    from app.services.ml_inference_service import MultilabelMobileNetV2
+
+    settings = get_settings()
+    if args.random_weights:
+        model = MultilabelMobileNetV2(num_classes=len(settings.MODEL_CLASSES), pretrained=False)
+        torch.save(model.state_dict(), args.model)
+    args.model = settings.MODEL_PATH
+
+
+def bench_decode_transform(args, images: Dict[str, bytes], results: Dict):
+    from app.services.image_preprocessing import ImagePreprocessor
+
+    preprocessor = ImagePreprocessor(args.img_size)
+    for name, data in images.items():
+        if "decode" in args.stages:
+            results[f"decode/{name}"] = summarize(measure(lambda: preprocessor.decode(data), args.repeat))
+    if "transform" in args.stages:
+        decoded = preprocessor.decode(next(iter(images.values())))
+        results["transform"] = summarize(measure(lambda: preprocessor.to_tensor(decoded), args.repeat))
+
+
+def bench_forward(args, ml_service, results: Dict):
+    import torch
+
+    default_threads = torch.get_num_threads()
+    for threads in args.threads or [default_threads]:
+        torch.set_num_threads(threads)
+        for batch_size in args.batch_sizes:
+            batch = torch.randn(batch_size, 3, args.img_size, args.img_size)
+            timings = measure(lambda: ml_service.forward(batch), args.repeat)
+            results[f"forward/batch{batch_size}/threads{threads}"] = summarize(timings, batch_size)
+    torch.set_num_threads(default_threads)
+
+
+def bench_predict(args, ml_service, images: Dict[str, bytes], results: Dict):
+    for name, data in images.items():
+        results[f"predict/{name}"] = summarize(measure(lambda: ml_service.predict(data), args.repeat))
+
+
+async def bench_http(args, images: Dict[str, bytes], results: Dict):
+    """POST /api/v1/predict qua ASGI transport (không mở socket), lifespan chạy như server thật"""
+    import httpx
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        from app.services.inference_runtime import runtime
+        await runtime.wait_ready()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/api/auth/register", json={"email": "bench@example.com", "password": "bench1234"})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            semaphore = asyncio.Semaphore(args.http_concurrency)
+
+            async def post(name: str, data: bytes) -> float:
+                content_type = f"image/{name.split('-')[0]}"
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/api/v1/predict", headers=headers, files={"file": (name, data, content_type)}
+                    )
+                    response.raise_for_status()
+                    return (time.perf_counter() - start) * 1000
+
+            for name, data in images.items():
+                await asyncio.gather(*[post(name, data) for _ in range(2)])  # warm-up
+                start = time.perf_counter()
+                timings = await asyncio.gather(*[post(name, data) for _ in range(args.repeat)])
+                wall = time.perf_counter() - start
+                summary = summarize(timings)
+                # Có request đồng thời → throughput theo wall time chứ không phải 1 / mean latency
+                summary["img_per_s"] = args.repeat / wall
+                results[f"http/c{args.http_concurrency}/{name}"] = summary
+
+
+def compare(results: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """So p50 từng stage với baseline, trả về danh sách stage chậm hơn quá ngưỡng"""
+    regressions = []
+    print(f"\n{'stage':<40} {'base p50':>10} {'p50':>10} {'delta':>8}")
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        delta = current["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        flag = ""
+        if delta > max_regression:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<40} {base['p50_ms']:>10.2f} {current['p50_ms']:>10.2f} {delta:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference benchmark suite")
+    parser.add_argument("--model", default=None, help="File weights (mặc định MODEL_PATH)")
+    parser.add_argument("--random-weights", action="store_true", help="Không cần file .pth (chỉ đo tốc độ)")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1920x1080"])
+    parser.add_argument("--formats", nargs="+", default=["JPEG", "PNG"], choices=["JPEG", "PNG", "WEBP"])
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--threads", nargs="+", type=int, default=[], help="Sweep torch threads (mặc định: 1 giá trị)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--http-concurrency", type=int, default=4)
+    parser.add_argument("--output", default=None, help="Ghi kết quả JSON")
+    parser.add_argument("--baseline", default=None, help="JSON của lần chạy trước để so sánh")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="p50 chậm hơn baseline tối đa (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    prepare_environment(args, tempfile.mkdtemp(prefix="bench_suite_"))
+
+    import torch
+    images = build_images(args.sizes, args.formats)
+    results: Dict[str, Dict] = {}
+
+    bench_decode_transform(args, images, results)
+    if "forward" in args.stages or "predict" in args.stages:
+        from app.services.ml_inference_service import MLInferenceService
+        ml_service = MLInferenceService(args.model)
+        if "forward" in args.stages:
+            bench_forward(args, ml_service, results)
+        if "predict" in args.stages:
+            bench_predict(args, ml_service, images, results)
+    if "http" in args.stages:
+        asyncio.run(bench_http(args, images, results))
+
+    print(f"torch {torch.__version__}, threads={torch.get_num_threads()}, cpus={os.cpu_count()}")
+    print(f"{'stage':<40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'img/s':>9}")
+    for key, summary in results.items():
+        print(f"{key:<40} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} "
+              f"{summary['p99_ms']:>9.2f} {summary['img_per_s']:>9.1f}")
+
+    if args.output:
+        report = {
+            "meta": {
+                "created_at": datetime.utcnow().isoformat(),
+                "torch": torch.__version__,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "args": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) regressed more than {args.max_regression:.0%}")
+            sys.exit(1)
+        print("\nNo regression")
+
+
+if __name__ == "__main__":
+    main()
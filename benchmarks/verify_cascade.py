@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Đánh giá cascade inference (CASCADE_ENABLED) trên tập ảnh mẫu: với từng kích thước pass rẻ và
+từng margin → escalation rate, độ khớp `active` classes end-to-end với model đầy đủ,
+thời gian forward / ảnh ước lượng và speedup. Exit code 1 nếu agreement ở CASCADE_MARGIN
+thấp hơn --min-agreement → chạy trước khi bật cascade trên production.
+
+Sử dụng:
+  python benchmarks/verify_cascade.py --samples data/calibration
+  python benchmarks/verify_cascade.py --samples data/calibration --sizes 96 128 160 --margins 0.1 0.2 0.3 0.4
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import get_settings  # noqa: E402
+from app.services.cascade_inference import CascadeStage, compare_cascade  # noqa: E402
+from app.services.image_preprocessing import ImagePreprocessor  # noqa: E402
+from app.services.ml_inference_service import MultilabelMobileNetV2  # noqa: E402
+from app.services.model_backends import EagerBackend  # noqa: E402
+from app.services.model_precision import load_samples  # noqa: E402
+
+settings = get_settings()
+
+
+def timed_probabilities(forward, samples: torch.Tensor, batch_size: int):
+    """(probabilities của từng ảnh, ms forward / ảnh)"""
+    forward(samples[:batch_size])  # warm-up
+    probabilities = []
+    start = time.perf_counter()
+    for batch in samples.split(batch_size):
+        probabilities.extend(forward(batch))
+    return probabilities, (time.perf_counter() - start) / samples.shape[0] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate cascade inference against the full model")
+    parser.add_argument("--samples", default=settings.MODEL_CALIBRATION_DIR, required=not settings.MODEL_CALIBRATION_DIR)
+    parser.add_argument("--model", default=settings.MODEL_PATH)
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[settings.CASCADE_IMG_SIZE])
+    parser.add_argument("--margins", nargs="+", type=float, default=[0.1, 0.2, 0.3, 0.4])
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--limit", type=int, default=512, help="Số ảnh mẫu tối đa")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--min-agreement", type=float, default=0.99,
+                        help="Agreement tối thiểu ở CASCADE_MARGIN (mặc định 0.99)")
+    args = parser.parse_args()
+
+    model = MultilabelMobileNetV2(num_classes=len(settings.MODEL_CLASSES), pretrained=False)
+    if not args.random_weights:
+        model.load_state_dict(torch.load(args.model, map_location="cpu"))
+    model.eval()
+    backend = EagerBackend(model, torch.device("cpu"))
+
+    _, samples = load_samples(args.samples, ImagePreprocessor(settings.MODEL_IMG_SIZE), limit=args.limit)
+    full, full_ms = timed_probabilities(
+        lambda batch: torch.sigmoid(backend(batch).float()).tolist(), samples, args.batch_size
+    )
+    print(f"samples={samples.shape[0]} threshold={args.threshold} full model {settings.MODEL_IMG_SIZE}px: "
+          f"{full_ms:.2f} ms/img")
+
+    failed = False
+    for size in args.sizes:
+        stage = CascadeStage(backend, size, margin=0.0)
+        cheap, cheap_ms = timed_probabilities(stage.forward, samples, args.batch_size)
+        print(f"\ncascade {size}px: {cheap_ms:.2f} ms/img")
+        print(f"  {'margin':>7} {'escalated':>10} {'agreement':>10} {'max drift':>10} {'ms/img':>8} {'speedup':>8}")
+        for margin in sorted(set(args.margins) | {settings.CASCADE_MARGIN}):
+            report = compare_cascade(full, cheap, margin, args.threshold)
+            expected_ms = cheap_ms + report["escalation_rate"] * full_ms
+            flag = ""
+            if margin == settings.CASCADE_MARGIN and size == settings.CASCADE_IMG_SIZE:
+                flag = "  <- config"
+                failed |= report["agreement"] < args.min_agreement
+            print(f"  {margin:>7.3f} {report['escalation_rate']:>10.1%} {report['agreement']:>10.2%} "
+                  f"{report['max_drift_accepted']:>10.4f} {expected_ms:>8.2f} {full_ms / expected_ms:>7.2f}x{flag}")
+
+    if failed:
+        print(f"\n[ERROR] Agreement ở CASCADE_MARGIN={settings.CASCADE_MARGIN} thấp hơn {args.min_agreement:.2%}")
+        sys.exit(1)
+    print("\n[OK]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Kiểm tra precision mode (int8_dynamic / int8_static / bf16 / channels_last) so với fp32
+trên tập ảnh mẫu có nhãn: drift probability, số ảnh bị đổi `active` classes, accuracy, tốc độ.
+Exit code 1 nếu vượt budget → dùng trước khi bật MODEL_PRECISION trên production.
+
+Sử dụng:
+  python benchmarks/verify_precision.py --mode int8_static --samples data/calibration
+  python benchmarks/verify_precision.py --mode fp32 --channels-last --samples data/calibration --labels data/calibration/labels.csv
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import get_settings  # noqa: E402
+from app.services.image_preprocessing import ImagePreprocessor  # noqa: E402
+from app.services.ml_inference_service import MultilabelMobileNetV2  # noqa: E402
+from app.services.model_precision import (  # noqa: E402
+    PRECISIONS, apply_precision, compare_precision, load_labels, load_samples
+)
+
+settings = get_settings()
+
+
+def time_per_image_ms(model, samples: torch.Tensor, batch_size: int) -> float:
+    with torch.no_grad():
+        model(samples[:batch_size])  # warm-up
+        start = time.perf_counter()
+        for batch in samples.split(batch_size):
+            model(batch)
+    return (time.perf_counter() - start) / samples.shape[0] * 1000
+
+
+def accuracy(probabilities: torch.Tensor, names, labels, class_names, threshold: float) -> float:
+    """Tỉ lệ ảnh có tập `active` classes khớp hoàn toàn với nhãn"""
+    correct = total = 0
+    for name, row in zip(names, probabilities):
+        if name not in labels:
+            continue
+        predicted = {c for c, p in zip(class_names, row.tolist()) if p >= threshold}
+        correct += predicted == set(labels[name])
+        total += 1
+    return correct / total if total else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify precision mode against fp32")
+    parser.add_argument("--mode", default=settings.MODEL_PRECISION, choices=PRECISIONS)
+    parser.add_argument("--channels-last", action="store_true", default=settings.MODEL_CHANNELS_LAST)
+    parser.add_argument("--samples", default=settings.MODEL_CALIBRATION_DIR, required=not settings.MODEL_CALIBRATION_DIR)
+    parser.add_argument("--labels", default=None, help="CSV `filename,class1;class2` (mặc định: <samples>/labels.csv nếu có)")
+    parser.add_argument("--model", default=settings.MODEL_PATH)
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--drift-budget", type=float, default=settings.MODEL_DRIFT_BUDGET)
+    parser.add_argument("--max-flip-rate", type=float, default=settings.MODEL_MAX_FLIP_RATE)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    class_names = settings.MODEL_CLASSES
+    model = MultilabelMobileNetV2(num_classes=len(class_names), pretrained=False)
+    if not args.random_weights:
+        model.load_state_dict(torch.load(args.model, map_location="cpu"))
+    model.eval()
+
+    names, samples = load_samples(args.samples, ImagePreprocessor(settings.MODEL_IMG_SIZE))
+    candidate = apply_precision(model, args.mode, args.channels_last, calibration=samples,
+                                batch_size=args.batch_size)
+    report = compare_precision(model, candidate, samples, class_names, args.threshold, args.batch_size)
+    flip_rate = report["flipped_images"] / report["samples"]
+
+    print(f"mode={args.mode} channels_last={args.channels_last} samples={report['samples']}")
+    print(f"  max drift      : {report['max_drift']:.5f} (budget {args.drift_budget})")
+    print(f"  mean drift     : {report['mean_drift']:.5f}")
+    print(f"  flipped images : {report['flipped_images']} ({flip_rate:.2%}, budget {args.max_flip_rate:.2%})")
+    print(f"  flips by class : {report['flips_per_class']}")
+    print(f"  {'fp32 ms/img':<15}: {time_per_image_ms(model, samples, args.batch_size):.2f}")
+    print(f"  {args.mode + ' ms/img':<15}: {time_per_image_ms(candidate, samples, args.batch_size):.2f}")
+
+    labels_path = args.labels or Path(args.samples) / "labels.csv"
+    if Path(labels_path).exists():
+        labels = load_labels(str(labels_path))
+        print(f"  {'fp32 accuracy':<15}: {accuracy(report['reference_probabilities'], names, labels, class_names, args.threshold):.2%}")
+        print(f"  {args.mode + ' accuracy':<15}: {accuracy(report['candidate_probabilities'], names, labels, class_names, args.threshold):.2%}")
+
+    if report["max_drift"] > args.drift_budget or flip_rate > args.max_flip_rate:
+        print("\n[ERROR] Vượt budget - không nên bật mode này")
+        sys.exit(1)
+    print("\n[OK] Trong budget")
+
+
+if __name__ == "__main__":
+    main()
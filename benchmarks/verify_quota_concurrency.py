@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Kiểm tra reserve quota đồng thời không vượt quota: nhiều thread cùng reserve trên 1 subscription
+(DB tạm, mặc định SQLite) → số lượt được cấp, used_quota cuối cùng và số lần vượt quota.
+Một phần reservation được release (mô phỏng inference lỗi) để kiểm tra luôn phần refund.
+Exit code 1 nếu used_quota vượt monthly_quota hoặc lệch với số lượt giữ lại.
+
+--legacy chạy luồng cũ (check_quota rồi increment_usage) để so sánh: thường vượt quota.
+--ledger bật quota ledger (reserve trong RAM, flusher ghi DB) và thêm job bị huỷ ngay khi còn chờ
+(settle trả quota thẳng vào DB): refund không được bị kẹp ở 0 trước khi phần reserve được flush.
+
+Sử dụng:
+  python benchmarks/verify_quota_concurrency.py
+  python benchmarks/verify_quota_concurrency.py --quota 500 --threads 32 --requests 100 --count 3
+  python benchmarks/verify_quota_concurrency.py --database-url postgresql://... --legacy
+  python benchmarks/verify_quota_concurrency.py --ledger --quota 1000 --count 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# app.* đọc Settings lúc import → chỉ import sau khi set DATABASE_URL
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent quota reservation must never overshoot")
+    parser.add_argument("--database-url", default=None, help="Mặc định: SQLite tạm")
+    parser.add_argument("--quota", type=int, default=200, help="monthly_quota của subscription")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="Số lần reserve mỗi thread")
+    parser.add_argument("--count", type=int, default=1, help="Số lượt mỗi lần reserve (batch)")
+    parser.add_argument("--release-rate", type=float, default=0.1, help="Tỉ lệ reservation được trả lại")
+    parser.add_argument("--legacy", action="store_true", help="check_quota + increment_usage (luồng cũ)")
+    parser.add_argument("--ledger", action="store_true",
+                        help="QUOTA_LEDGER_ENABLED, phần release đi qua job submit + huỷ (settle)")
+    args = parser.parse_args()
+    if args.legacy and args.ledger:
+        parser.error("--legacy and --ledger are exclusive")
+
+    os.environ["DATABASE_URL"] = args.database_url or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='quota_'), 'quota.db')}"
+
+    from app.database import SessionLocal, engine, init_db
+    from app.models.prediction_job import JobStatus
+    from app.models.subscription import PlanType, Subscription
+    from app.repositories.subscription_repository import SubscriptionRepository
+    from app.repositories.user_repository import UserRepository
+    from app.services.prediction_job_service import JobQuotaExceeded, PredictionJobService
+    from app.services.quota_ledger import quota_ledger
+    from app.services.subscription_service import SubscriptionService
+
+    init_db()
+    db = SessionLocal()
+    user_id = UserRepository(db).create(email=f"quota-{time.time_ns()}@example.com").id
+    subscription_id = SubscriptionRepository(db).create(user_id, PlanType.FREE, args.quota).id
+    db.close()
+
+    loop = None
+    if args.ledger:
+        # Flusher cần event loop đang chạy (giống lifespan của process API)
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+
+        async def start_ledger():
+            quota_ledger.start()
+
+        asyncio.run_coroutine_threadsafe(start_ledger(), loop).result()
+
+    lock = threading.Lock()
+    totals = {"granted": 0, "released": 0, "denied": 0, "errors": 0}
+    start_barrier = threading.Barrier(args.threads)
+
+    def submit_and_cancel_job(session) -> bool:
+        """Job args.count ảnh bị huỷ khi còn chờ → settle trả lại toàn bộ quota trong transaction DB"""
+        job_service = PredictionJobService(session)
+        job_id = job_service.new_job_id()
+        items = [(f"{i}.jpg", os.path.join(job_id, f"{i}.jpg")) for i in range(args.count)]
+        try:
+            job = job_service.submit(job_id, user_id, items, 0.5)
+        except JobQuotaExceeded:
+            return False
+        if job_service.settle(job.id, JobStatus.CANCELLED) is None:
+            raise RuntimeError(f"job {job.id} was not settled")
+        with lock:
+            totals["released"] += args.count
+        return True
+
+    def reserve(session, service: SubscriptionService) -> bool:
+        if args.ledger and random.random() < args.release_rate:
+            return submit_and_cancel_job(session)
+        if args.legacy:
+            quota_check = service.check_quota(user_id, count=args.count)
+            if not quota_check["allowed"]:
+                return False
+            service.increment_usage(quota_check["subscription_id"], args.count)
+            return True
+        reservation = service.reserve_quota(user_id, args.count)
+        if not reservation.allowed:
+            return False
+        if random.random() < args.release_rate:
+            reservation.release()
+            with lock:
+                totals["released"] += args.count
+        else:
+            reservation.commit()
+        return True
+
+    def worker():
+        session = SessionLocal()
+        service = SubscriptionService(session)
+        start_barrier.wait()
+        for _ in range(args.requests):
+            try:
+                granted = reserve(session, service)
+            except Exception as e:  # vd SQLite "database is locked" khi quá nhiều writer
+                session.rollback()
+                with lock:
+                    totals["errors"] += 1
+                print(f"[WARN] {e.__class__.__name__}: {e}")
+                continue
+            with lock:
+                totals["granted" if granted else "denied"] += args.count if granted else 1
+        session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if loop is not None:
+        asyncio.run_coroutine_threadsafe(quota_ledger.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    db = SessionLocal()
+    used = db.get(Subscription, subscription_id).used_quota
+    db.close()
+    engine.dispose()
+
+    attempts = args.threads * args.requests
+    kept = totals["granted"] - totals["released"]
+    mode = "legacy" if args.legacy else "ledger" if args.ledger else "reserve"
+    print(f"mode={mode} db={engine.dialect.name} "
+          f"returning={engine.dialect.update_returning}")
+    print(f"attempts={attempts} x {args.count}  {attempts / elapsed:.0f} reserve/s")
+    print(f"quota={args.quota} granted={totals['granted']} released={totals['released']} "
+          f"denied={totals['denied']} errors={totals['errors']}")
+    print(f"used_quota={used} expected={kept} overshoot={max(0, used - args.quota)}")
+
+    if not totals["granted"]:
+        print("\n[ERROR] No reservation succeeded")
+        sys.exit(1)
+    if used > args.quota or used != kept:
+        print("\n[ERROR] Quota overshoot / lost update")
+        sys.exit(1)
+    print("\n[OK]")
+
+
+if __name__ == "__main__":
+    main()
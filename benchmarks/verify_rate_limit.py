@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Kiểm tra token bucket dùng chung giữa nhiều process (RATE_LIMIT_BACKEND=sqlite, giống nhiều
+uvicorn worker): N process cùng take liên tục trên 1 key trong --seconds giây → tổng số request
+được cho qua phải ≈ burst + rate * seconds. Exit code 1 nếu vượt quá --tolerance.
+
+Sử dụng:
+  python benchmarks/verify_rate_limit.py
+  python benchmarks/verify_rate_limit.py --processes 8 --rate 50 --burst 100 --seconds 5
+  python benchmarks/verify_rate_limit.py --backend memory --processes 1
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.rate_limiter import MemoryBucketStore, SQLiteBucketStore  # noqa: E402
+
+
+def worker(store, args, start: float, results):
+    while time.time() < start:
+        time.sleep(0.001)
+    allowed = calls = 0
+    while time.time() < start + args.seconds:
+        ok, _ = store.take("user:1", args.rate, args.burst, time.time())
+        allowed += ok
+        calls += 1
+    results.put((allowed, calls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared token bucket must not exceed burst + rate * seconds")
+    parser.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=5.0, help="Token / giây")
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Cho phép vượt tối đa (0.1 = 10%%)")
+    args = parser.parse_args()
+
+    if args.backend == "memory" and args.processes > 1:
+        parser.error("memory backend is per-process, use --processes 1")
+    store = MemoryBucketStore() if args.backend == "memory" else \
+        SQLiteBucketStore(os.path.join(tempfile.mkdtemp(prefix="rate_limit_"), "rate_limit.db"))
+
+    results = mp.Queue()
+    start = time.time() + 1.0
+    processes = [mp.Process(target=worker, args=(store, args, start, results)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    allowed = sum(a for a, _ in totals)
+    calls = sum(c for _, c in totals)
+    expected = args.burst + args.rate * args.seconds
+    print(f"backend={args.backend} processes={args.processes} rate={args.rate}/s burst={args.burst} "
+          f"seconds={args.seconds}")
+    print(f"take calls={calls} ({calls / args.seconds:.0f}/s)  allowed={allowed}  expected<={expected:.0f}")
+
+    if allowed > expected * (1 + args.tolerance):
+        print(f"\n[ERROR] Allowed {allowed / expected - 1:.0%} more requests than the bucket permits")
+        sys.exit(1)
+    print("\n[OK]")
+
+
+if __name__ == "__main__":
+    main()
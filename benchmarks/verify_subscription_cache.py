@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Kiểm tra subscription_cache không trả gói cũ (DB tạm, mặc định SQLite): cache được làm nóng rồi
+mua gói / nâng gói từ session khác (giống worker khác) / huỷ gói / mua lại từ session khác (row đang
+cache không đổi) / chờ gói hết hạn → ngay sau mỗi bước, get_active_subscription và reserve_quota phải
+dùng subscription mới, RateLimiter.plan_for thấy gói mới (riêng bước worker khác: rate limiter được
+phép trễ tối đa SUBSCRIPTION_CACHE_TTL_SECONDS). Cuối cùng đo thời gian
+lookup khi hit cache (vẫn 1 query theo id) so với query get_active_by_user, và reserve_quota dùng
+snapshot (UPDATE theo id) so với không có snapshot (UPDATE + subquery tìm subscription hiện tại).
+Exit code 1 nếu có bước nào còn thấy gói cũ.
+
+Sử dụng:
+  python benchmarks/verify_subscription_cache.py
+  python benchmarks/verify_subscription_cache.py --lookups 5000 --database-url postgresql://...
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# app.* đọc Settings lúc import → chỉ import sau khi set DATABASE_URL
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cached subscription lookups must never serve a stale plan")
+    parser.add_argument("--database-url", default=None, help="Mặc định: SQLite tạm")
+    parser.add_argument("--expire-after", type=float, default=2.0, help="Gói PRO hết hạn sau N giây")
+    parser.add_argument("--lookups", type=int, default=2000, help="Số lookup khi đo cached / uncached")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='subscription_cache_'), 'cache.db')}"
+
+    from app.config import get_settings
+    from app.database import SessionLocal, init_db
+    from app.models.subscription import PlanType, SubscriptionStatus
+    from app.repositories.subscription_repository import SubscriptionRepository
+    from app.repositories.user_repository import UserRepository
+    from app.services.rate_limiter import MemoryBucketStore, RateLimiter
+    from app.services.subscription_cache import subscription_cache
+    from app.services.subscription_service import SubscriptionService
+
+    settings = get_settings()
+    init_db()
+    db = SessionLocal()
+    user_id = UserRepository(db).create(email=f"cache-{time.time_ns()}@example.com").id
+    UserRepository(db).update_credits(user_id, settings.PLAN_PRO_PRICE * 2)
+    SubscriptionRepository(db).create(user_id, PlanType.FREE, settings.PLAN_FREE_MONTHLY_QUOTA)
+    service = SubscriptionService(db)
+    limiter = RateLimiter(MemoryBucketStore())
+    failures = []
+
+    def check(step: str, plan: PlanType, status: SubscriptionStatus = SubscriptionStatus.ACTIVE,
+              limiter_exact: bool = True):
+        db.expire_all()
+        limiter_plan = asyncio.run(limiter.plan_for(user_id))
+        subscription = service.get_active_subscription(user_id)
+        ok = subscription.plan == plan and subscription.status == status and \
+            (limiter_plan == plan or not limiter_exact)
+        lag = "" if limiter_exact or limiter_plan == plan else f" (≤ {settings.SUBSCRIPTION_CACHE_TTL_SECONDS:g}s lag)"
+        print(f"{'ok  ' if ok else 'FAIL'} {step:<32} service={subscription.plan.value}/{subscription.status.value} "
+              f"rate_limiter={limiter_plan.value}{lag}")
+        if not ok:
+            failures.append(step)
+
+    check("warm cache (FREE)", PlanType.FREE)
+    check("cached (FREE)", PlanType.FREE)
+
+    service.purchase_plan(user_id, "plus")
+    check("after purchase_plan('plus')", PlanType.PLUS)
+
+    def purchase_by_other_worker(plan: PlanType, quota: int, expires_at: datetime) -> int:
+        """Như purchase_plan ở worker khác: không invalidate được cache của process này"""
+        other = SessionLocal()
+        try:
+            other_repo = SubscriptionRepository(other)
+            current = other_repo.get_active_by_user(user_id)
+            other_repo.update_status(current.id, SubscriptionStatus.CANCELLED)
+            return other_repo.create(user_id, plan, quota, expires_at=expires_at).id
+        finally:
+            other.close()
+
+    def check_reserve(step: str, subscription_id: int):
+        reservation = service.reserve_quota(user_id, 1)
+        reservation.release()
+        ok = reservation.subscription_id == subscription_id
+        print(f"{'ok  ' if ok else 'FAIL'} {step:<32} reserve_quota subscription={reservation.subscription_id} "
+              f"expected={subscription_id}")
+        if not ok:
+            failures.append(step)
+
+    # Row PLUS đang cache chuyển sang CANCELLED → service thấy snapshot lệch và reload;
+    # rate limiter chỉ dùng snapshot → trễ tối đa TTL
+    pro_id = purchase_by_other_worker(PlanType.PRO, settings.PLAN_PRO_MONTHLY_QUOTA,
+                                      datetime.utcnow() + timedelta(days=30))
+    check("after upgrade by other worker", PlanType.PRO, limiter_exact=False)
+    check_reserve("reserve after upgrade", pro_id)
+
+    service.cancel_subscription(user_id)
+    check("after cancel_subscription", PlanType.PRO, SubscriptionStatus.CANCELLED)
+
+    # Row đang cache đã CANCELLED từ trước nên không đổi: chỉ phát hiện được nhờ subscription mới hơn
+    expires_at = datetime.utcnow() + timedelta(seconds=args.expire_after)
+    check_reserve("reserve before re-purchase", pro_id)
+    new_id = purchase_by_other_worker(PlanType.PRO, settings.PLAN_PRO_MONTHLY_QUOTA, expires_at)
+    check_reserve("reserve after re-purchase", new_id)
+    check("after re-purchase by other worker", PlanType.PRO, limiter_exact=False)
+
+    # Hết hạn: TTL của cache không quá expires_at → không cần invalidate, cả 2 đều thấy FREE
+    time.sleep(max(0.0, (expires_at - datetime.utcnow()).total_seconds()) + 0.05)
+    check("after expires_at passed", PlanType.FREE)
+
+    # Đo lookup: hit cache (vẫn đọc row theo id để có used_quota mới nhất) so với query get_active_by_user
+    service.get_active_subscription(user_id)
+    started = time.perf_counter()
+    for _ in range(args.lookups):
+        service.get_active_subscription(user_id)
+    cached = (time.perf_counter() - started) / args.lookups
+    repo = SubscriptionRepository(db)
+    started = time.perf_counter()
+    for _ in range(args.lookups):
+        repo.get_active_by_user(user_id)
+    uncached = (time.perf_counter() - started) / args.lookups
+
+    # Đo reserve_quota: snapshot trong cache (không cần tìm subscription hiện tại) so với cache trống
+    def time_reserve(invalidate: bool) -> float:
+        started = time.perf_counter()
+        for _ in range(args.lookups):
+            if invalidate:
+                subscription_cache.invalidate(user_id)
+            service.reserve_quota(user_id, 1).release()
+        return (time.perf_counter() - started) / args.lookups
+
+    service.get_active_subscription(user_id)
+    reserve_cached = time_reserve(False)
+    reserve_uncached = time_reserve(True)
+    db.close()
+
+    stats = subscription_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    print(f"\nlookup: cached={cached * 1e6:.0f}µs  get_active_by_user={uncached * 1e6:.0f}µs")
+    print(f"reserve_quota + release: cached={reserve_cached * 1e6:.0f}µs  no snapshot={reserve_uncached * 1e6:.0f}µs")
+    print(f"cache: {stats}  hit_rate={stats['hits'] / max(1, lookups):.1%}")
+
+    if failures:
+        print(f"\n[ERROR] Stale subscription served after: {', '.join(failures)}")
+        sys.exit(1)
+    print("\n[OK]")
+
+
+if __name__ == "__main__":
+    main()
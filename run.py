@@ -74,6 +74,88 @@ def check_environment():
     print()
 
 
+def read_cgroup_cpu_limit():
+    """Đọc CPU quota của container (cgroup v2 cpu.max hoặc cgroup v1 cfs_quota_us), None nếu không giới hạn"""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def detect_cpus():
+    """Số core thực sự dùng được = min(affinity của process, cgroup quota)"""
+    logical = os.cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):
+        allowed = sorted(os.sched_getaffinity(0))
+    else:
+        allowed = list(range(logical))
+    quota = read_cgroup_cpu_limit()
+    usable = len(allowed) if quota is None else max(1, min(len(allowed), int(quota)))
+    return {"logical": logical, "allowed": allowed, "cgroup_quota": quota, "usable": usable}
+
+
+def plan_workers(cpu_info, profile, workers=None, threads=None, interop_threads=None, affinity=False):
+    """
+    Chia core cho uvicorn workers và torch threads để tránh oversubscription
+    - latency: ít worker, mỗi worker 4 intra-op threads (forward từng batch nhanh hơn)
+    - throughput: nhiều worker, mỗi worker 2 threads (nhiều batch chạy song song)
+    Giá trị truyền qua flag luôn được ưu tiên hơn plan tự động
+    """
+    usable = cpu_info["usable"]
+    threads_per_worker = 4 if profile == "latency" else 2
+    if workers is None:
+        workers = max(1, usable // threads_per_worker)
+    if threads is None:
+        threads = max(1, usable // workers)
+    if interop_threads is None:
+        interop_threads = 1
+
+    cpu_sets = []
+    if affinity:
+        allowed = cpu_info["allowed"]
+        for worker in range(workers):
+            cpus = [allowed[(worker * threads + i) % len(allowed)] for i in range(threads)]
+            cpu_sets.append(",".join(str(cpu) for cpu in cpus))
+
+    return {
+        "profile": profile,
+        "workers": workers,
+        "threads": threads,
+        "interop_threads": interop_threads,
+        "cpu_sets": cpu_sets,
+        "oversubscribed": workers * threads > usable,
+    }
+
+
+def print_plan(cpu_info, plan):
+    quota = cpu_info["cgroup_quota"]
+    print(f"[PLAN] CPU: {cpu_info['logical']} logical, {len(cpu_info['allowed'])} allowed, "
+          f"cgroup quota {quota if quota is not None else 'none'} → dùng {cpu_info['usable']} core")
+    print(f"[PLAN] Profile {plan['profile']}: {plan['workers']} worker(s) x {plan['threads']} torch threads "
+          f"(interop {plan['interop_threads']})")
+    for worker, cpus in enumerate(plan["cpu_sets"]):
+        print(f"[PLAN]   worker slot {worker}: CPUs {cpus}")
+    if plan["oversubscribed"]:
+        print("[WARNING] workers x threads lớn hơn số core dùng được → các worker sẽ tranh CPU")
+
+
+def apply_plan(plan):
+    """Truyền plan sang worker processes qua biến môi trường (Settings đọc env)"""
+    for key in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "TORCH_NUM_THREADS"):
+        os.environ[key] = str(plan["threads"])
+    os.environ["TORCH_INTEROP_THREADS"] = str(plan["interop_threads"])
+    os.environ["INFERENCE_CPU_AFFINITY"] = ";".join(plan["cpu_sets"])
+    os.environ["INFERENCE_PLAN_ID"] = str(os.getpid())
+    os.environ["API_WORKERS"] = str(plan["workers"])
+
+
 def init_database():
     """Khởi tạo database nếu chưa có"""
     from app.database import init_db
@@ -98,6 +180,8 @@ Ví dụ:
   python run.py --reload           # Chạy với auto-reload (dev mode)
   python run.py --host 0.0.0.0     # Cho phép truy cập từ bên ngoài
   python run.py --workers 4        # Chạy với 4 workers (production)
+  python run.py --profile throughput --cpu-affinity   # Tự plan workers/threads theo số core
+  python run.py --job-worker       # Process riêng xử lý prediction jobs
         """
     )
     
@@ -124,8 +208,36 @@ Ví dụ:
     parser.add_argument(
         "--workers",
         type=int,
-        default=1,
-        help="Số lượng worker processes (production mode)"
+        default=None,
+        help="Số lượng worker processes (mặc định: 1, hoặc tự plan theo số core khi có --profile)"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        choices=["latency", "throughput"],
+        help="Tự plan số worker theo số core cho mục tiêu này (không có: 1 worker, threads theo latency)"
+    )
+    
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Số torch intra-op threads mỗi worker (mặc định: core / workers)"
+    )
+    
+    parser.add_argument(
+        "--interop-threads",
+        type=int,
+        default=None,
+        help="Số torch inter-op threads mỗi worker (mặc định: 1)"
+    )
+    
+    parser.add_argument(
+        "--cpu-affinity",
+        action="store_true",
+        help="Pin mỗi worker vào 1 nhóm CPU riêng (Linux)"
     )
     
     parser.add_argument(
@@ -148,6 +260,12 @@ Ví dụ:
         help="Chỉ khởi tạo database rồi thoát"
     )
     
+    parser.add_argument(
+        "--job-worker",
+        action="store_true",
+        help="Chạy worker xử lý prediction jobs (không chạy HTTP server, đặt JOB_WORKER_ENABLED=false cho API)"
+    )
+    
     args = parser.parse_args()
     
     # Kiểm tra môi trường
@@ -160,6 +278,33 @@ Ví dụ:
         print("\n[OK] Xong! Database đã được khởi tạo.")
         return
     
+    # Worker riêng cho prediction jobs
+    if args.job_worker:
+        import asyncio
+        import logging
+        from app.services.job_worker import run_standalone
+        logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s:     %(name)s - %(message)s")
+        print("[START] Chạy prediction job worker (Ctrl+C để dừng)")
+        asyncio.run(run_standalone())
+        return
+    
+    # Plan workers / torch threads theo CPU
+    cpu_info = detect_cpus()
+    # Mặc định 1 worker: mỗi worker có bản sao model, quota ledger, subscription cache, model registry
+    # riêng → nhiều worker chỉ khi yêu cầu rõ (--workers / --profile)
+    workers = args.workers
+    if args.reload or (workers is None and args.profile is None):
+        workers = 1
+    plan = plan_workers(
+        cpu_info, args.profile or "latency",
+        workers=workers,
+        threads=args.threads,
+        interop_threads=args.interop_threads,
+        affinity=args.cpu_affinity
+    )
+    print_plan(cpu_info, plan)
+    apply_plan(plan)
+    
     # Cấu hình uvicorn
     config = {
         "app": "app.main:app",
@@ -178,12 +323,12 @@ Ví dụ:
         config["reload_dirs"] = ["app"]
     
     # Production mode (multiple workers, no reload)
-    elif args.workers > 1:
-        print(f"[START] Chạy ở chế độ PRODUCTION ({args.workers} workers)")
+    elif plan["workers"] > 1:
+        print(f"[START] Chạy ở chế độ PRODUCTION ({plan['workers']} workers)")
         print(f"[SERVER] Server: http://{args.host}:{args.port}")
         print(f"[DOCS] Docs: http://{args.host}:{args.port}/docs")
         print("\n[TIP] Nhấn Ctrl+C để dừng server\n")
-        config["workers"] = args.workers
+        config["workers"] = plan["workers"]
     
     # Single worker mode
     else: